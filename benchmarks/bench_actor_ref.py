@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares a two stage ProcessActor pipeline where the parent relays every
+intermediate result against one where the first stage tells the second stage
+directly through an ActorRef.
+
+CommandLine:
+    python benchmarks/bench_actor_ref.py
+    python benchmarks/bench_actor_ref.py --num 20000 --size 10000
+"""
+from __future__ import print_function
+import argparse
+import time
+import futures_actors
+
+
+class FirstStage(futures_actors.ProcessActor):
+    def handle(self, message):
+        next_stage, payload = message
+        if next_stage is None:
+            return payload
+        next_stage.tell(payload)
+
+
+class LastStage(futures_actors.ProcessActor):
+    def __init__(self):
+        self.count = 0
+
+    def handle(self, message):
+        if message == 'count':
+            return self.count
+        self.count += 1
+
+
+def bench_relay(num, payload):
+    first, last = FirstStage.executor(), LastStage.executor()
+    try:
+        start = time.time()
+        fs = [first.post((None, payload)) for _ in range(num)]
+        fs = [last.post(f.result()) for f in fs]
+        for f in fs:
+            f.result()
+        duration = time.time() - start
+    finally:
+        first.shutdown(wait=True)
+        last.shutdown(wait=True)
+    return num / duration
+
+
+def bench_ref(num, payload):
+    first, last = FirstStage.executor(), LastStage.executor()
+    try:
+        ref = last.ref()
+        start = time.time()
+        fs = [first.post((ref, payload)) for _ in range(num)]
+        for f in fs:
+            f.result()
+        # Told messages are handled in order, so this waits for all of them
+        while last.post('count').result() < num:
+            pass
+        duration = time.time() - start
+    finally:
+        first.shutdown(wait=True)
+        last.shutdown(wait=True)
+    return num / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=5000)
+    parser.add_argument('--size', type=int, default=1000,
+                        help='payload size in bytes')
+    args = parser.parse_args()
+    payload = b'x' * args.size
+    print('{:>12} {:>14}'.format('pipeline', 'messages/sec'))
+    print('{:>12} {:>14.1f}'.format('relay', bench_relay(args.num, payload)))
+    print('{:>12} {:>14.1f}'.format('actor ref', bench_ref(args.num, payload)))
+
+
+if __name__ == '__main__':
+    main()
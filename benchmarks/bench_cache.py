@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the result cache (`_cache_key`) on a lookup workload: several
+threads post lookups of keys drawn from a small set of hot keys, to an actor
+that takes `--cost` seconds per lookup. Reports the lookups/sec and the
+share of the lookups that reached the actor, with and without the cache.
+
+CommandLine:
+    python benchmarks/bench_cache.py
+    python benchmarks/bench_cache.py --keys 1000 --ttl 0.05 --actor thread
+"""
+from __future__ import print_function
+import argparse
+import random
+import threading
+import time
+import futures_actors
+
+
+class LookupMixin(object):
+    def __init__(self, cost):
+        self.cost = cost
+
+    def handle(self, key):
+        time.sleep(self.cost)
+        return key * 2
+
+
+class LookupProcessActor(LookupMixin, futures_actors.ProcessActor):
+    pass
+
+
+class LookupThreadActor(LookupMixin, futures_actors.ThreadActor):
+    pass
+
+
+ACTOR_CLASSES = {'thread': LookupThreadActor, 'process': LookupProcessActor}
+
+
+def _identity(key):
+    return key
+
+
+def bench_cache(ActorClass, args, cached):
+    """
+    Returns:
+        tuple: lookups/sec, and the fraction handled by the actor
+    """
+    options = {}
+    if ActorClass is LookupProcessActor:
+        options['_pipeline_depth'] = 8
+    if cached:
+        options.update(_cache_key=_identity, _cache_size=args.size,
+                       _cache_ttl=args.ttl)
+    executor = ActorClass.executor(args.cost, **options)
+    per_thread = args.num // args.threads
+    try:
+        executor.post(-1).result()
+
+        def producer(seed):
+            rng = random.Random(seed)
+            fs = [executor.post(rng.randrange(args.keys))
+                  for _ in range(per_thread)]
+            for f in fs:
+                f.result()
+        threads = [threading.Thread(target=producer, args=(i,))
+                   for i in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duration = time.perf_counter() - start
+        stats = executor.stats()
+    finally:
+        executor.shutdown(wait=True)
+    total = per_thread * args.threads
+    handled = stats.get('cache_misses', total)
+    return total / duration, handled / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--actor', nargs='+', default=['thread', 'process'],
+                        choices=['thread', 'process'])
+    parser.add_argument('--num', type=int, default=4000,
+                        help='lookups per measurement')
+    parser.add_argument('--keys', type=int, default=100,
+                        help='number of distinct keys')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='number of posting threads')
+    parser.add_argument('--cost', type=float, default=0.0002,
+                        help='seconds the actor takes per lookup')
+    parser.add_argument('--size', type=int, default=1024,
+                        help='cached results')
+    parser.add_argument('--ttl', type=float, default=None,
+                        help='seconds results are cached for')
+    args = parser.parse_args()
+    print('{:>8} {:>8} {:>14} {:>10}'.format('actor', 'cache', 'lookups/s',
+                                             'handled'))
+    for kind in args.actor:
+        for cached in [False, True]:
+            rate, handled = bench_cache(ACTOR_CLASSES[kind], args, cached)
+            print('{:>8} {:>8} {:>14.0f} {:>9.1f}%'.format(
+                kind, 'on' if cached else 'off', rate, 100 * handled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how long an actor stays busy with a message that was cancelled
+while it handled it: the time between `cancel()` and the result of the next
+message. The handler works for `--work` seconds in steps of `--step`
+seconds. Without `_cancellable` it runs to the end, a cooperative handler
+returns at its next check of `self.cancelled()`, and with `_cancel_timeout`
+a handler that never checks gets its process restarted.
+
+CommandLine:
+    python benchmarks/bench_cancel.py
+    python benchmarks/bench_cancel.py --work 5 --step 0.05 --timeout 0.2
+"""
+from __future__ import print_function
+import argparse
+import time
+import futures_actors
+
+
+class WorkerMixin(object):
+    def handle(self, message):
+        work, step, cooperative = message
+        deadline = time.time() + work
+        while time.time() < deadline:
+            if cooperative and self.cancelled():
+                return None
+            time.sleep(step)
+        return None
+
+
+class WorkerProcessActor(WorkerMixin, futures_actors.ProcessActor):
+    pass
+
+
+class WorkerThreadActor(WorkerMixin, futures_actors.ThreadActor):
+    pass
+
+
+ACTOR_CLASSES = {'thread': WorkerThreadActor, 'process': WorkerProcessActor}
+
+
+def bench_cancel(ActorClass, args, options, cooperative):
+    """
+    Returns:
+        float: seconds between the cancellation and the next result
+    """
+    executor = ActorClass.executor(**options)
+    try:
+        executor.post((0, 0, False)).result()
+        f = executor.post((args.work, args.step, cooperative))
+        while not f.running():
+            time.sleep(0.001)
+        start = time.perf_counter()
+        f.cancel()
+        executor.post((0, 0, False)).result()
+        return time.perf_counter() - start
+    finally:
+        executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--actor', nargs='+', default=['thread', 'process'],
+                        choices=['thread', 'process'])
+    parser.add_argument('--work', type=float, default=1.0,
+                        help='seconds the handler works for')
+    parser.add_argument('--step', type=float, default=0.01,
+                        help='seconds between two checks of cancelled()')
+    parser.add_argument('--timeout', type=float, default=0.1,
+                        help='_cancel_timeout of the process actor')
+    args = parser.parse_args()
+    modes = [('default', {}, False),
+             ('cooperative', {'_cancellable': True}, True),
+             ('hard timeout', {'_cancel_timeout': args.timeout}, False)]
+    print('{:>8} {:>14} {:>12}'.format('actor', 'cancellation', 'busy (ms)'))
+    for kind in args.actor:
+        for name, options, cooperative in modes:
+            if kind == 'thread' and '_cancel_timeout' in options:
+                continue
+            busy = bench_cancel(ACTOR_CLASSES[kind], args, options,
+                                cooperative)
+            print('{:>8} {:>14} {:>12.1f}'.format(kind, name, 1000 * busy))
+
+
+if __name__ == '__main__':
+    main()
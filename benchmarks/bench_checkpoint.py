@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the time to write and restore actor checkpoints of a large state,
+with `futures_actors.checkpoint` and with a plain pickle file.
+
+The state is a dict of arrays (numpy arrays if numpy is installed, otherwise
+buffers wrapped in `pickle.PickleBuffer`). Checkpoints store their data
+out-of-band, and `load` maps it from the file instead of copying it.
+
+CommandLine:
+    python benchmarks/bench_checkpoint.py
+    python benchmarks/bench_checkpoint.py --size 1000 --arrays 8
+"""
+from __future__ import print_function
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from futures_actors import checkpoint
+
+
+def make_state(n_arrays, size):
+    try:
+        import numpy as np
+    except ImportError:
+        return {i: pickle.PickleBuffer(bytearray(os.urandom(1024)) *
+                                       (size // 1024))
+                for i in range(n_arrays)}
+    return {i: np.random.rand(size // 8) for i in range(n_arrays)}
+
+
+def pickle_save(path, state):
+    with open(path, 'wb') as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+
+
+def pickle_load(path):
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def best_of(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=100,
+                        help='size of each array in MB')
+    parser.add_argument('--arrays', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    state = make_state(args.arrays, args.size << 20)
+    dpath = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dpath, 'state')
+        print('{:>12} {:>10} {:>10}'.format('format', 'save (s)', 'load (s)'))
+        for name, save, load in [('pickle', pickle_save, pickle_load),
+                                 ('checkpoint', checkpoint.save,
+                                  checkpoint.load)]:
+            save_time = best_of(lambda: save(path, state), args.repeat)
+            load_time = best_of(lambda: load(path), args.repeat)
+            print('{:>12} {:>10.3f} {:>10.3f}'.format(
+                name, save_time, load_time))
+    finally:
+        shutil.rmtree(dpath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the cost of the durable mailbox (`_journal`): how many small
+messages per second the journal itself logs and acknowledges, and the
+throughput of a ProcessActor with and without a journal.
+
+The journal is written in `--dpath` (a temporary directory by default), so
+point it to the disk to measure. Records are synced by the background thread
+every `--sync` seconds, so the posting threads never wait for the disk.
+
+CommandLine:
+    python benchmarks/bench_journal.py
+    python benchmarks/bench_journal.py --num 200000 --size 100 --sync 0.001
+"""
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import futures_actors
+from futures_actors import journal
+
+
+class EchoActor(futures_actors.ProcessActor):
+    def handle(self, message):
+        return message
+
+
+def bench_journal(dpath, size, num, sync_interval):
+    """
+    Returns:
+        dict: messages/sec when logging them, and when logging and
+            acknowledging each one
+    """
+    message = b'x' * size
+    log = journal._Journal(dpath, sync_interval)
+    try:
+        start = time.perf_counter()
+        seqs = [log.append(journal.POST, journal._dumps(message))
+                for _ in range(num)]
+        appended = time.perf_counter() - start
+        start = time.perf_counter()
+        for seq in seqs:
+            log.ack(seq)
+        acked = time.perf_counter() - start
+    finally:
+        log.close()
+    return {'append': num / appended, 'append+ack': num / (appended + acked)}
+
+
+def bench_executor(dpath, size, num, sync_interval):
+    """
+    Returns:
+        float: messages/sec through a ProcessActor
+    """
+    message = b'x' * size
+    options = {}
+    if dpath is not None:
+        options = {'_journal': dpath, '_journal_sync': sync_interval}
+    executor = EchoActor.executor(_pipeline_depth=64, **options)
+    try:
+        executor.post(None).result()
+        start = time.perf_counter()
+        fs = [executor.post(message) for _ in range(num)]
+        for f in fs:
+            f.result()
+        duration = time.perf_counter() - start
+    finally:
+        executor.shutdown(wait=True)
+    return num / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=100000,
+                        help='messages logged by the journal')
+    parser.add_argument('--size', type=int, default=64,
+                        help='payload size in bytes')
+    parser.add_argument('--sync', type=float, default=0.01,
+                        help='seconds between two syncs')
+    parser.add_argument('--dpath', default=None,
+                        help='directory the journals are written in')
+    args = parser.parse_args()
+    root = tempfile.mkdtemp(dir=args.dpath)
+    try:
+        rates = bench_journal(os.path.join(root, 'journal'), args.size,
+                              args.num, args.sync)
+        for name, rate in sorted(rates.items()):
+            print('{:>28} {:>12.0f} msg/s'.format('journal ' + name, rate))
+        num = max(1000, args.num // 5)
+        for name, dpath in [('executor', None),
+                            ('executor with journal',
+                             os.path.join(root, 'executor'))]:
+            rate = bench_executor(dpath, args.size, num, args.sync)
+            print('{:>28} {:>12.0f} msg/s'.format(name, rate))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures ProcessActor throughput (messages/sec) as a function of the
+`_pipeline_depth` executor option.
+
+CommandLine:
+    python benchmarks/bench_pipeline_depth.py
+    python benchmarks/bench_pipeline_depth.py --num 20000 --depths 1,2,4,8,32
+"""
+from __future__ import print_function
+import argparse
+import time
+import futures_actors
+
+
+class EchoActor(futures_actors.ProcessActor):
+    def handle(self, message):
+        return message
+
+
+def bench_depth(depth, num):
+    executor = EchoActor.executor(_pipeline_depth=depth)
+    try:
+        # Warm up so process startup is not part of the measurement
+        executor.post(None).result()
+        start = time.time()
+        fs = [executor.post(i) for i in range(num)]
+        for f in fs:
+            f.result()
+        duration = time.time() - start
+    finally:
+        executor.shutdown(wait=True)
+    return num / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=10000)
+    parser.add_argument('--depths', default='1,2,4,8,16,64')
+    args = parser.parse_args()
+    depths = [int(d) for d in args.depths.split(',')]
+    print('{:>8} {:>14}'.format('depth', 'messages/sec'))
+    for depth in depths:
+        rate = bench_depth(depth, args.num)
+        print('{:>8} {:>14.1f}'.format(depth, rate))
+
+
+if __name__ == '__main__':
+    main()
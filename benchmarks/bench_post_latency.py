@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the latency of ProcessActorExecutor.post() itself, i.e. the time the
+caller spends inside `post` before it gets its Future back.
+
+CommandLine:
+    python benchmarks/bench_post_latency.py
+    python benchmarks/bench_post_latency.py --num 50000
+"""
+from __future__ import print_function
+import argparse
+import time
+import futures_actors
+
+
+class EchoActor(futures_actors.ProcessActor):
+    def handle(self, message):
+        return message
+
+
+def bench_post_latency(num):
+    executor = EchoActor.executor()
+    try:
+        # Warm up so process startup is not part of the measurement
+        executor.post(None).result()
+        durations = []
+        fs = []
+        for i in range(num):
+            start = time.perf_counter()
+            fs.append(executor.post(i))
+            durations.append(time.perf_counter() - start)
+        for f in fs:
+            f.result()
+    finally:
+        executor.shutdown(wait=True)
+    durations.sort()
+    return {
+        'mean': sum(durations) / len(durations),
+        'p50': durations[len(durations) // 2],
+        'p99': durations[int(len(durations) * 0.99)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=20000)
+    args = parser.parse_args()
+    stats = bench_post_latency(args.num)
+    for key in ['mean', 'p50', 'p99']:
+        print('post() {:>4}: {:8.2f} us'.format(key, stats[key] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
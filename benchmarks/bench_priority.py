@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how long a control message waits behind a backlog of bulk messages,
+with and without a priority, and the throughput of default priority posts.
+
+CommandLine:
+    python benchmarks/bench_priority.py
+    python benchmarks/bench_priority.py --backlog 5000 --actor thread
+"""
+from __future__ import print_function
+import argparse
+import time
+import futures_actors
+
+
+class BulkMixin(object):
+    def handle(self, message):
+        if message == 'bulk':
+            # Simulates a bit of work per bulk message
+            time.sleep(0.0001)
+        return message
+
+
+class BulkProcessActor(BulkMixin, futures_actors.ProcessActor):
+    pass
+
+
+class BulkThreadActor(BulkMixin, futures_actors.ThreadActor):
+    pass
+
+
+def bench_control_latency(ActorClass, backlog, priority):
+    executor = ActorClass.executor()
+    try:
+        executor.post(None).result()
+        for _ in range(backlog):
+            executor.post('bulk')
+        start = time.time()
+        executor.post('control', priority=priority).result()
+        duration = time.time() - start
+    finally:
+        executor.shutdown(wait=True)
+    return duration
+
+
+def bench_throughput(ActorClass, num):
+    executor = ActorClass.executor()
+    try:
+        executor.post(None).result()
+        start = time.time()
+        fs = [executor.post(i) for i in range(num)]
+        for f in fs:
+            f.result()
+        duration = time.time() - start
+    finally:
+        executor.shutdown(wait=True)
+    return num / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backlog', type=int, default=2000)
+    parser.add_argument('--num', type=int, default=20000)
+    parser.add_argument('--actor', default='process',
+                        choices=['process', 'thread'])
+    args = parser.parse_args()
+    ActorClass = {'process': BulkProcessActor,
+                  'thread': BulkThreadActor}[args.actor]
+    print('{:>10} {:>16}'.format('priority', 'control latency'))
+    for priority in [0, 1]:
+        duration = bench_control_latency(ActorClass, args.backlog, priority)
+        print('{:>10} {:>15.4f}s'.format(priority, duration))
+    rate = bench_throughput(ActorClass, args.num)
+    print('default priority throughput: {:.1f} messages/sec'.format(rate))
+
+
+if __name__ == '__main__':
+    main()
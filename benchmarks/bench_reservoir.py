@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the latency of short-lived ProcessActors, created for a single job
+each, with and without a `WorkerReservoir` of pre-started workers.
+
+A job is the creation of an executor, one posted message and the shutdown of
+the executor. The actor imports `--modules` when it is created, which the
+workers of the 'reservoir+preload' configuration have already imported.
+
+CommandLine:
+    python benchmarks/bench_reservoir.py
+    python benchmarks/bench_reservoir.py --num 200 --modules numpy
+"""
+from __future__ import print_function
+import argparse
+import importlib
+import time
+import futures_actors
+
+_DEFAULT_MODULES = ['asyncio', 'decimal', 'email.mime.multipart',
+                    'http.server', 'unittest', 'xml.etree.ElementTree']
+
+
+class JobActor(futures_actors.ProcessActor):
+    def __init__(self, modules):
+        for name in modules:
+            importlib.import_module(name)
+
+    def handle(self, message):
+        return message
+
+
+def bench_jobs(modules, num, **options):
+    """
+    Returns:
+        tuple: (seconds until the result of each job, seconds per job
+            including the shutdown of its actor)
+    """
+    latencies = []
+    start = time.perf_counter()
+    for i in range(num):
+        job_start = time.perf_counter()
+        executor = JobActor.executor(modules, **options)
+        executor.post(i).result()
+        latencies.append(time.perf_counter() - job_start)
+        executor.shutdown(wait=True)
+    return latencies, (time.perf_counter() - start) / num
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=50,
+                        help='jobs per configuration')
+    parser.add_argument('--modules', nargs='+', default=_DEFAULT_MODULES,
+                        help='modules imported by the actors')
+    args = parser.parse_args()
+    reservoir = futures_actors.WorkerReservoir(size=2)
+    warm_reservoir = futures_actors.WorkerReservoir(size=2,
+                                                    preload=args.modules)
+    # Let the workers start
+    time.sleep(2)
+    configs = [
+        ('no reservoir', {}),
+        ('reservoir', {'_reservoir': reservoir}),
+        ('reservoir+preload', {'_reservoir': warm_reservoir}),
+    ]
+    print('{:>18} {:>12} {:>12} {:>12}'.format(
+        'config', 'p50 (ms)', 'p99 (ms)', 'job (ms)'))
+    for name, options in configs:
+        latencies, per_job = bench_jobs(args.modules, args.num, **options)
+        latencies.sort()
+        print('{:>18} {:>12.2f} {:>12.2f} {:>12.2f}'.format(
+            name, latencies[len(latencies) // 2] * 1e3,
+            latencies[int(len(latencies) * 0.99)] * 1e3, per_job * 1e3))
+    reservoir.close()
+    warm_reservoir.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures ProcessActor throughput (messages/sec) with the different
+`_serializer` and `_compression` executor options.
+
+CommandLine:
+    python benchmarks/bench_serializer.py
+    python benchmarks/bench_serializer.py --num 500 --size 1000000
+"""
+from __future__ import print_function
+import argparse
+import time
+import futures_actors
+
+
+class SizeActor(futures_actors.ProcessActor):
+    def handle(self, message):
+        return len(message)
+
+
+def bench_serializer(message, num, **options):
+    executor = SizeActor.executor(**options)
+    try:
+        # Warm up so process startup is not part of the measurement
+        executor.post(b'').result()
+        start = time.time()
+        fs = [executor.post(message) for _ in range(num)]
+        for f in fs:
+            f.result()
+        duration = time.time() - start
+    finally:
+        executor.shutdown(wait=True)
+    return num / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=100000,
+                        help='size in bytes of the messages')
+    args = parser.parse_args()
+    messages = {
+        'bytes': b'x' * args.size,
+        'dict': {i: str(i) for i in range(args.size // 16)},
+    }
+    configs = [('default', None), ('pickle', None), ('bytes', None),
+               ('bytes', 'zlib'), ('pickle', 'lzma')]
+    for optional in ['cloudpickle', 'msgpack']:
+        try:
+            __import__(optional)
+        except ImportError:
+            continue
+        configs.append((optional, None))
+    print('{:>12} {:>12} {:>8} {:>14}'.format(
+        'serializer', 'compression', 'message', 'messages/sec'))
+    for serializer, compression in configs:
+        options = {}
+        if serializer != 'default':
+            options = {'_serializer': serializer, '_compression': compression}
+        for kind, message in sorted(messages.items()):
+            rate = bench_serializer(message, args.num, **options)
+            print('{:>12} {:>12} {:>8} {:>14.1f}'.format(
+                serializer, str(compression), kind, rate))
+
+
+if __name__ == '__main__':
+    main()
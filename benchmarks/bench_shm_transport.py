@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the default pickle-through-a-pipe transport of ProcessActor with the
+shared memory transport (`_shm_threshold`) for large array messages.
+
+Each configuration runs in a fresh interpreter so the reported peak RSS of
+the parent and of the actor process are not polluted by earlier runs.
+Payloads are numpy arrays if numpy is installed, otherwise bytearrays (sent
+wrapped in a `pickle.PickleBuffer` for the shared memory transport). The actor
+echoes every payload back, so both directions are measured.
+
+CommandLine:
+    python benchmarks/bench_shm_transport.py
+    python benchmarks/bench_shm_transport.py --sizes 1,16,200 --num 5
+"""
+from __future__ import print_function
+import argparse
+import json
+import pickle
+import resource
+import subprocess
+import sys
+import time
+import futures_actors
+
+
+class EchoActor(futures_actors.ProcessActor):
+    def handle(self, message):
+        if isinstance(message, memoryview):
+            return pickle.PickleBuffer(message)
+        return message
+
+
+def make_payload(nbytes, transport):
+    try:
+        import numpy as np
+    except ImportError:
+        data = bytearray(nbytes)
+        if transport == 'shm':
+            return pickle.PickleBuffer(data)
+        return data
+    else:
+        return np.ones(nbytes, dtype=np.uint8)
+
+
+def run_worker(transport, nbytes, num):
+    kwargs = {}
+    if transport == 'shm':
+        kwargs['_shm_threshold'] = 1 << 16
+    executor = EchoActor.executor(**kwargs)
+    try:
+        executor.post(None).result()
+        payload = make_payload(nbytes, transport)
+        start = time.time()
+        for _ in range(num):
+            result = executor.post(payload).result()
+            del result
+        duration = time.time() - start
+    finally:
+        executor.shutdown(wait=True)
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        'transport': transport,
+        'nbytes': nbytes,
+        'messages_per_sec': num / duration,
+        'mb_per_sec': num * nbytes / duration / 2 ** 20,
+        # ru_maxrss is in kilobytes on Linux
+        'parent_peak_rss_mb': self_rss / 1024.0,
+        'actor_peak_rss_mb': child_rss / 1024.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='1,16,200',
+                        help='payload sizes in MB')
+    parser.add_argument('--num', type=int, default=10)
+    parser.add_argument('--worker', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        transport, nbytes = args.worker[0], int(args.worker[1])
+        print(json.dumps(run_worker(transport, nbytes, args.num)))
+        return
+
+    fmt = '{:>9} {:>8} {:>10} {:>10} {:>14} {:>14}'
+    print(fmt.format('transport', 'size_mb', 'msgs/sec', 'MB/sec',
+                     'parent_rss_mb', 'actor_rss_mb'))
+    for size in [float(s) for s in args.sizes.split(',')]:
+        for transport in ['pickle', 'shm']:
+            command = [sys.executable, __file__, '--num', str(args.num),
+                       '--worker', transport, str(int(size * 2 ** 20))]
+            out = subprocess.check_output(command)
+            row = json.loads(out.decode('utf8').strip().split('\n')[-1])
+            print(fmt.format(
+                transport, size, '{:.1f}'.format(row['messages_per_sec']),
+                '{:.1f}'.format(row['mb_per_sec']),
+                '{:.1f}'.format(row['parent_peak_rss_mb']),
+                '{:.1f}'.format(row['actor_peak_rss_mb'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how long a new ProcessActor takes to answer its first message with
+the different start methods, cold (every actor imports its modules) and warm
+(the modules are preloaded once with `_preload`).
+
+The actor imports `--modules` when it is created, standing in for an actor
+that needs heavy libraries. Each configuration runs in a fresh interpreter,
+since the fork server is shared by the whole process. The first actor also
+pays for starting the fork server, so it is reported separately from the
+median of the next ones.
+
+CommandLine:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --num 20 --modules numpy scipy
+"""
+from __future__ import print_function
+import argparse
+import importlib
+import json
+import subprocess
+import sys
+import time
+import futures_actors
+
+# Standard modules that take a while to import, used if numpy is missing
+_DEFAULT_MODULES = ['asyncio', 'decimal', 'email.mime.multipart',
+                    'http.server', 'unittest', 'xml.etree.ElementTree',
+                    'concurrent.futures.process']
+
+# name: (_mp_context, whether the modules are preloaded)
+CONFIGS = [
+    ('fork/cold', 'fork', False),
+    ('fork/warm', 'fork', True),
+    ('spawn/cold', 'spawn', False),
+    ('forkserver/cold', 'forkserver', False),
+    ('forkserver/warm', 'forkserver', True),
+]
+
+
+class ImportingActor(futures_actors.ProcessActor):
+    def __init__(self, modules):
+        for name in modules:
+            importlib.import_module(name)
+
+    def handle(self, message):
+        return message
+
+
+def bench_startup(method, warm, modules, num):
+    """
+    Returns:
+        list: seconds until each of `num` new actors answered its first
+            message
+    """
+    options = {'_mp_context': method}
+    if warm:
+        options['_preload'] = modules
+    durations = []
+    for _ in range(num):
+        start = time.perf_counter()
+        executor = ImportingActor.executor(modules, **options)
+        executor.post(None).result()
+        durations.append(time.perf_counter() - start)
+        executor.shutdown(wait=True)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=10,
+                        help='actors created per configuration')
+    parser.add_argument('--modules', nargs='+', default=None,
+                        help='modules imported by the actors')
+    parser.add_argument('--config', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.modules is None:
+        try:
+            importlib.import_module('numpy')
+        except ImportError:
+            args.modules = _DEFAULT_MODULES
+        else:
+            args.modules = ['numpy']
+
+    if args.config is not None:
+        # Runs one configuration and prints the durations as JSON
+        _, method, warm = [c for c in CONFIGS if c[0] == args.config][0]
+        print(json.dumps(bench_startup(method, warm, args.modules, args.num)))
+        return
+
+    print('modules: {}'.format(' '.join(args.modules)))
+    print('{:>16} {:>12} {:>12}'.format('config', 'first (ms)',
+                                        'median (ms)'))
+    for name, _, _ in CONFIGS:
+        output = subprocess.check_output(
+            [sys.executable, __file__, '--config', name, '--num',
+             str(args.num), '--modules'] + args.modules)
+        durations = json.loads(output.decode('utf8').splitlines()[-1])
+        rest = sorted(durations[1:]) or durations
+        print('{:>16} {:>12.1f} {:>12.1f}'.format(
+            name, durations[0] * 1e3, rest[len(rest) // 2] * 1e3))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the overhead of collecting metrics with `_stats=True` on the
+throughput (messages/sec) of small messages.
+
+CommandLine:
+    python benchmarks/bench_stats.py
+    python benchmarks/bench_stats.py --num 50000 --actor thread
+"""
+from __future__ import print_function
+import argparse
+import time
+import futures_actors
+
+
+class EchoProcessActor(futures_actors.ProcessActor):
+    def handle(self, message):
+        return message
+
+
+class EchoThreadActor(futures_actors.ThreadActor):
+    def handle(self, message):
+        return message
+
+
+def bench_stats(ActorClass, num, **options):
+    executor = ActorClass.executor(**options)
+    try:
+        # Warm up so process startup is not part of the measurement
+        executor.post(None).result()
+        start = time.time()
+        fs = [executor.post(i) for i in range(num)]
+        for f in fs:
+            f.result()
+        duration = time.time() - start
+        stats = executor.stats()
+    finally:
+        executor.shutdown(wait=True)
+    return num / duration, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=20000)
+    parser.add_argument('--actor', default='process',
+                        choices=['process', 'thread'])
+    args = parser.parse_args()
+    ActorClass = {'process': EchoProcessActor,
+                  'thread': EchoThreadActor}[args.actor]
+    print('{:>8} {:>14}'.format('stats', 'messages/sec'))
+    for enabled in [False, True]:
+        rate, stats = bench_stats(ActorClass, args.num, _stats=enabled)
+        print('{:>8} {:>14.1f}'.format(str(enabled), rate))
+    for key in ['handle_time', 'queue_wait']:
+        summary = stats[key]
+        print('{}: mean={:.2e}s p50={:.2e}s p99={:.2e}s max={:.2e}s'.format(
+            key, summary['mean'], summary['p50'], summary['p99'],
+            summary['max']))
+    if args.actor == 'process':
+        print('bytes sent/received: {}/{}, (de)serialization: '
+              '{:.3f}s/{:.3f}s'.format(
+                  stats['bytes_sent'], stats['bytes_received'],
+                  stats['serialize_time'], stats['deserialize_time']))
+
+
+if __name__ == '__main__':
+    main()
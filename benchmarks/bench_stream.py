@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures streamed results (`executor.stream`) against returning a list: an
+actor produces `--num` chunks of `--size` bytes, taking `--cost` seconds per
+chunk. Reports the time until the caller gets the first chunk, the total
+time, and the peak memory allocated by the calling process (tracemalloc).
+
+CommandLine:
+    python benchmarks/bench_stream.py
+    python benchmarks/bench_stream.py --num 2000 --size 100000 --window 4
+"""
+from __future__ import print_function
+import argparse
+import time
+import tracemalloc
+import futures_actors
+
+
+class ProducerMixin(object):
+    def handle(self, message):
+        num, size, cost, streamed = message
+        chunks = self.produce(num, size, cost)
+        return chunks if streamed else list(chunks)
+
+    def produce(self, num, size, cost):
+        for i in range(num):
+            if cost:
+                time.sleep(cost)
+            yield bytes(bytearray([i % 256])) * size
+
+
+class ProducerProcessActor(ProducerMixin, futures_actors.ProcessActor):
+    pass
+
+
+class ProducerThreadActor(ProducerMixin, futures_actors.ThreadActor):
+    pass
+
+
+ACTOR_CLASSES = {'thread': ProducerThreadActor,
+                 'process': ProducerProcessActor}
+
+
+def bench_stream(ActorClass, args, streamed):
+    """
+    Returns:
+        tuple: seconds to the first chunk, total seconds, peak bytes
+    """
+    executor = ActorClass.executor()
+    message = (args.num, args.size, args.cost, streamed)
+    try:
+        executor.post((1, 1, 0, False)).result()
+        tracemalloc.start()
+        start = time.perf_counter()
+        first = None
+        total = 0
+        if streamed:
+            chunks = executor.stream(message, window=args.window)
+        else:
+            chunks = executor.post(message).result()
+        for chunk in chunks:
+            if first is None:
+                first = time.perf_counter() - start
+            total += len(chunk)
+            del chunk
+        del chunks
+        duration = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert total == args.num * args.size
+    finally:
+        executor.shutdown(wait=True)
+    return first, duration, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--actor', nargs='+', default=['thread', 'process'],
+                        choices=['thread', 'process'])
+    parser.add_argument('--num', type=int, default=500,
+                        help='chunks produced by the actor')
+    parser.add_argument('--size', type=int, default=100000,
+                        help='chunk size in bytes')
+    parser.add_argument('--cost', type=float, default=0.0005,
+                        help='seconds the actor takes per chunk')
+    parser.add_argument('--window', type=int, default=16,
+                        help='chunks produced ahead of the caller')
+    args = parser.parse_args()
+    print('{:>8} {:>8} {:>12} {:>10} {:>12}'.format(
+        'actor', 'result', 'first (ms)', 'total (s)', 'peak (MB)'))
+    for kind in args.actor:
+        for streamed in [False, True]:
+            first, duration, peak = bench_stream(ACTOR_CLASSES[kind], args,
+                                                 streamed)
+            print('{:>8} {:>8} {:>12.2f} {:>10.3f} {:>12.1f}'.format(
+                kind, 'stream' if streamed else 'list', 1000 * first,
+                duration, peak / 1e6))
+
+
+if __name__ == '__main__':
+    main()
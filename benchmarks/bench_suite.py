@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite comparing ThreadActor and ProcessActor: throughput
+(messages/sec), round-trip latency (p50/p99), startup time of `executor()`
+and memory per actor, over a range of payload sizes, actor counts and
+concurrency levels (number of threads posting to the same executor).
+
+The results can be written as JSON with `--json`, and compared with a
+baseline written earlier with `--baseline`. Metrics that got worse than the
+baseline by more than `--tolerance` are reported as regressions and make the
+script exit with status 1, so changes to the event loops can be judged
+against the numbers of the same machine before the change.
+
+CommandLine:
+    python benchmarks/bench_suite.py --quick
+    python benchmarks/bench_suite.py --json baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --json new.json
+    python benchmarks/bench_suite.py --actor process --sizes 100 1000000
+"""
+from __future__ import print_function
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import threading
+import time
+import futures_actors
+
+
+class EchoProcessActor(futures_actors.ProcessActor):
+    def handle(self, message):
+        return message
+
+
+class EchoThreadActor(futures_actors.ThreadActor):
+    def handle(self, message):
+        return message
+
+
+ACTOR_CLASSES = {'thread': EchoThreadActor, 'process': EchoProcessActor}
+
+# Messages of large payloads are capped to this many bytes per measurement
+_BYTES_BUDGET = 200 << 20
+
+
+def _num_messages(num, size):
+    return max(20, min(num, _BYTES_BUDGET // max(size, 1)))
+
+
+def bench_throughput(ActorClass, size, concurrency, num):
+    """
+    Messages/sec of one actor fed by `concurrency` posting threads
+    """
+    message = b'x' * size
+    num = _num_messages(num, size)
+    per_thread = max(1, num // concurrency)
+    executor = ActorClass.executor()
+    try:
+        # Warm up so actor startup is not part of the measurement
+        executor.post(None).result()
+        barrier = threading.Event()
+
+        def producer():
+            barrier.wait()
+            fs = [executor.post(message) for _ in range(per_thread)]
+            for f in fs:
+                f.result()
+        threads = [threading.Thread(target=producer)
+                   for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        start = time.perf_counter()
+        barrier.set()
+        for t in threads:
+            t.join()
+        duration = time.perf_counter() - start
+    finally:
+        executor.shutdown(wait=True)
+    return per_thread * concurrency / duration
+
+
+def bench_actor_count(ActorClass, n_actors, num):
+    """
+    Messages/sec of `n_actors` actors fed round-robin by one thread
+    """
+    executors = [ActorClass.executor() for _ in range(n_actors)]
+    try:
+        for f in [executor.post(None) for executor in executors]:
+            f.result()
+        start = time.perf_counter()
+        fs = [executors[i % n_actors].post(i) for i in range(num)]
+        for f in fs:
+            f.result()
+        duration = time.perf_counter() - start
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
+    return num / duration
+
+
+def bench_latency(ActorClass, size, num):
+    """
+    Round-trip times of messages posted one at a time
+    """
+    message = b'x' * size
+    num = _num_messages(num, size)
+    executor = ActorClass.executor()
+    try:
+        executor.post(None).result()
+        durations = []
+        for _ in range(num):
+            start = time.perf_counter()
+            executor.post(message).result()
+            durations.append(time.perf_counter() - start)
+    finally:
+        executor.shutdown(wait=True)
+    durations.sort()
+    return {'p50': durations[len(durations) // 2],
+            'p99': durations[int(len(durations) * 0.99)]}
+
+
+def bench_startup(ActorClass, repeat):
+    """
+    Seconds until a new actor answers its first message
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        executor = ActorClass.executor()
+        executor.post(None).result()
+        durations.append(time.perf_counter() - start)
+        executor.shutdown(wait=True)
+    return min(durations)
+
+
+def _memory_kb(pid):
+    """
+    Proportional set size of a process (its private memory plus its share
+    of the memory it shares with others) in KiB, or its resident set size
+    if the kernel does not report it. None if neither is available.
+    """
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as file:
+            for line in file:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    try:
+        with open('/proc/{}/statm'.format(pid)) as file:
+            rss_pages = int(file.read().split()[1])
+        return rss_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+def bench_memory(ActorClass, n_actors):
+    """
+    KiB of memory used per actor, counting the posting process and the
+    actor processes
+    """
+    before = _memory_kb(os.getpid())
+    if before is None:
+        return None
+    executors = [ActorClass.executor() for _ in range(n_actors)]
+    try:
+        for f in [executor.post(None) for executor in executors]:
+            f.result()
+        total = _memory_kb(os.getpid()) - before
+        for executor in executors:
+            channel = getattr(executor, '_channel', None)
+            if channel is not None:
+                total += _memory_kb(channel.actor_process.process.pid) or 0
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
+    return total / n_actors
+
+
+def run_suite(args):
+    """
+    Returns:
+        dict: maps the name of each metric to its value, its unit and
+            whether higher values are better
+    """
+    results = {}
+
+    def record(name, value, unit, higher_is_better):
+        if value is None:
+            return
+        results[name] = {'value': value, 'unit': unit,
+                         'higher_is_better': higher_is_better}
+        print('{:<48} {:>14.2f} {}'.format(name, value, unit))
+        sys.stdout.flush()
+
+    for kind in args.actor:
+        ActorClass = ACTOR_CLASSES[kind]
+        for size in args.sizes:
+            for concurrency in args.concurrency:
+                rate = max(bench_throughput(ActorClass, size, concurrency,
+                                            args.num)
+                           for _ in range(args.repeat))
+                record('throughput/{}/size={}/concurrency={}'.format(
+                    kind, size, concurrency), rate, 'msg/s', True)
+            latency = bench_latency(ActorClass, size, args.num // 4)
+            for key in ['p50', 'p99']:
+                record('latency_{}/{}/size={}'.format(key, kind, size),
+                       latency[key] * 1e6, 'us', False)
+        for n_actors in args.actors:
+            rate = max(bench_actor_count(ActorClass, n_actors, args.num)
+                       for _ in range(args.repeat))
+            record('throughput/{}/actors={}'.format(kind, n_actors), rate,
+                   'msg/s', True)
+        record('startup/{}'.format(kind),
+               bench_startup(ActorClass, 3 * args.repeat) * 1e3, 'ms', False)
+        record('memory/{}'.format(kind),
+               bench_memory(ActorClass, max(args.actors)), 'KiB/actor', False)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of every metric found in the baseline.
+
+    Returns:
+        list: names of the metrics that got worse by more than `tolerance`
+    """
+    regressions = []
+    print('{:<48} {:>12} {:>12} {:>8}'.format(
+        'metric', 'baseline', 'current', 'change'))
+    for name, result in sorted(results.items()):
+        base = baseline.get(name, None)
+        if base is None or not base['value']:
+            continue
+        change = (result['value'] - base['value']) / base['value']
+        # Positive when the metric improved
+        gain = change if result['higher_is_better'] else -change
+        flag = ''
+        if gain < -tolerance:
+            flag = ' REGRESSION'
+            regressions.append(name)
+        print('{:<48} {:>12.2f} {:>12.2f} {:>+7.1f}%{}'.format(
+            name, base['value'], result['value'], 100 * change, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--actor', nargs='+', default=['thread', 'process'],
+                        choices=['thread', 'process'])
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[100, 10000, 1000000],
+                        help='payload sizes in bytes')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4],
+                        help='numbers of threads posting to one actor')
+    parser.add_argument('--actors', nargs='+', type=int, default=[1, 4, 16],
+                        help='numbers of actors fed at once')
+    parser.add_argument('--num', type=int, default=10000,
+                        help='messages per throughput measurement')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='throughputs are the best of this many runs')
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer messages and configurations')
+    parser.add_argument('--json', default=None,
+                        help='write the results to this file')
+    parser.add_argument('--baseline', default=None,
+                        help='compare with the results in this file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative change counted as a regression')
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes = args.sizes[:2]
+        args.concurrency = args.concurrency[:2]
+        args.actors = args.actors[:2]
+        args.num = min(args.num, 2000)
+        args.repeat = 1
+
+    results = run_suite(args)
+    if args.json is not None:
+        data = {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': multiprocessing.cpu_count(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'version': futures_actors.__version__,
+            },
+            'results': results,
+        }
+        with open(args.json, 'w') as file:
+            json.dump(data, file, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('{} regression(s) beyond {:.0f}%'.format(
+                len(regressions), 100 * args.tolerance))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the throughput (messages/sec) of one-way traffic sent with `post`,
+whose results are ignored, and with the fire-and-forget `tell`.
+
+CommandLine:
+    python benchmarks/bench_tell.py
+    python benchmarks/bench_tell.py --num 50000 --actor thread
+"""
+from __future__ import print_function
+import argparse
+import time
+import futures_actors
+
+
+class SinkMixin(object):
+    def __init__(self):
+        self.count = 0
+
+    def handle(self, message):
+        if message == 'count':
+            return self.count
+        self.count += 1
+
+
+class SinkProcessActor(SinkMixin, futures_actors.ProcessActor):
+    pass
+
+
+class SinkThreadActor(SinkMixin, futures_actors.ThreadActor):
+    pass
+
+
+def bench_send(ActorClass, method, num):
+    executor = ActorClass.executor()
+    try:
+        # Warm up so process startup is not part of the measurement
+        executor.post('count').result()
+        send = getattr(executor, method)
+        start = time.time()
+        for i in range(num):
+            send(i)
+        # The count is handled after every message that was sent before it
+        assert executor.post('count').result() == num
+        duration = time.time() - start
+    finally:
+        executor.shutdown(wait=True)
+    return num / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=20000)
+    parser.add_argument('--actor', default='process',
+                        choices=['process', 'thread'])
+    args = parser.parse_args()
+    ActorClass = {'process': SinkProcessActor,
+                  'thread': SinkThreadActor}[args.actor]
+    print('{:>8} {:>14}'.format('method', 'messages/sec'))
+    for method in ['post', 'tell']:
+        rate = bench_send(ActorClass, method, args.num)
+        print('{:>8} {:>14.1f}'.format(method, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Breaks down the latency of ProcessActor messages into the steps recorded by
+`_trace`, and measures the overhead of tracing on the throughput.
+
+CommandLine:
+    python benchmarks/bench_tracing.py
+    python benchmarks/bench_tracing.py --num 5000 --size 100000
+    python benchmarks/bench_tracing.py --chrome trace.json
+"""
+from __future__ import print_function
+import argparse
+import collections
+import time
+import futures_actors
+from futures_actors import tracing
+
+
+class EchoActor(futures_actors.ProcessActor):
+    def handle(self, message):
+        return message
+
+
+def bench_tracing(message, num, **options):
+    executor = EchoActor.executor(**options)
+    try:
+        # Warm up so process startup is not part of the measurement
+        executor.post(None).result()
+        start = time.time()
+        fs = [executor.post(message) for _ in range(num)]
+        for f in fs:
+            f.result()
+        duration = time.time() - start
+    finally:
+        executor.shutdown(wait=True)
+    return num / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--num', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=100,
+                        help='size in bytes of the messages')
+    parser.add_argument('--pipeline_depth', type=int, default=1)
+    parser.add_argument('--chrome', default=None,
+                        help='also write the traces to this JSON file')
+    args = parser.parse_args()
+    message = b'x' * args.size
+    options = {'_pipeline_depth': args.pipeline_depth}
+
+    rate = bench_tracing(message, args.num, **options)
+    print('untraced: {:.1f} messages/sec'.format(rate))
+
+    traces = []
+    writer = None
+    if args.chrome is not None:
+        writer = tracing.ChromeTraceWriter(args.chrome)
+
+    def callback(trace):
+        traces.append(trace)
+        if writer is not None:
+            writer(trace)
+    rate = bench_tracing(message, args.num, _trace=callback, **options)
+    print('traced:   {:.1f} messages/sec'.format(rate))
+    if writer is not None:
+        writer.flush()
+
+    steps = collections.defaultdict(list)
+    for trace in traces:
+        for step, duration in trace.durations():
+            steps[step].append(duration)
+    print('{:>8} {:>12} {:>12} {:>12}'.format('step', 'mean', 'p50', 'p99'))
+    for step, durations in steps.items():
+        durations.sort()
+        print('{:>8} {:>11.1f}us {:>11.1f}us {:>11.1f}us'.format(
+            step, 1e6 * sum(durations) / len(durations),
+            1e6 * durations[len(durations) // 2],
+            1e6 * durations[int(len(durations) * 0.99)]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,17 @@
 # flake8: noqa
+import sys
 from futures_actors._base_actor import (Actor, ActorExecutor)
 from futures_actors.process_actor import ProcessActor
 from futures_actors.thread_actor import ThreadActor
+from futures_actors.pool import ActorPool
+from futures_actors.sharding import ShardedActorExecutor
+from futures_actors.actor_ref import ActorRef
+from futures_actors.supervisor import Supervisor
+from futures_actors.mailbox import MailboxFull
+from futures_actors.serializers import Serializer
+from futures_actors.reservoir import WorkerReservoir
+from futures_actors.streams import Stream
+if sys.version_info[0:2] >= (3, 7):
+    from futures_actors.async_actor import (AsyncActor, AsyncProcessActor)
 
 __version__ = '0.0.5'
@@ -1,18 +1,16 @@
 """
-TODO:
-    Actors need to be able to reference each other.
-        * this means we need to be able to pass a reference
-          that can post a message to an actor's executor.
-    Actors need to be able to create more actors.
-        * This should be fairly simple if the first task is complete.
-
-    Idea:
-        maintain a list of weakreferences to all actor executors ever created
-        in a thread. Actors must have a way of interacting with this thread.
-
+Base classes and event loop helpers shared by the thread and process actors.
 """
 
 from concurrent.futures import _base
+import inspect
+import sys
+import threading
+import time
+if sys.version_info.major >= 3:
+    import queue
+else:
+    import Queue as queue
 
 
 class ActorExecutor(_base.Executor):
@@ -28,6 +26,64 @@ class ActorExecutor(_base.Executor):
         """
         analagous to _base.Executor.submit, but sends a message to the actor
         controlled by this Executor, and returns a Future.
+
+        The thread and process executors also take a `timeout`: the number
+        of seconds to wait for room in a bounded mailbox before raising
+        `MailboxFull`, and a `priority`: waiting messages with a higher
+        priority are handled first (see `futures_actors.mailbox`).
+        """
+        raise NotImplementedError(
+            'use ProcessActorExecutor or ThreadActorExecutor')  # nocover
+
+    def post_many(self, messages):
+        """
+        Posts a sequence of messages to the actor at once and returns a list
+        of Futures, one per message, in the same order.
+
+        The batch is delivered to the actor's event loop as a single unit, so
+        the per-message locking and inter-process overhead of `post` is paid
+        once per batch. The actor still handles the messages one at a time.
+        """
+        return [self.post(message) for message in messages]
+
+    def tell(self, message):
+        """
+        Sends a message to the actor without tracking its result.
+
+        No Future is created and the result is never sent back, which makes
+        one-way traffic (logging, metrics, ...) cheaper than `post`. Told
+        messages are handled in order with the posted ones, and exceptions
+        raised while handling them are dropped.
+        """
+        self.post(message)
+
+    def stream(self, message, window=16, timeout=None, priority=0):  # nocover
+        """
+        Posts a message whose handler is a generator, and returns a
+        `futures_actors.streams.Stream` over the chunks it yields, sent back
+        as they are produced. At most `window` chunks are produced ahead of
+        the caller. `timeout` and `priority` are the ones of `post`.
+        """
+        raise NotImplementedError(
+            'use ProcessActorExecutor or ThreadActorExecutor')  # nocover
+
+    def stats(self):  # nocover
+        """
+        Returns a dict of metrics describing the actor: the depth of its
+        mailbox and the number of times it was restarted. Executors created
+        with `_stats=True` also count and time the messages the actor
+        handles. See `futures_actors.metrics`.
+        """
+        raise NotImplementedError(
+            'use ProcessActorExecutor or ThreadActorExecutor')  # nocover
+
+    def ref(self):  # nocover
+        """
+        Returns an `ActorRef` to the actor managed by this executor.
+
+        A reference can be sent to other actors inside messages, which can
+        then `post` or `tell` to this actor directly, without going through
+        the process that owns the executor.
         """
         raise NotImplementedError(
             'use ProcessActorExecutor or ThreadActorExecutor')  # nocover
@@ -44,6 +100,14 @@ class Actor(object):
     classmethod. This creates an asynchronously maintained instance of this
     class in a separate thread/process
 
+    An actor may also define an optional vectorized `handle_batch(messages)`
+    method. When it exists, the event loop gathers the queued messages (at
+    most `max_batch_size` of them, waiting up to `batch_linger` seconds for
+    more to arrive) and passes them as a list. It must return a list with one
+    result per message. A result that is an exception instance is raised from
+    that message's Future instead of being returned, and if `handle_batch`
+    itself raises, every message in the batch fails with that exception.
+
     Example:
         >>> from futures_actors import ThreadActor
         >>> class MyActor(ThreadActor):
@@ -58,6 +122,18 @@ class Actor(object):
         >>> f = executor.post(10)
         >>> assert f.result() == 15
     """
+    # Limits used to gather messages for `handle_batch`, if it is defined.
+    # At most `max_batch_size` messages are passed at once, and the event loop
+    # waits at most `batch_linger` seconds for more messages to arrive.
+    max_batch_size = 64
+    batch_linger = 0.0
+
+    # How the children created with `spawn` are supervised. See
+    # `futures_actors.supervisor.Supervisor`.
+    supervisor_strategy = 'one_for_one'
+    max_restarts = 3
+    max_restart_seconds = 5.0
+
     @classmethod
     def executor(cls):  # nocover
         """
@@ -66,6 +142,59 @@ class Actor(object):
         """
         raise NotImplementedError('use ProcessActor or ThreadActor')  # nocover
 
+    @classmethod
+    def pool(cls, *args, **kwargs):
+        """
+        Creates several asychronous instances of this Actor and returns an
+        `ActorPool` that routes messages between them. See
+        `futures_actors.pool.ActorPool` for the available options.
+        """
+        from futures_actors.pool import ActorPool
+        return ActorPool(cls, *args, **kwargs)
+
+    def snapshot(self):  # nocover
+        """
+        Returns the state of the actor as a picklable object. Actors that
+        implement `snapshot` and `restore` can be checkpointed, see
+        `futures_actors.checkpoint`.
+        """
+        raise NotImplementedError
+
+    def restore(self, state):  # nocover
+        """
+        Brings a newly created actor back to a `state` returned by
+        `snapshot`.
+        """
+        raise NotImplementedError
+
+    def spawn(self, _ActorClass, *args, **kwargs):
+        """
+        Creates a child actor supervised by this actor and returns its
+        executor. Can be called from inside `handle`.
+
+        Children of a ProcessActor live in processes started by the actor's
+        own process. Pass `executor.ref()` to other actors (or return it) to
+        let them talk to the child directly.
+        """
+        supervisor = getattr(self, '_supervisor', None)
+        if supervisor is None:
+            from futures_actors.supervisor import Supervisor
+            supervisor = self._supervisor = Supervisor(
+                strategy=self.supervisor_strategy,
+                max_restarts=self.max_restarts,
+                max_seconds=self.max_restart_seconds)
+        return supervisor.spawn(_ActorClass, *args, **kwargs)
+
+    def cancelled(self):
+        """
+        Returns True if the caller cancelled the message `handle` is
+        handling. Only the executors created with `_cancellable=True` let
+        callers cancel a message the actor started, see
+        `futures_actors.cancellation`.
+        """
+        scope = getattr(self, '_cancel_scope', None)
+        return scope is not None and scope.is_cancelled()
+
     def handle(self, message):  # nocover
         """
         This method recieves, handles, and responds to the messages sent from
@@ -74,3 +203,144 @@ class Actor(object):
         when the message was posted to this actor by the executor.
         """
         raise NotImplementedError('must implement message handler')  # nocover
+
+
+class _ActorMethodCall(object):
+    """
+    A message that makes the event loop call a method of the actor instead of
+    `handle`. Executors use it to drive actor hooks (e.g. state migration) in
+    the thread/process where the actor lives.
+    """
+    def __init__(self, name, *args):
+        self.name = name
+        self.args = args
+
+
+def _call_actor(actor, message):
+    """
+    Delivers a single message to the actor. The result may be awaitable if
+    the handler is a coroutine function.
+    """
+    if type(message) is _ActorMethodCall:
+        return getattr(actor, message.name)(*message.args)
+    return actor.handle(message)
+
+
+def _dispatch(actor, message):
+    """
+    Delivers a single message to the actor and returns its result. Coroutine
+    handlers are run to completion on an event loop private to the calling
+    thread.
+    """
+    result = _call_actor(actor, message)
+    if _isawaitable(result):
+        result = _run_awaitable(result)
+    return result
+
+
+_isawaitable = getattr(inspect, 'isawaitable', lambda obj: False)
+
+_local = threading.local()
+
+
+def _run_awaitable(awaitable):
+    import asyncio
+    loop = getattr(_local, 'loop', None)
+    if loop is None:
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(awaitable)
+
+
+def _supports_batching(actor):
+    return callable(getattr(actor, 'handle_batch', None))
+
+
+def _supports_snapshots(actor):
+    # Unbound methods of python 2 are wrappers around the function
+    snapshot = getattr(actor.snapshot, '__func__', actor.snapshot)
+    return snapshot is not getattr(Actor.snapshot, '__func__',
+                                   Actor.snapshot)
+
+
+def _stop_children(actor):
+    """
+    Shuts down the children the actor created with `spawn`. Called when its
+    event loop stops, otherwise a process actor would wait forever for its
+    child processes when exiting.
+    """
+    supervisor = getattr(actor, '_supervisor', None)
+    if supervisor is not None:
+        supervisor.shutdown(wait=True)
+
+
+def _gather_batch(work_queue, first, max_size, linger):
+    """
+    Collects the items queued behind `first` for `Actor.handle_batch`.
+
+    Items can be single work/call items or lists of them (posted with
+    `post_many`), which are taken whole. A None item is a wake-up sentinel and
+    stops the gathering.
+
+    Returns:
+        tuple: (items, got_sentinel)
+    """
+    items = list(first) if isinstance(first, list) else [first]
+    deadline = time.time() + linger
+    while len(items) < max_size:
+        timeout = deadline - time.time()
+        try:
+            if timeout > 0:
+                item = work_queue.get(block=True, timeout=timeout)
+            else:
+                item = work_queue.get(block=False)
+        except queue.Empty:
+            break
+        if item is None:
+            return items, True
+        if isinstance(item, list):
+            items.extend(item)
+        else:
+            items.append(item)
+    return items, False
+
+
+def _call_handle_batch(actor, messages):
+    """
+    Calls `actor.handle_batch` and fans its results out per message.
+
+    Method calls requested by the executor are not part of the vectorized
+    batch, they split it into consecutive runs that keep the message order.
+
+    Returns:
+        list: an (exception, result) pair for each message
+    """
+    outcomes = []
+    run = []
+    for message in messages:
+        if type(message) is _ActorMethodCall:
+            outcomes.extend(_call_handle_run(actor, run))
+            run = []
+            try:
+                outcomes.append((None, _dispatch(actor, message)))
+            except BaseException as e:
+                outcomes.append((e, None))
+        else:
+            run.append(message)
+    outcomes.extend(_call_handle_run(actor, run))
+    return outcomes
+
+
+def _call_handle_run(actor, messages):
+    if not messages:
+        return []
+    try:
+        results = actor.handle_batch(messages)
+        results = list(results)
+        if len(results) != len(messages):
+            raise ValueError(
+                'handle_batch returned {} results for {} messages'.format(
+                    len(results), len(messages)))
+    except BaseException as e:
+        return [(e, None)] * len(messages)
+    return [(r, None) if isinstance(r, BaseException) else (None, r)
+            for r in results]
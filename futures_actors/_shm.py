@@ -0,0 +1,167 @@
+"""
+Shared memory transport for ProcessActor messages and results.
+
+Objects are pickled with protocol 5. Large out-of-band buffers (the data of
+contiguous numpy arrays, or any buffer wrapped in a `pickle.PickleBuffer`) are
+not written into the pickle stream, instead they are copied once into a
+`multiprocessing.shared_memory` segment. Only the small pickle stream and the
+name of the segment travel through the multiprocessing queues. The receiver
+rebuilds the object directly on top of the shared memory, so the buffer data
+is never copied again.
+
+Plain bytes and bytearray objects are always pickled in-band (the C pickler
+does not let us intercept them). Wrap them in a `pickle.PickleBuffer` to send
+them through shared memory, they arrive as a memoryview.
+
+Segment lifetime:
+    * The side that creates a segment only keeps its name. It is unlinked
+      once the receiver no longer needs the name: for messages when the
+      Future resolves, for results as soon as the parent attached to it.
+    * The receiving side keeps its mapping open for as long as objects
+      built on it are alive. Released mappings are closed lazily by
+      `release_segments`.
+
+Requires python 3.8+.
+"""
+import pickle
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+
+# Buffers are placed at aligned offsets so they are suitable for SIMD loads
+_ALIGNMENT = 64
+
+# Segments mapped by this process that objects may still be built on
+_attached_segments = []
+
+
+class ShmPayload(object):
+    """
+    A pickled object whose large buffers live in a shared memory segment.
+
+    Attributes:
+        data (bytes): the protocol 5 pickle stream
+        name (str | None): name of the segment holding the out-of-band
+            buffers, or None if the object had no large buffers.
+        spans (List[Tuple[int, int]]): offset and size of each buffer
+    """
+    __slots__ = ('data', 'name', 'spans')
+
+    def __init__(self, data, name=None, spans=()):
+        self.data = data
+        self.name = name
+        self.spans = spans
+
+    def __getstate__(self):
+        return (self.data, self.name, self.spans)
+
+    def __setstate__(self, state):
+        self.data, self.name, self.spans = state
+
+    def load(self, unlink=False):
+        """
+        Rebuilds the object on top of the shared memory segment.
+
+        Args:
+            unlink (bool): if True, also remove the name of the segment. The
+                memory stays available until the last mapping is closed.
+        """
+        if self.name is None:
+            return pickle.loads(self.data)
+        release_segments()
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            buffers = [shm.buf[start:start + size]
+                       for start, size in self.spans]
+            obj = pickle.loads(self.data, buffers=buffers)
+            del buffers
+        finally:
+            if unlink:
+                shm.unlink()
+        _attached_segments.append(shm)
+        return obj
+
+    def unlink(self):
+        """
+        Removes the segment created for this payload. Safe to call more than
+        once.
+        """
+        if self.name is not None:
+            name, self.name = self.name, None
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                return
+            shm.close()
+            shm.unlink()
+
+
+def dumps(obj, threshold):
+    """
+    Pickles `obj`, moving every buffer of at least `threshold` bytes into a
+    newly created shared memory segment.
+
+    Returns:
+        ShmPayload
+    """
+    buffers = []
+
+    def buffer_callback(buf):
+        if buf.raw().nbytes < threshold:
+            # Serialize small buffers in-band
+            return True
+        buffers.append(buf)
+        return False
+
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+    if not buffers:
+        return ShmPayload(data)
+
+    raws = [buf.raw() for buf in buffers]
+    spans = []
+    offset = 0
+    for raw in raws:
+        spans.append((offset, raw.nbytes))
+        offset += -(-raw.nbytes // _ALIGNMENT) * _ALIGNMENT
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for raw, (start, size) in zip(raws, spans):
+            shm.buf[start:start + size] = raw
+    finally:
+        for raw in raws:
+            raw.release()
+        del raws
+        # The creator does not need the mapping, only the name
+        shm.close()
+    return ShmPayload(data, shm.name, spans)
+
+
+def loads(payload, unlink=False):
+    """
+    Inverse of `dumps`. Objects that are not payloads are returned as-is.
+    """
+    if isinstance(payload, ShmPayload):
+        return payload.load(unlink=unlink)
+    return payload
+
+
+def release_segments():
+    """
+    Closes the mappings of received segments that no object refers to
+    anymore.
+    """
+    for shm in list(_attached_segments):
+        try:
+            shm.close()
+        except BufferError:
+            # Something built on this segment is still alive
+            continue
+        _attached_segments.remove(shm)
+
+
+def ensure_tracker_running():
+    """
+    Starts the resource tracker before the actor process is created so parent
+    and child share it. Otherwise the child would start its own tracker,
+    which unlinks the segments the child created when the child exits.
+    """
+    resource_tracker.ensure_running()
@@ -0,0 +1,223 @@
+"""
+Implements ActorRef, a picklable reference to an actor.
+
+A reference obtained with `executor.ref()` can be put inside a message to
+another actor, which can then `post` or `tell` to the referenced actor
+directly. For a ProcessActor, each process that uses a reference opens one
+connection straight to the actor process, so actor-to-actor traffic does not
+go through (and is not pickled by) the process that owns the executors.
+"""
+from concurrent.futures import _base
+from futures_actors import process_actor
+from multiprocessing import connection
+import multiprocessing
+import os
+import threading
+import weakref
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+# Executors of this process that handed out references, by address
+_local_executors = weakref.WeakValueDictionary()
+
+# Open connections of this process to actor processes, by address
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+class ActorRef(object):
+    """
+    A reference to an actor that can be sent to other actors in messages.
+
+    In the process that owns the executor, a reference simply posts to the
+    executor. Anywhere else (e.g. inside another ProcessActor) it sends
+    messages to the referenced actor process over a direct connection, and
+    the results come back over that same connection.
+
+    References to ThreadActors cannot leave the process the actor lives in.
+
+    Example:
+        >>> from futures_actors import ProcessActor, ThreadActor
+        >>> class Doubler(ThreadActor):
+        >>>     def handle(self, message):
+        >>>         return message * 2
+        >>> class Stage(ThreadActor):
+        >>>     def handle(self, message):
+        >>>         next_stage, value = message
+        >>>         return next_stage.post(value + 1).result()
+        >>> #
+        >>> with Doubler.executor() as doubler, Stage.executor() as stage:
+        >>>     assert stage.post((doubler.ref(), 4)).result() == 10
+    """
+
+    def __init__(self, address=None, executor=None, owner_pid=None):
+        self._address = address
+        self._executor = executor
+        self._owner_pid = os.getpid() if owner_pid is None else owner_pid
+
+    @classmethod
+    def _for_executor(cls, executor, address=None):
+        if address is not None:
+            _local_executors[address] = executor
+        return cls(address, executor)
+
+    def __reduce__(self):
+        if self._address is None:
+            raise TypeError(
+                'A reference to a ThreadActor cannot leave its process')
+        return (_rebuild_ref, (self._address, self._owner_pid))
+
+    def __eq__(self, other):
+        if not isinstance(other, ActorRef):
+            return NotImplemented
+        if self._address is None or other._address is None:
+            return self._executor is other._executor
+        return self._address == other._address
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._address is None:
+            return hash(id(self._executor))
+        return hash(self._address)
+
+    def __repr__(self):
+        if self._address is None:
+            return '<ActorRef to {!r}>'.format(self._executor)
+        return '<ActorRef to {!r}>'.format(self._address)
+
+    def post(self, message):
+        """
+        Sends a message to the referenced actor and returns a Future.
+        """
+        if self._executor is not None:
+            return self._executor.post(message)
+        return _get_connection(self._address).post(message)
+
+    def tell(self, message):
+        """
+        Sends a message to the referenced actor without tracking its result.
+        """
+        if self._executor is not None:
+            self._executor.tell(message)
+        else:
+            _get_connection(self._address).tell(message)
+
+
+def _rebuild_ref(address, owner_pid):
+    executor = None
+    if os.getpid() == owner_pid:
+        # Back in the owning process, use the executor itself
+        executor = _local_executors.get(address, None)
+    return ActorRef(address, executor, owner_pid)
+
+
+class _RefConnection(object):
+    """
+    Client end of a direct connection to an actor process.
+
+    Results of posted messages come back on the same connection and are read
+    by a thread that is only started once a message is posted, so references
+    that are only told to cost no thread.
+    """
+
+    def __init__(self, address):
+        self._address = address
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._count = 0
+        self._reader = None
+        self._broken = False
+        try:
+            self._conn = connection.Client(
+                address, authkey=multiprocessing.current_process().authkey)
+        except (OSError, IOError):
+            raise process_actor.BrokenProcessPool(
+                'The referenced actor is not running anymore')
+
+    def _send(self, call_id, message):
+        if self._broken:
+            raise process_actor.BrokenProcessPool(
+                'The referenced actor is not running anymore')
+        data = process_actor._dumps((call_id, message))
+        try:
+            self._conn.send_bytes(data)
+        except (OSError, IOError):
+            self._broken = True
+            _forget_connection(self)
+            raise process_actor.BrokenProcessPool(
+                'The referenced actor is not running anymore')
+
+    def post(self, message):
+        f = _base.Future()
+        f.set_running_or_notify_cancel()
+        with self._lock:
+            call_id = self._count
+            self._count += 1
+            self._futures[call_id] = f
+            try:
+                self._send(call_id, message)
+            except BaseException as e:
+                del self._futures[call_id]
+                f.set_exception(e)
+                return f
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._read_results)
+                self._reader.daemon = True
+                self._reader.start()
+        return f
+
+    def tell(self, message):
+        with self._lock:
+            self._send(None, message)
+
+    def _read_results(self):
+        while True:
+            try:
+                result_item = self._conn.recv()
+            except (EOFError, OSError, IOError):
+                break
+            with self._lock:
+                f = self._futures.pop(result_item.work_id, None)
+            if f is not None:
+                if result_item.exception:
+                    f.set_exception(result_item.exception)
+                else:
+                    f.set_result(result_item.result)
+            del result_item, f
+        with self._lock:
+            self._broken = True
+            futures = list(self._futures.values())
+            self._futures.clear()
+        _forget_connection(self)
+        for f in futures:
+            f.set_exception(process_actor.BrokenProcessPool(
+                'The referenced actor stopped before answering'))
+
+
+def _get_connection(address):
+    with _connections_lock:
+        conn = _connections.get(address, None)
+        if conn is None:
+            conn = _connections[address] = _RefConnection(address)
+        return conn
+
+
+def _forget_connection(conn):
+    # The next use of the address connects again
+    with _connections_lock:
+        if _connections.get(conn._address, None) is conn:
+            del _connections[conn._address]
+
+
+def _forget_connections():
+    # A forked child must not share the sockets of its parent
+    global _connections_lock
+    _connections.clear()
+    _connections_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_connections)
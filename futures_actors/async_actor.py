@@ -0,0 +1,422 @@
+"""
+Implements AsyncActor and AsyncProcessActor, actors driven by an asyncio
+event loop instead of a dedicated thread (python 3.7+).
+
+Their executors provide `apost(message)`, which returns an asyncio Future
+bound to the executor's loop, so asyncio code can `await` results directly
+instead of wrapping concurrent Futures (and paying a thread hop per message).
+The thread-safe `post` of ActorExecutor is still available and returns a
+concurrent Future.
+"""
+from concurrent.futures import _base
+from futures_actors import _base_actor
+from futures_actors import process_actor
+import asyncio
+import atexit
+import collections
+import threading
+import weakref
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+# Process actors that still need to be told to stop when the interpreter exits
+_live_process_executors = weakref.WeakSet()
+
+
+def _copy_future_state(source, dest):
+    """
+    Copies the outcome of the asyncio Future `source` into the concurrent
+    Future `dest`.
+    """
+    if dest.cancelled():
+        return
+    if source.cancelled():
+        dest.cancel()
+        dest.set_running_or_notify_cancel()
+    elif source.exception() is not None:
+        dest.set_exception(source.exception())
+    else:
+        dest.set_result(source.result())
+
+
+class _AsyncExecutorBase(_base_actor.ActorExecutor):
+    """
+    Code shared by the asyncio executors. Subclasses implement `apost` and
+    `_close`, which are only ever called from the loop thread.
+    """
+
+    def __init__(self, loop):
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                raise RuntimeError(
+                    'asyncio executors must be created in a coroutine or be '
+                    'given the loop of the actor as _loop') from None
+        self._loop = loop
+        self._shutdown = False
+        self._shutdown_lock = threading.Lock()
+        # Resolved once the actor has stopped
+        self._closed = _base.Future()
+
+    def _in_loop_thread(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def apost(self, message):
+        """
+        Sends a message to the actor and returns an asyncio Future. Must be
+        called from the executor's event loop.
+        """
+        raise NotImplementedError  # nocover
+
+    def post(self, message):
+        f = _base.Future()
+
+        def _post():
+            try:
+                afut = self.apost(message)
+            except BaseException as ex:
+                f.set_exception(ex)
+            else:
+                afut.add_done_callback(
+                    lambda afut: _copy_future_state(afut, f))
+                f.add_done_callback(
+                    lambda f: f.cancelled() and
+                    self._loop.call_soon_threadsafe(afut.cancel))
+
+        with self._shutdown_lock:
+            if self._shutdown:
+                raise RuntimeError(
+                    'cannot schedule new futures after shutdown')
+            if self._in_loop_thread():
+                _post()
+            else:
+                self._loop.call_soon_threadsafe(_post)
+        return f
+    post.__doc__ = _base_actor.ActorExecutor.post.__doc__
+
+    def shutdown(self, wait=True):
+        """
+        Stops the actor once it has handled its pending messages.
+
+        When called from the loop thread this cannot block the loop, so `wait`
+        is ignored. Use `await executor.ashutdown()` there instead.
+        """
+        with self._shutdown_lock:
+            if not self._shutdown:
+                self._shutdown = True
+                if self._in_loop_thread():
+                    self._close()
+                else:
+                    self._loop.call_soon_threadsafe(self._close)
+        if wait and not self._in_loop_thread():
+            self._closed.result()
+
+    async def ashutdown(self):
+        """
+        Stops the actor once it has handled its pending messages and waits
+        for it to finish.
+        """
+        self.shutdown(wait=False)
+        await asyncio.wrap_future(self._closed, loop=self._loop)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.ashutdown()
+        return False
+
+
+async def _async_actor_eventloop(mailbox, _ActorClass, args, kwargs):
+    """
+    actor event loop run as a task on an asyncio loop.
+
+    Creates the instance of the actor (passing in the required *args, and
+    **kwargs) and feeds it the messages from the mailbox. Coroutine handlers
+    are awaited, so one slow handler does not block the rest of the loop,
+    but the actor still handles one message at a time.
+    """
+    actor = _ActorClass(*args, **kwargs)
+    while True:
+        item = await mailbox.get()
+        if item is None:
+            return
+        future, message = item
+        if future.cancelled():
+            continue
+        try:
+            result = _base_actor._call_actor(actor, message)
+            if _base_actor._isawaitable(result):
+                result = await result
+        except Exception as ex:
+            if not future.cancelled():
+                future.set_exception(ex)
+        except BaseException as ex:
+            # Ends the actor, _on_task_done fails the queued messages
+            if not future.cancelled():
+                future.set_exception(ex)
+            raise
+        else:
+            if not future.cancelled():
+                future.set_result(result)
+        del item, future, message
+
+
+class AsyncActorExecutor(_AsyncExecutorBase):
+    """
+    Manages a single actor that lives on an asyncio event loop.
+
+    Args:
+        _loop (asyncio.AbstractEventLoop, default=None): the loop that runs the
+            actor. Defaults to the running loop, and is required when the
+            executor is created outside of a coroutine.
+    """
+
+    def __init__(self, _ActorClass, *args, **kwargs):
+        _AsyncExecutorBase.__init__(self, kwargs.pop('_loop', None))
+        self._ActorClass = _ActorClass
+        self._args = args
+        self._kwargs = kwargs
+        self._mailbox = None
+        self._task = None
+
+    def _initialize_actor(self):
+        if self._task is None:
+            self._mailbox = asyncio.Queue()
+            self._task = self._loop.create_task(_async_actor_eventloop(
+                self._mailbox, self._ActorClass, self._args, self._kwargs))
+            self._task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task):
+        if task.cancelled():
+            error = asyncio.CancelledError('the actor task was cancelled')
+        else:
+            error = task.exception()
+            if error is not None:
+                _base.LOGGER.critical('Exception in actor', exc_info=(
+                    type(error), error, error.__traceback__))
+        if error is not None:
+            # Nobody is going to answer the remaining messages
+            while not self._mailbox.empty():
+                item = self._mailbox.get_nowait()
+                if item is not None and not item[0].done():
+                    item[0].set_exception(error)
+        self._closed.set_result(None)
+
+    def apost(self, message):
+        if self._shutdown:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        self._initialize_actor()
+        future = self._loop.create_future()
+        self._mailbox.put_nowait((future, message))
+        return future
+    apost.__doc__ = _AsyncExecutorBase.apost.__doc__
+
+    def _close(self):
+        if self._task is None:
+            self._closed.set_result(None)
+        else:
+            self._mailbox.put_nowait(None)
+
+
+class AsyncProcessActorExecutor(_AsyncExecutorBase):
+    """
+    Manages a single actor living in a separate process, feeding its results
+    back to an asyncio event loop.
+
+    Unlike ProcessActorExecutor there is no queue management thread: the
+    result pipe and the process sentinel are watched by the event loop itself
+    (with `loop.add_reader`, so a selector based loop is required).
+
+    Args:
+        _loop (asyncio.AbstractEventLoop, default=None): the loop the results
+            are delivered to. Defaults to the running loop, and is required
+            when the executor is created outside of a coroutine.
+        _pipeline_depth (int, default=1): number of messages that may be
+            queued in the child while the actor handles the current one.
+    """
+
+    def __init__(self, _ActorClass, *args, **kwargs):
+        _AsyncExecutorBase.__init__(self, kwargs.pop('_loop', None))
+        pipeline_depth = kwargs.pop('_pipeline_depth', 1)
+        if pipeline_depth < 1:
+            raise ValueError('_pipeline_depth must be at least 1')
+        self._ActorClass = _ActorClass
+        self._args = args
+        self._kwargs = kwargs
+        # The message being handled plus the ones queued behind it
+        self._max_inflight = pipeline_depth + 1
+        self._n_inflight = 0
+        self._queue_count = 0
+        self._pending_work_items = {}
+        self._work_ids = collections.deque()
+        self._broken = False
+        # Set once the actor process acknowledged a clean shutdown
+        self._clean_exit = False
+        self._manager = None
+
+    def _initialize_actor(self):
+        if self._manager is None:
+            self._manager = process_actor._ActorProcess(
+                self._ActorClass, self._args, self._kwargs, {})
+            self._loop.add_reader(self._manager.result_conn.fileno(),
+                                  self._on_results_ready)
+            self._loop.add_reader(self._manager.sentinel, self._on_exit)
+            _live_process_executors.add(self)
+
+    def apost(self, message):
+        if self._broken:
+            raise process_actor.BrokenProcessPool(
+                'A child process terminated '
+                'abruptly, the process pool is not usable anymore')
+        if self._shutdown:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        self._initialize_actor()
+        future = self._loop.create_future()
+        self._pending_work_items[self._queue_count] = (future, message)
+        self._work_ids.append(self._queue_count)
+        self._queue_count += 1
+        self._add_call_items()
+        return future
+    apost.__doc__ = _AsyncExecutorBase.apost.__doc__
+
+    def _add_call_items(self):
+        """
+        Moves messages to the child until the pipeline is full. Messages that
+        were cancelled before being sent are dropped.
+        """
+        while self._n_inflight < self._max_inflight and self._work_ids:
+            work_id = self._work_ids.popleft()
+            future, message = self._pending_work_items[work_id]
+            if future.cancelled():
+                del self._pending_work_items[work_id]
+                continue
+            try:
+                self._manager.send(process_actor._CallItem(work_id, message))
+            except (OSError, IOError):
+                # The actor died, _on_exit fails the other pending messages
+                self._broken = True
+                del self._pending_work_items[work_id]
+                future.set_exception(process_actor.BrokenProcessPool(
+                    'The actor process was terminated abruptly, the future '
+                    'could not be sent to it.'))
+                continue
+            except BaseException as ex:
+                del self._pending_work_items[work_id]
+                future.set_exception(ex)
+                continue
+            self._n_inflight += 1
+
+    def _set_result(self, result_item):
+        item = self._pending_work_items.pop(result_item.work_id, None)
+        if item is not None and not item[0].cancelled():
+            if result_item.exception:
+                item[0].set_exception(result_item.exception)
+            else:
+                item[0].set_result(result_item.result)
+
+    def _on_results_ready(self):
+        result_conn = self._manager.result_conn
+        while result_conn.poll():
+            try:
+                result_item = result_conn.recv()
+            except EOFError:
+                break
+            if isinstance(result_item, int):
+                # Clean shutdown of the actor, the sentinel follows
+                self._clean_exit = True
+                continue
+            if isinstance(result_item, list):
+                # A batching actor answers several messages at once
+                self._n_inflight -= len(result_item)
+                for batch_result_item in result_item:
+                    self._set_result(batch_result_item)
+            else:
+                self._n_inflight -= 1
+                self._set_result(result_item)
+        if self._shutdown and not self._work_ids and not self._n_inflight:
+            self._stop_actor()
+        else:
+            self._add_call_items()
+
+    def _on_exit(self):
+        # Results sent right before the process exited are still readable
+        self._on_results_ready()
+        self._loop.remove_reader(self._manager.result_conn.fileno())
+        self._loop.remove_reader(self._manager.sentinel)
+        self._manager.close()
+        # The actor cannot be posted to anymore. Unless it was asked to stop,
+        # the process died and the executor is broken.
+        self._shutdown = True
+        if not self._clean_exit:
+            self._broken = True
+        for future, _ in self._pending_work_items.values():
+            if not future.done():
+                future.set_exception(process_actor.BrokenProcessPool(
+                    'The actor process was terminated abruptly while '
+                    'the future was running or pending.'))
+        self._pending_work_items.clear()
+        self._work_ids.clear()
+        _live_process_executors.discard(self)
+        self._closed.set_result(None)
+
+    def _close(self):
+        if self._manager is None:
+            self._closed.set_result(None)
+        elif not self._work_ids and not self._n_inflight:
+            self._stop_actor()
+
+    def _stop_actor(self):
+        try:
+            self._manager.send(None)
+        except (OSError, IOError):
+            pass
+
+
+class AsyncActor(_base_actor.Actor):
+    """
+    An actor that lives on an asyncio event loop. Its `handle` method may be
+    a coroutine function.
+
+    Example:
+        >>> import asyncio
+        >>> from futures_actors.async_actor import *  # NOQA
+        >>> class Greeter(AsyncActor):
+        >>>     async def handle(self, message):
+        >>>         await asyncio.sleep(0)
+        >>>         return 'hello ' + message
+        >>> #
+        >>> async def main():
+        >>>     async with Greeter.executor() as executor:
+        >>>         return await executor.apost('world')
+        >>> assert asyncio.run(main()) == 'hello world'
+    """
+
+    @classmethod
+    def executor(cls, *args, **kwargs):
+        return AsyncActorExecutor(cls, *args, **kwargs)
+
+
+class AsyncProcessActor(_base_actor.Actor):
+    """
+    An actor that lives in a separate process and delivers its results to an
+    asyncio event loop. Its `handle` method may be a coroutine function, in
+    which case it is run to completion on an event loop in the child.
+    """
+
+    @classmethod
+    def executor(cls, *args, **kwargs):
+        return AsyncProcessActorExecutor(cls, *args, **kwargs)
+
+
+@atexit.register
+def _python_exit():
+    # Let the actor processes drain their queues and exit, otherwise
+    # multiprocessing would wait for them forever when joining its children.
+    for executor in list(_live_process_executors):
+        executor._stop_actor()
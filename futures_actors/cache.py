@@ -0,0 +1,158 @@
+"""
+Result caches of the actor executors.
+
+Actors that answer lookups are often posted the same message by several
+callers within milliseconds. Executors created with a `_cache_key` (a
+function mapping a message to a hashable key, or to None for messages that
+must not be cached) put a cache in front of their actor:
+
+    * Single-flight: a message posted while a message with the same key is
+      in flight gets the Future of that message, so the actor handles it
+      once.
+    * Memoization: the results of the last `_cache_size` keys (default 1024)
+      are kept, and the least recently used ones are evicted first. They
+      expire after `_cache_ttl` seconds (default never). Posting a message
+      with a cached key returns a resolved Future right away, the message
+      never reaches the actor (nor its process).
+
+Exceptions are shared by the posts of a message in flight but they are not
+cached, and neither are cancelled messages. `_cache_size=0` only coalesces
+the messages in flight.
+
+A Future of the cache may be shared by several callers, who all get the
+same result object, so it cannot be cancelled: `cancel()` returns False.
+Only `post` (and `post_many`) go through the cache, told messages and the
+calls to actor methods that executors make for their own needs (e.g. the
+state migration of a ShardedActorExecutor) always reach the actor.
+`executor.stats()` reports the `cache_hits`, `cache_coalesced` and
+`cache_misses` of the posts and the number of `cache_entries`.
+"""
+from concurrent.futures import _base
+from futures_actors import _base_actor
+import collections
+import threading
+import time
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+class _ResultCache(object):
+    """
+    Single-flight and LRU cache of the results of an executor
+
+    Args:
+        key (Callable): maps a message to its key, None to bypass the cache
+        size (int): maximum number of cached results
+        ttl (float | None): seconds a result is cached for, None for no limit
+
+    Example:
+        >>> from futures_actors.tests import TestThreadActor
+        >>> key = lambda message: message['action']
+        >>> executor = TestThreadActor.executor(_cache_key=key)
+        >>> f1 = executor.post({'action': 'hello world'})
+        >>> f2 = executor.post({'action': 'hello world'})
+        >>> assert f1.result() == 'hello world'
+        >>> f3 = executor.post({'action': 'hello world'})
+        >>> assert f1 is f2 is f3
+        >>> executor.shutdown(wait=True)
+    """
+
+    def __init__(self, key, size=1024, ttl=None):
+        if size < 0:
+            raise ValueError('_cache_size must be at least 0')
+        self.key = key
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Maps keys to (Future, expiry time), least recently used first
+        self._results = collections.OrderedDict()
+        # Maps keys to the Futures of the messages in flight
+        self._inflight = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def post(self, message, post, *args):
+        """
+        Returns the Future of the cached or in flight message with the same
+        key as `message`, or calls `post(message, *args)` and caches it.
+        """
+        if type(message) is _base_actor._ActorMethodCall:
+            return post(message, *args)
+        key = self.key(message)
+        if key is None:
+            return post(message, *args)
+        with self._lock:
+            entry = self._results.pop(key, None)
+            if entry is not None:
+                if entry[1] is None or entry[1] > time.time():
+                    # Most recently used
+                    self._results[key] = entry
+                    self.hits += 1
+                    return entry[0]
+            future = self._inflight.get(key, None)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            self.misses += 1
+            future = self._inflight[key] = _base.Future()
+            # Shared by the callers, so none of them can cancel it
+            future.set_running_or_notify_cancel()
+        try:
+            inner = post(message, *args)
+        except BaseException as e:
+            future.set_exception(e)
+            self._done(key, future, cacheable=False)
+            raise
+        inner.add_done_callback(
+            lambda inner: self._transfer(key, future, inner))
+        return future
+
+    def _transfer(self, key, future, inner):
+        """
+        Resolves the shared Future with the one of the actor
+        """
+        if inner.cancelled():
+            future.set_exception(_base.CancelledError())
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+            self._done(key, future, cacheable=True)
+            return
+        self._done(key, future, cacheable=False)
+
+    def _done(self, key, future, cacheable):
+        with self._lock:
+            if self._inflight.get(key, None) is future:
+                del self._inflight[key]
+            if cacheable and self.size:
+                expires_at = None
+                if self.ttl is not None:
+                    expires_at = time.time() + self.ttl
+                self._results.pop(key, None)
+                self._results[key] = (future, expires_at)
+                while len(self._results) > self.size:
+                    self._results.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'cache_hits': self.hits,
+                    'cache_coalesced': self.coalesced,
+                    'cache_misses': self.misses,
+                    'cache_entries': len(self._results)}
+
+
+def _pop_cache_options(kwargs):
+    """
+    Removes the cache options from the keyword arguments of an executor.
+
+    Returns:
+        _ResultCache | None: None if the executor has no cache
+    """
+    key = kwargs.pop('_cache_key', None)
+    size = kwargs.pop('_cache_size', 1024)
+    ttl = kwargs.pop('_cache_ttl', None)
+    if key is None:
+        return None
+    return _ResultCache(key, size, ttl)
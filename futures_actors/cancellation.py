@@ -0,0 +1,163 @@
+"""
+Cancellation of the messages an actor is handling.
+
+A Future can normally be cancelled only while its message waits in the
+executor: once a ProcessActor sent it to its process (or a ThreadActor
+started it), `cancel()` returns False and the actor handles it to the end.
+Executors created with `_cancellable=True` return Futures that can also be
+cancelled afterwards:
+
+    * `future.cancel()` resolves the Future as cancelled right away. For a
+      ProcessActor, a cancel signal is sent to the actor process through its
+      call pipe, where the thread receiving the call items picks it up while
+      the actor is busy.
+    * Inside `handle`, `self.cancelled()` then returns True. A handler doing
+      long work checks it regularly and returns early, which frees the actor
+      for the next message. Whatever it returns is dropped.
+    * A message cancelled before the actor started it is skipped.
+    * `_cancel_timeout` (ProcessActor only) is the number of seconds a
+      handler has to notice that its message was cancelled. If it is still
+      handling it by then, the actor process is killed and restarted, and the
+      messages that were sent to it after the cancelled one are sent again to
+      the new process. The state of the actor is lost, as after a crash.
+
+Without `_cancellable`, the Futures and the event loops are the usual ones
+and cancelling costs nothing. `handle_batch` and streamed messages do not
+see cancellations (streams are stopped with `stream.close()`).
+"""
+from concurrent.futures import _base
+import threading
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+class _CancellableFuture(_base.Future):
+    """
+    Future that can also be cancelled while the actor handles its message.
+    `_cancel_running` is called once it was cancelled that way, and tells the
+    actor.
+
+    Example:
+        >>> import time
+        >>> from futures_actors import ProcessActor
+        >>> class Sleeper(ProcessActor):
+        >>>     def handle(self, seconds):
+        >>>         deadline = time.time() + seconds
+        >>>         while time.time() < deadline:
+        >>>             if self.cancelled():
+        >>>                 return 'stopped early'
+        >>>             time.sleep(0.01)
+        >>>         return 'slept'
+        >>> executor = Sleeper.executor(_cancellable=True)
+        >>> f = executor.post(60)
+        >>> while not f.running():
+        >>>     time.sleep(0.01)
+        >>> assert f.cancel() and f.cancelled()
+        >>> executor.post(0).result()
+        'slept'
+        >>> executor.shutdown(wait=True)
+    """
+    _cancel_running = None
+
+    def cancel(self):
+        with self._condition:
+            if self._state != _base.RUNNING:
+                running = False
+            else:
+                running = True
+                # Like a Future cancelled before it ran, whose waiters have
+                # been notified
+                self._state = _base.CANCELLED_AND_NOTIFIED
+                for waiter in self._waiters:
+                    waiter.add_cancelled(self)
+                self._condition.notify_all()
+        if not running:
+            return _base.Future.cancel(self)
+        self._cancel_running()
+        self._invoke_callbacks()
+        return True
+
+
+class _CancelSignal(object):
+    """
+    Tells the actor process that the message with this work id was cancelled
+    """
+
+    def __init__(self, work_id):
+        self.work_id = work_id
+
+
+class _CancelScope(object):
+    """
+    The cancelled messages of an actor, looked up by `Actor.cancelled`.
+    Messages are identified by a key: their work id in an actor process, or
+    their work item in a ThreadActor.
+
+    Cancellations are recorded only for the messages the actor received and
+    did not finish yet, so the late signals of messages that were already
+    handled are ignored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._received = set()
+        self._cancelled = set()
+        self.current = None
+
+    def receive(self, key):
+        with self._lock:
+            self._received.add(key)
+
+    def cancel(self, key):
+        with self._lock:
+            if key in self._received:
+                self._cancelled.add(key)
+
+    def start(self, key):
+        """
+        Marks the message the actor handles now.
+
+        Returns:
+            bool: False if it was cancelled already and must be skipped
+        """
+        with self._lock:
+            self._received.add(key)
+            self.current = key
+            return key not in self._cancelled
+
+    def finish(self):
+        with self._lock:
+            self._received.discard(self.current)
+            self._cancelled.discard(self.current)
+            self.current = None
+
+    def forget(self, keys):
+        """
+        Forgets messages that were handled without `start` and `finish`, such
+        as the batches given to `handle_batch`
+        """
+        with self._lock:
+            self._received.difference_update(keys)
+            self._cancelled.difference_update(keys)
+
+    def is_cancelled(self):
+        current = self.current
+        return current is not None and current in self._cancelled
+
+
+def _pop_cancel_options(kwargs):
+    """
+    Removes the cancellation options from the keyword arguments of an
+    executor.
+
+    Returns:
+        tuple: (cancellable, cancel_timeout). A timeout implies the messages
+            are cancellable.
+    """
+    cancellable = kwargs.pop('_cancellable', False)
+    timeout = kwargs.pop('_cancel_timeout', None)
+    if timeout is not None:
+        if timeout < 0:
+            raise ValueError('_cancel_timeout must be at least 0')
+        cancellable = True
+    return cancellable, timeout
@@ -0,0 +1,182 @@
+"""
+Checkpoints of the state of ProcessActors.
+
+The state of an actor only lives in its instance, so it is lost with its
+process. An actor that defines `snapshot` and `restore` can be checkpointed:
+an executor created with `_checkpoint=path` makes its actor process write
+`actor.snapshot()` to `path` every `_checkpoint_interval` seconds (default
+60), and once more when the actor stops. Only actors that handled messages
+since their last checkpoint are written again.
+
+When the actor process starts and `path` exists, the actor is created with
+its arguments as usual and then `actor.restore(state)` is called with the
+state of the latest checkpoint. A crashed actor restarted by its supervisor
+therefore resumes from its latest checkpoint rather than from a fresh
+instance, and an actor can be moved to another process (or machine sharing
+the file) by shutting down its executor and creating a new one with the same
+path.
+
+Checkpoints are written to a temporary file that then replaces `path`, so a
+crash never leaves a partial checkpoint behind (they are not synced to disk,
+though, so they may not survive a power loss). On python 3.8+ the state is
+pickled with protocol 5, and large out-of-band buffers (the data of numpy
+arrays, or any buffer wrapped in a `pickle.PickleBuffer`) are stored aligned
+after the pickle. `load` maps the file in memory (copy-on-write) and numpy
+arrays are rebuilt on top of the mapping, so restoring large arrays costs no
+copy and their pages are only read from disk when they are used.
+
+If `snapshot` raises, the checkpoint is skipped. If `restore` raises, the
+actor starts from a fresh instance. Both errors are logged.
+"""
+from concurrent.futures import _base
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+_MAGIC = b'FACKPT1\n'
+# Length of the pickle and number of out-of-band buffers
+_HEADER = struct.Struct('<QQ')
+# Offset and length of a buffer
+_ENTRY = struct.Struct('<QQ')
+# Buffers start at multiples of this many bytes
+_ALIGN = 64
+
+_HAS_PROTOCOL_5 = sys.version_info[0:2] >= (3, 8)
+
+
+def _padding(offset):
+    return -offset % _ALIGN
+
+
+def save(path, state):
+    """
+    Writes `state` to the checkpoint file `path`, replacing it atomically.
+
+    Args:
+        path (str): the checkpoint file
+        state (object): any picklable object
+    """
+    buffers = []
+    if _HAS_PROTOCOL_5:
+        data = pickle.dumps(state, protocol=5,
+                            buffer_callback=buffers.append)
+        buffers = [b.raw() for b in buffers]
+    else:
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+    offset = (len(_MAGIC) + _HEADER.size + _ENTRY.size * len(buffers) +
+              len(data))
+    entries = []
+    for buf in buffers:
+        offset += _padding(offset)
+        entries.append((offset, buf.nbytes))
+        offset += buf.nbytes
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as file:
+        file.write(_MAGIC)
+        file.write(_HEADER.pack(len(data), len(buffers)))
+        for entry in entries:
+            file.write(_ENTRY.pack(*entry))
+        file.write(data)
+        for (start, _), buf in zip(entries, buffers):
+            file.write(b'\0' * (start - file.tell()))
+            file.write(buf)
+    # python 2 has no atomic os.replace, but os.rename is atomic on POSIX
+    getattr(os, 'replace', os.rename)(tmp_path, path)
+
+
+def load(path):
+    """
+    Reads the state in the checkpoint file `path`. Out-of-band buffers are
+    memoryviews of a copy-on-write mapping of the file: changing them does
+    not change the file.
+
+    Returns:
+        object: the state passed to `save`
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('{} is not a checkpoint file'.format(path))
+        n_data, n_buffers = _HEADER.unpack(file.read(_HEADER.size))
+        entries = [_ENTRY.unpack(file.read(_ENTRY.size))
+                   for _ in range(n_buffers)]
+        data = file.read(n_data)
+        if not n_buffers:
+            return pickle.loads(data)
+        mapping = memoryview(mmap.mmap(file.fileno(), 0,
+                                       access=mmap.ACCESS_COPY))
+    return pickle.loads(data, buffers=[mapping[start:start + length]
+                                       for start, length in entries])
+
+
+class _Checkpointer(object):
+    """
+    Writes the checkpoints of an actor, in its process
+
+    Args:
+        path (str): the checkpoint file
+        interval (float): minimum number of seconds between two checkpoints
+    """
+
+    def __init__(self, path, interval=60.0):
+        self.path = path
+        self.interval = interval
+        # True once messages were handled since the last checkpoint
+        self.dirty = False
+        self.written_at = time.time()
+
+    def restore(self, actor):
+        """
+        Restores the state of the latest checkpoint, if there is one.
+
+        Returns:
+            bool: False if the actor must be created again
+        """
+        if not os.path.exists(self.path):
+            return True
+        try:
+            actor.restore(load(self.path))
+        except BaseException:
+            _base.LOGGER.exception(
+                'Could not restore the checkpoint {}'.format(self.path))
+            return False
+        return True
+
+    def timeout(self):
+        """
+        Returns the number of seconds left before the next checkpoint, or
+        None if nothing happened since the last one.
+        """
+        if not self.dirty:
+            return None
+        return self.written_at + self.interval - time.time()
+
+    def write(self, actor):
+        self.dirty = False
+        self.written_at = time.time()
+        try:
+            save(self.path, actor.snapshot())
+        except BaseException:
+            _base.LOGGER.exception(
+                'Could not checkpoint the actor to {}'.format(self.path))
+
+
+def _pop_checkpoint_options(kwargs):
+    """
+    Removes the checkpoint options from the keyword arguments of an
+    executor.
+
+    Returns:
+        tuple | None: (path, interval), or None if the actor is not
+            checkpointed
+    """
+    path = kwargs.pop('_checkpoint', None)
+    interval = kwargs.pop('_checkpoint_interval', 60.0)
+    if path is None:
+        return None
+    return (os.fspath(path) if hasattr(os, 'fspath') else path, interval)
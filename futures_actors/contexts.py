@@ -0,0 +1,112 @@
+"""
+Start methods of the actor processes.
+
+By default actor processes are started with the default start method of
+`multiprocessing` ('fork' on Linux, 'spawn' on macOS and Windows). An
+executor created with `_mp_context` starts its actor with another method
+instead, given by name ('fork', 'spawn' or 'forkserver') or as a context
+returned by `multiprocessing.get_context`. With 'spawn' and 'forkserver' the
+actor class and its arguments must be picklable, and the actor class must be
+importable from its module.
+
+A spawned actor starts a fresh interpreter that imports the modules of the
+actor again, which can take seconds when they are heavy (numpy, models).
+`_preload` lists modules to import only once, in a template process that
+the actors are then forked from, already warm:
+
+    * With 'forkserver' (the default when `_preload` is given), the modules
+      are imported by the fork server of `multiprocessing`, which forks every
+      actor process started with that method.
+    * With 'fork', the modules are imported by the executor's process
+      itself, and the actors inherit them.
+
+The fork server is shared by the whole process and imports its modules when
+it starts, so modules preloaded by executors created after the first
+'forkserver' actor started are imported again by each of their actors (a
+RuntimeWarning says so). Pass every module to the first such executor, or
+call `preload` early.
+"""
+import importlib
+import multiprocessing
+import threading
+import warnings
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+START_METHODS = ('fork', 'spawn', 'forkserver')
+
+# The fork server imports these modules, and the ones preloaded so far
+_BASE_PRELOAD = ('futures_actors.process_actor',)
+_preloaded = set()
+_lock = threading.Lock()
+
+
+def preload(modules, method='forkserver'):
+    """
+    Imports `modules` once in the template process of `method`, so the
+    actors started with it get them without importing them again.
+
+    Args:
+        modules (List[str]): names of the modules
+        method (str): 'forkserver' or 'fork'
+
+    Returns:
+        multiprocessing.context.BaseContext: the context to start actors with
+    """
+    modules = list(modules)
+    if method == 'fork':
+        for name in modules:
+            importlib.import_module(name)
+        return multiprocessing.get_context('fork')
+    if method != 'forkserver':
+        raise ValueError(
+            "_preload requires the 'forkserver' or 'fork' start method, "
+            "got {!r}".format(method))
+    context = multiprocessing.get_context('forkserver')
+    with _lock:
+        missing = [name for name in modules if name not in _preloaded]
+        if _forkserver_running():
+            if missing:
+                warnings.warn(
+                    'The fork server already started, each actor will import '
+                    '{} itself'.format(', '.join(missing)), RuntimeWarning)
+        else:
+            _preloaded.update(missing)
+            context.set_forkserver_preload(
+                list(_BASE_PRELOAD) + sorted(_preloaded))
+    return context
+
+
+def _forkserver_running():
+    from multiprocessing import forkserver
+    return getattr(forkserver._forkserver, '_forkserver_pid', None) is not None
+
+
+def _pop_context_options(kwargs):
+    """
+    Removes the start method options from the keyword arguments of an
+    executor.
+
+    Returns:
+        multiprocessing.context.BaseContext | None: None if the actor starts
+            with the default method
+    """
+    context = kwargs.pop('_mp_context', None)
+    modules = kwargs.pop('_preload', None)
+    if context is None and modules is None:
+        return None
+    if not hasattr(multiprocessing, 'get_context'):
+        raise NotImplementedError(
+            '_mp_context and _preload require python 3.4+')
+    if isinstance(context, str):
+        if context not in START_METHODS:
+            raise KeyError('_mp_context must be one of {}, got {!r}'.format(
+                START_METHODS, context))
+        context = multiprocessing.get_context(context)
+    if modules is not None:
+        method = 'forkserver'
+        if context is not None:
+            method = context.get_start_method()
+        context = preload(modules, method)
+    return context
@@ -0,0 +1,427 @@
+"""
+Durable mailboxes of ProcessActors.
+
+The messages posted to a ProcessActor wait in the memory of the executor
+until their result arrives, so they are lost if the posting process dies.
+An executor created with `_journal=dirpath` also appends every posted or
+told message to a write-ahead log in `dirpath`, and acknowledges it once
+it is done with it:
+
+    * A posted message is acknowledged once its Future resolves: with the
+      result or the exception of the actor, or because it was cancelled,
+      dropped by the mailbox or could not be pickled.
+    * A told message is acknowledged once it was sent to the actor.
+    * Messages whose Futures fail because the executor broke are not
+      acknowledged.
+
+A message replaced by a newer one in a coalescing mailbox is logged again,
+so the newer one is recovered.
+
+When an executor opens a journal that holds unacknowledged messages (its
+previous owner crashed, or its actor broke), they are posted again, in
+order, before any new message. The Futures of the posted ones are listed in
+`executor.recovered`. With a journal, the messages that were dispatched to
+an actor process that crashed are also sent again to the restarted actor
+instead of failing, except the oldest one (which the actor was handling)
+once it crashed the actor more than `MAX_REDELIVERIES` times. Delivery is
+therefore at-least-once: an actor can see a message again if it crashed, or
+its executor died, after handling it.
+
+The log is a series of segment files of at least 16MiB, created at their
+full size and mapped in memory, that records are only appended to. Each
+record holds its length, a CRC32, the sequence number of the message and
+its kind (posted, told or acknowledged), followed by the pickled message.
+A record written in a mapping is in the page cache as soon as `post`
+returns, so it survives the crash of the process. A thread syncs the new
+records to disk every `_journal_sync` seconds (default 0.01), so one sync
+commits all the messages posted in that time (group commit), and at most
+that much is lost with the machine. With `_journal_sync=None` records are
+only synced when the journal is closed. A segment is deleted once all the
+messages in it and the segments before it were acknowledged.
+
+Messages are pickled when they are posted, so the journal requires them to
+be picklable even when the executor has a serializer. A journal belongs to
+one executor at a time. Reading a log stops at the first torn or corrupt
+record, which can only be the last one written before a crash.
+"""
+from concurrent.futures import _base
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # nocover
+    fcntl = None
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+# Kinds of records
+POST = 1
+TELL = 2
+ACK = 3
+
+# Number of times a message can crash the actor and be sent again
+MAX_REDELIVERIES = 2
+
+# Length of the payload, CRC32 of the rest of the record, sequence number of
+# the message and kind of the record
+_RECORD = struct.Struct('<IIQB')
+_SEQ_KIND = struct.Struct('<QB')
+_SEGMENT_SIZE = 16 << 20
+_SEGMENT_FMT = 'segment-{:016d}.log'
+
+# Journals opened by this process. The file locks only keep other processes
+# out, and are released when any of the process' descriptors of the file is
+# closed.
+_open_paths = set()
+_open_lock = threading.Lock()
+
+
+def _dumps(message):
+    return pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+
+
+def _checksum(seq, kind, payload):
+    return zlib.crc32(payload, zlib.crc32(_SEQ_KIND.pack(seq, kind))) & \
+        0xffffffff
+
+
+class _Segment(object):
+    """
+    A segment file of the log, mapped in memory
+
+    Args:
+        path (str): the segment file
+        size (int, default=None): creates the file with this size, or opens
+            the existing one if None
+    """
+
+    def __init__(self, path, size=None):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if size is None:
+                size = os.fstat(fd).st_size
+            else:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size) if size else None
+        finally:
+            os.close(fd)
+        self.size = size
+        # End of the records, and of the ones synced to disk
+        self.offset = 0
+        self.synced = 0
+        # Number of messages in the segment that were not acknowledged
+        self.live = 0
+
+    def records(self):
+        """
+        Reads the records of an existing segment up to the first invalid
+        one, and moves `offset` after the last valid one.
+
+        Yields:
+            tuple: (seq, kind, payload)
+        """
+        offset = 0
+        while offset + _RECORD.size <= self.size:
+            length, crc, seq, kind = _RECORD.unpack_from(self.map, offset)
+            end = offset + _RECORD.size + length
+            if seq == 0 or end > self.size:
+                break
+            payload = self.map[offset + _RECORD.size:end]
+            if crc != _checksum(seq, kind, payload):
+                break
+            yield seq, kind, payload
+            offset = end
+        self.offset = self.synced = offset
+
+    def write(self, seq, kind, payload):
+        start = self.offset
+        end = start + _RECORD.size + len(payload)
+        # The header goes last, a torn record is never valid
+        self.map[start + _RECORD.size:end] = payload
+        _RECORD.pack_into(self.map, start, len(payload),
+                          _checksum(seq, kind, payload), seq, kind)
+        self.offset = end
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class _Journal(object):
+    """
+    The write-ahead log of the messages of an executor
+
+    Args:
+        path (str): directory of the segment files, created if needed
+        sync_interval (float | None): seconds between two syncs of the new
+            records to disk, or None to only sync them on close
+        segment_size (int): size of the segment files
+
+    Attributes:
+        recovered (List[tuple]): (seq, kind, payload) of the messages that
+            were not acknowledged when the journal was opened, in order.
+            They stay in the journal until they are acknowledged.
+
+    Example:
+        >>> import tempfile, shutil
+        >>> dpath = tempfile.mkdtemp()
+        >>> journal = _Journal(dpath)
+        >>> seqs = [journal.append(POST, _dumps(i)) for i in range(3)]
+        >>> journal.ack(seqs[1])
+        >>> journal.close()
+        >>> journal = _Journal(dpath)
+        >>> [pickle.loads(r[2]) for r in journal.recovered]
+        [0, 2]
+        >>> for seq, kind, payload in journal.recovered:
+        >>>     journal.ack(seq)
+        >>> journal.close()
+        >>> os.listdir(dpath)
+        ['lock']
+        >>> shutil.rmtree(dpath)
+    """
+
+    def __init__(self, path, sync_interval=0.01, segment_size=_SEGMENT_SIZE):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.segment_size = segment_size
+        self._lock_file = self._acquire()
+        self._lock = threading.Lock()
+        # Held while segments are synced, and to unmap them
+        self._sync_lock = threading.Lock()
+        # Oldest first, the last one is appended to
+        self._segments = []
+        # Maps the seq of each unacknowledged message to its segment
+        self._live = {}
+        self.seq = 0
+        try:
+            self.recovered = self._recover()
+        except BaseException:
+            self._release()
+            raise
+        index = 0
+        if self._segments:
+            index = int(os.path.basename(self._segments[-1].path)[8:-4]) + 1
+        # Never append after a torn record
+        self._new_segment(index, 0)
+        self._closed = threading.Event()
+        self._thread = None
+        if sync_interval is not None:
+            self._thread = threading.Thread(
+                target=self._sync_loop, args=(sync_interval,),
+                name='Journal')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _acquire(self):
+        """
+        Returns the lock file of the journal, locked
+        """
+        realpath = os.path.realpath(self.path)
+        with _open_lock:
+            if realpath in _open_paths:
+                lock_file = None
+            else:
+                lock_file = open(os.path.join(self.path, 'lock'), 'a')
+                try:
+                    if fcntl is not None:
+                        # Unlike flock, not inherited by forked actors
+                        fcntl.lockf(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (OSError, IOError):
+                    lock_file.close()
+                    lock_file = None
+                else:
+                    _open_paths.add(realpath)
+        if lock_file is None:
+            raise RuntimeError(
+                'The journal {} is used by another executor'.format(
+                    self.path))
+        return lock_file
+
+    def _recover(self):
+        names = sorted(name for name in os.listdir(self.path)
+                       if name.startswith('segment-') and
+                       name.endswith('.log'))
+        pending = {}
+        for name in names:
+            segment = _Segment(os.path.join(self.path, name))
+            if segment.map is None:
+                os.unlink(segment.path)
+                continue
+            for seq, kind, payload in segment.records():
+                self.seq = max(self.seq, seq)
+                if kind == ACK:
+                    entry = pending.pop(seq, None)
+                    if entry is not None:
+                        entry[2].live -= 1
+                else:
+                    # A message can be logged again when it was replaced
+                    entry = pending.get(seq, None)
+                    if entry is not None:
+                        entry[2].live -= 1
+                    pending[seq] = (kind, payload, segment)
+                    segment.live += 1
+            # Old segments are never written again
+            segment.close()
+            self._segments.append(segment)
+        recovered = []
+        for seq in sorted(pending):
+            kind, payload, segment = pending[seq]
+            self._live[seq] = segment
+            recovered.append((seq, kind, payload))
+        self._collect()
+        return recovered
+
+    def _new_segment(self, index, size):
+        segment = _Segment(
+            os.path.join(self.path, _SEGMENT_FMT.format(index)),
+            max(size, self.segment_size))
+        self._segments.append(segment)
+        return segment
+
+    def append(self, kind, payload):
+        """
+        Logs a message.
+
+        Args:
+            kind (int): POST or TELL
+            payload (bytes): the pickled message
+
+        Returns:
+            int: the sequence number to acknowledge the message with
+        """
+        with self._lock:
+            self.seq += 1
+            segment = self._write(self.seq, kind, payload)
+            segment.live += 1
+            self._live[self.seq] = segment
+            return self.seq
+
+    def replace(self, seq, kind, payload):
+        """
+        Logs a newer version of an unacknowledged message, which is recovered
+        instead of the old one
+        """
+        with self._lock:
+            old = self._live.get(seq, None)
+            if old is None:
+                return
+            segment = self._write(seq, kind, payload)
+            old.live -= 1
+            segment.live += 1
+            self._live[seq] = segment
+            if old is self._segments[0] and not old.live:
+                self._collect()
+
+    def ack(self, seq):
+        """
+        Acknowledges a message, which will not be recovered anymore
+        """
+        with self._lock:
+            segment = self._live.pop(seq, None)
+            if segment is None or not self._segments:
+                # Unknown, or the journal is closed
+                return
+            self._write(seq, ACK, b'')
+            segment.live -= 1
+            if segment is self._segments[0] and not segment.live:
+                self._collect()
+
+    def _write(self, seq, kind, payload):
+        segment = self._segments[-1]
+        size = _RECORD.size + len(payload)
+        if segment.offset + size > segment.size:
+            index = int(os.path.basename(segment.path)[8:-4]) + 1
+            segment = self._new_segment(index, size)
+        segment.write(seq, kind, payload)
+        return segment
+
+    def _collect(self):
+        """
+        Deletes the oldest segments while all of their messages were
+        acknowledged. Acknowledgements are always logged after their
+        message, so the ones left refer to the segments that are kept.
+        """
+        while len(self._segments) > 1 and not self._segments[0].live:
+            segment = self._segments.pop(0)
+            with self._sync_lock:
+                segment.close()
+            try:
+                os.unlink(segment.path)
+            except OSError:
+                pass
+
+    def sync(self):
+        """
+        Writes the new records to disk
+        """
+        with self._lock:
+            ranges = [(segment, segment.synced, segment.offset)
+                      for segment in self._segments
+                      if segment.map is not None and
+                      segment.synced < segment.offset]
+            for segment, _, end in ranges:
+                segment.synced = end
+        with self._sync_lock:
+            for segment, start, end in ranges:
+                if segment.map is None:
+                    continue
+                # msync starts at a page boundary
+                start -= start % mmap.PAGESIZE
+                segment.map.flush(start, end - start)
+
+    def _sync_loop(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.sync()
+            except BaseException:
+                _base.LOGGER.exception(
+                    'Could not sync the journal {}'.format(self.path))
+
+    def close(self):
+        """
+        Syncs and closes the journal. Its files are deleted if all of its
+        messages were acknowledged.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sync()
+        with self._lock, self._sync_lock:
+            for segment in self._segments:
+                segment.close()
+                if not self._live:
+                    os.unlink(segment.path)
+            self._segments = []
+        self._release()
+
+    def _release(self):
+        with _open_lock:
+            _open_paths.discard(os.path.realpath(self.path))
+            self._lock_file.close()
+
+
+def _pop_journal_options(kwargs):
+    """
+    Removes the journal options from the keyword arguments of an executor.
+
+    Returns:
+        _Journal | None: the opened journal, or None if the executor has none
+    """
+    path = kwargs.pop('_journal', None)
+    sync_interval = kwargs.pop('_journal_sync', 0.01)
+    if path is None:
+        return None
+    if hasattr(os, 'fspath'):
+        path = os.fspath(path)
+    return _Journal(path, sync_interval)
@@ -0,0 +1,351 @@
+"""
+Bounded mailboxes for the actor executors.
+
+By default an executor queues every posted message until the actor gets to
+it, so a producer that is faster than its actor makes the queue (and the
+memory of the posting process) grow without limit. Executors created with a
+`_mailbox_size` only hold that many messages that the actor has not taken
+yet, and `_overflow` decides what happens to a message posted to a full
+mailbox:
+
+    * 'block': `post` waits for a free place, at most `timeout` seconds.
+    * 'raise': `post` raises `MailboxFull` right away.
+    * 'drop_oldest': the oldest queued message is dropped (its Future is
+      cancelled) to make room for the new one.
+    * 'drop_newest': the new message is dropped, `post` returns a cancelled
+      Future.
+    * 'coalesce': a new message whose `_coalesce_key` equals the key of a
+      queued message replaces that message, and `post` returns the Future of
+      the queued message, which resolves with the result of the new one.
+      Posted messages only replace posted ones and told messages told ones.
+      Messages with a new key wait for a free place like with 'block'.
+
+The calls to actor methods that executors make for their own needs (e.g. the
+state migration of a ShardedActorExecutor) are never dropped, coalesced or
+kept waiting.
+
+Messages can also be posted with a `priority`. Messages with a higher
+priority are handled before the ones with a lower priority that are still
+waiting, and messages with the same priority are handled in the order they
+were posted. The default priority is 0.
+"""
+from futures_actors import _base_actor
+import collections
+import heapq
+import itertools
+import sys
+import threading
+import time
+if sys.version_info.major >= 3:
+    import queue
+else:
+    import Queue as queue
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+OVERFLOW_POLICIES = ('block', 'raise', 'drop_oldest', 'drop_newest',
+                     'coalesce')
+
+
+class MailboxFull(Exception):
+    """
+    Raised by `post` when the mailbox of the actor is full, either right away
+    (overflow policy 'raise') or after waiting for `timeout` seconds.
+    """
+
+
+class _Mailbox(object):
+    """
+    Admission control of a bounded mailbox.
+
+    The executor keeps queueing its items (work items, call items, ...) the
+    way it normally does. The mailbox only tracks the items that were
+    admitted and not yet taken by the actor, so it can make posts wait and
+    drop or coalesce queued items. An item must have a `message` attribute,
+    and a `future` attribute unless it was told. Keys are computed from the
+    message as it was posted, which the executor passes to `admit` if it
+    encoded `item.message`.
+
+    The messages of dropped items and the messages replaced by coalescing are
+    passed to `release_message`, if it is set.
+
+    Args:
+        size (int | None): maximum number of queued items, None for no limit
+        overflow (str): one of OVERFLOW_POLICIES
+        key (Callable | None): maps a message to its coalescing key
+    """
+
+    def __init__(self, size, overflow='block', key=None):
+        if size is not None and size < 1:
+            raise ValueError('_mailbox_size must be at least 1')
+        if overflow not in OVERFLOW_POLICIES:
+            raise KeyError('_overflow must be one of {}, got {!r}'.format(
+                OVERFLOW_POLICIES, overflow))
+        if overflow == 'coalesce' and key is None:
+            raise ValueError("the 'coalesce' policy requires a _coalesce_key")
+        self.size = size
+        self.overflow = overflow
+        self.key = key
+        self._cond = threading.Condition(threading.Lock())
+        # Admitted items that were not taken yet, oldest first
+        self._queued = collections.OrderedDict()
+        # Coalescing key of each queued item, and the item queued for a key
+        self._keys = {}
+        self._by_key = {}
+        # Queued calls to actor methods, which cannot be dropped
+        self._internal = set()
+        self._closed = False
+        self.release_message = None
+
+    def __len__(self):
+        return len(self._queued)
+
+    def _full(self):
+        return self.size is not None and len(self._queued) >= self.size
+
+    def admit(self, item, timeout=None, message=None):
+        """
+        Makes room for a new item according to the overflow policy.
+
+        Args:
+            item (object): the new item
+            timeout (float | None): seconds to wait for a free place
+            message (object | None): the message of the item as it was
+                posted, defaults to `item.message`
+
+        Returns:
+            object: `item` if it was admitted and must be queued, the queued
+                item it was coalesced into, or None if it was dropped.
+
+        Raises:
+            MailboxFull: if the mailbox stayed full
+        """
+        if message is None:
+            message = item.message
+        if type(message) is _base_actor._ActorMethodCall:
+            with self._cond:
+                self._queued[id(item)] = item
+                self._internal.add(id(item))
+            return item
+        key = None
+        if self.overflow == 'coalesce':
+            key = self.key(message)
+        with self._cond:
+            if self.overflow == 'coalesce':
+                queued = self._by_key.get(key, None)
+                if (queued is not None and
+                        self._told(queued) == self._told(item)):
+                    replaced, queued.message = queued.message, item.message
+                    self._release(replaced)
+                    return queued
+            dropped = None
+            if self._full():
+                if self.overflow == 'raise':
+                    raise MailboxFull('the mailbox of the actor is full')
+                elif self.overflow == 'drop_newest':
+                    return None
+                elif self.overflow == 'drop_oldest':
+                    dropped = self._drop_oldest()
+                else:
+                    self._wait(timeout)
+            self._track(item, key)
+        if dropped is not None and not self._told(dropped):
+            dropped.future.cancel()
+        return item
+
+    @staticmethod
+    def _told(item):
+        return getattr(item, 'future', None) is None
+
+    def _release(self, message):
+        if self.release_message is not None:
+            self.release_message(message)
+
+    def _wait(self, timeout):
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while self._full() and not self._closed:
+            if timeout is None:
+                self._cond.wait()
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise MailboxFull(
+                        'the mailbox of the actor stayed full for {} '
+                        'seconds'.format(timeout))
+                self._cond.wait(remaining)
+
+    def _drop_oldest(self):
+        for item_id in self._queued:
+            if item_id not in self._internal:
+                dropped = self._untrack(item_id)
+                replaced, dropped.message = dropped.message, None
+                self._release(replaced)
+                return dropped
+        # Only calls to actor methods are queued, go over the size instead
+        return None
+
+    def _track(self, item, key=None):
+        self._queued[id(item)] = item
+        if self.overflow == 'coalesce':
+            self._keys[id(item)] = key
+            self._by_key[key] = item
+
+    def _untrack(self, item_id):
+        item = self._queued.pop(item_id)
+        self._internal.discard(item_id)
+        if item_id in self._keys:
+            key = self._keys.pop(item_id)
+            if self._by_key.get(key, None) is item:
+                del self._by_key[key]
+        self._cond.notify()
+        return item
+
+    def take(self, item):
+        """
+        Called by the consumer before it reads the message of a queued item.
+
+        Returns:
+            bool: False if the item was dropped and must be skipped
+        """
+        with self._cond:
+            if id(item) not in self._queued:
+                return False
+            self._untrack(id(item))
+            return True
+
+    def discard(self, item):
+        """
+        Forgets an admitted item that could not be queued after all
+        """
+        self.take(item)
+
+    def close(self):
+        """
+        Wakes up the posts waiting for room, the executor is shutting down
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def _pop_mailbox_options(kwargs):
+    """
+    Removes the mailbox options from the keyword arguments of an executor.
+
+    Returns:
+        _Mailbox | None: None if the mailbox is unbounded and not coalescing
+    """
+    size = kwargs.pop('_mailbox_size', None)
+    overflow = kwargs.pop('_overflow', 'block')
+    key = kwargs.pop('_coalesce_key', None)
+    if size is None and overflow != 'coalesce':
+        return None
+    return _Mailbox(size, overflow, key)
+
+
+class _PriorityDeque(object):
+    """
+    Queue of items with priorities, used for the messages waiting for an
+    actor. Items with a higher priority come out first, and items with the
+    same priority come out in the order they were added.
+
+    Items with the default priority 0 live in a plain deque, and only the
+    other ones go through a heap, so a queue that never sees another priority
+    costs about as much as a deque.
+    """
+
+    def __init__(self):
+        self._fifo = collections.deque()
+        # Entries are (-priority, sequence number, item)
+        self._heap = []
+        self._counter = itertools.count()
+        # Items that are put back come before the others of their priority
+        self._front_counter = itertools.count(-1, -1)
+
+    def __len__(self):
+        return len(self._fifo) + len(self._heap)
+
+    def __iter__(self):
+        return itertools.chain(self._fifo, (e[2] for e in self._heap))
+
+    def append(self, item, priority=0):
+        if priority == 0:
+            self._fifo.append(item)
+        else:
+            heapq.heappush(self._heap, (-priority, next(self._counter), item))
+
+    def appendleft(self, item, priority=0):
+        """
+        Puts back an item that was just popped
+        """
+        if priority == 0:
+            self._fifo.appendleft(item)
+        else:
+            heapq.heappush(self._heap,
+                           (-priority, next(self._front_counter), item))
+
+    def popleft(self):
+        """
+        Returns:
+            tuple: the next item and its priority
+        """
+        heap = self._heap
+        if heap and (not self._fifo or heap[0][0] < 0):
+            neg_priority, _, item = heapq.heappop(heap)
+            return item, -neg_priority
+        return self._fifo.popleft(), 0
+
+    def pop_item(self):
+        """
+        Like `popleft`, but only returns the item
+        """
+        heap = self._heap
+        if heap and (not self._fifo or heap[0][0] < 0):
+            return heapq.heappop(heap)[2]
+        return self._fifo.popleft()
+
+    def clear(self):
+        self._fifo.clear()
+        del self._heap[:]
+
+    def items(self):
+        """
+        Returns a list of the items, in no particular order. Unlike
+        iterating, it can be called while another thread adds and removes
+        items.
+        """
+        return list(self._fifo) + [e[2] for e in list(self._heap)]
+
+
+class _PriorityQueue(queue.Queue):
+    """
+    The work queue of a ThreadActor, a `queue.Queue` that hands out items by
+    priority. The priority of a work item is its `priority` attribute, and
+    batches (lists of work items) have the default priority. The None
+    sentinel that stops the actor always comes last, so it cannot overtake
+    messages with a negative priority.
+    """
+
+    def _init(self, maxsize):
+        self.queue = _PriorityDeque()
+        # Shortcuts for the default priority, which skip the method calls
+        self._fifo = self.queue._fifo
+        self._heap = self.queue._heap
+
+    def _qsize(self):
+        return len(self._fifo) + len(self._heap)
+
+    def _put(self, item):
+        if item is None:
+            self.queue.append(None, float('-inf'))
+        elif item.__class__ is list or not item.priority:
+            self._fifo.append(item)
+        else:
+            self.queue.append(item, item.priority)
+
+    def _get(self):
+        if self._heap:
+            return self.queue.pop_item()
+        return self._fifo.popleft()
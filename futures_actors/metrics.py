@@ -0,0 +1,287 @@
+"""
+Metrics of the actor executors.
+
+`executor.stats()` returns a dict describing the actor right now:
+
+    * 'mailbox_depth': messages posted to the executor and not yet picked up
+      by the actor (for a ProcessActor: not yet sent to its process).
+    * 'restarts': number of times the actor process was restarted.
+
+Executors created with `_stats=True` (or with a `_stats_hook`) also collect:
+
+    * 'inflight': messages picked up (sent to the process) and not yet
+      answered.
+    * 'posted': messages posted and told to the executor.
+    * 'handled' and 'failed': messages handled by the actor, and the ones
+      among them that raised.
+    * 'handle_time': histogram of the time spent in `handle` per message.
+    * 'queue_wait': histogram of the time between posting a message and the
+      start of its handling.
+    * 'bytes_sent', 'bytes_received', 'serialize_time' and
+      'deserialize_time': the size of the frames exchanged with the actor
+      process and the time the posting process spent encoding and decoding
+      them (ProcessActor only).
+
+Histograms are dicts with the 'count', 'total', 'mean' and 'max' of the
+durations in seconds, their 'p50', 'p90' and 'p99' percentiles, and their
+'buckets', a list of (upper bound, count) pairs. Buckets double in size
+starting at one microsecond, so percentiles are accurate within a factor of
+two.
+
+A `_stats_hook` is called with the stats dict at most every
+`_stats_interval` seconds (default 1) while the actor handles messages, and
+once more after it becomes idle. It runs on the thread of a ThreadActor, and
+on the dispatcher thread for a ProcessActor, so it should be quick. A
+ProcessActor sends the metrics collected in its process to the executor with
+the same interval, so its 'handled', 'failed', 'handle_time' and
+'queue_wait' lag behind by at most that long.
+
+Without these options nothing is timed or counted, and handling a message
+costs nothing more.
+"""
+from concurrent.futures import _base
+from futures_actors import _base_actor
+from futures_actors import streams
+import threading
+import time
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+# Bucket i counts the durations under 2 ** i microseconds
+_N_BUCKETS = 32
+
+
+class _Histogram(object):
+    """
+    Histogram of durations in seconds
+    """
+
+    def __init__(self):
+        self.counts = [0] * _N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds < 0:
+            # The clock went back
+            seconds = 0.0
+        index = int(seconds * 1e6).bit_length()
+        if index >= _N_BUCKETS:
+            index = _N_BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket holding the `q` quantile
+        """
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << index) * 1e-6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': [((1 << index) * 1e-6, count)
+                        for index, count in enumerate(self.counts) if count],
+        }
+
+
+class _ActorMetrics(object):
+    """
+    Metrics collected where the actor runs. A ProcessActor collects them in
+    its process and regularly sends them to the executor, starting over
+    after each report.
+    """
+
+    def __init__(self):
+        self.handled = 0
+        self.failed = 0
+        self.inflight = 0
+        self.handle_time = _Histogram()
+        self.queue_wait = _Histogram()
+        self.reported_at = time.time()
+
+    def record(self, posted_at, started, n_failed=0, n_messages=1):
+        """
+        Records the handling of messages that started at `started`. Messages
+        handled together (by `handle_batch`) share their handling time.
+        """
+        duration = (time.time() - started) / n_messages
+        self.handled += n_messages
+        self.failed += n_failed
+        for _ in range(n_messages):
+            self.handle_time.add(duration)
+        if posted_at is not None:
+            for posted in posted_at:
+                if posted is not None:
+                    self.queue_wait.add(started - posted)
+
+    def report_timeout(self, interval):
+        """
+        Returns the number of seconds left before the metrics must be
+        reported, or None if nothing happened since the last report.
+        """
+        if not self.handled:
+            return None
+        return self.reported_at + interval - time.time()
+
+
+class _ExecutorMetrics(_ActorMetrics):
+    """
+    Metrics of one executor. The actor of a ThreadActor records its messages
+    here directly, while the reports of a ProcessActor are merged in.
+
+    Args:
+        hook (Callable | None): called with the stats dict of the executor
+        interval (float): minimum number of seconds between two reports
+    """
+
+    def __init__(self, hook=None, interval=1.0):
+        super(_ExecutorMetrics, self).__init__()
+        self.hook = hook
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.posted = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.serialize_time = 0.0
+        self.deserialize_time = 0.0
+        # Messages handled when the hook was last called
+        self.hooked_handled = 0
+
+    def count_posted(self, n_messages=1):
+        with self.lock:
+            self.posted += n_messages
+
+    def add_serialized(self, n_bytes, duration):
+        # Messages are encoded by the posting threads too
+        with self.lock:
+            self.bytes_sent += n_bytes
+            self.serialize_time += duration
+
+    def add_deserialized(self, n_bytes, duration):
+        self.bytes_received += n_bytes
+        self.deserialize_time += duration
+
+    def merge(self, report):
+        """
+        Adds the metrics reported by an actor process
+        """
+        with self.lock:
+            self.handled += report.handled
+            self.failed += report.failed
+            self.handle_time.merge(report.handle_time)
+            self.queue_wait.merge(report.queue_wait)
+
+    def hook_timeout(self):
+        """
+        Like `report_timeout`, for the calls to the hook
+        """
+        if self.hook is None or self.handled == self.hooked_handled:
+            return None
+        return self.reported_at + self.interval - time.time()
+
+    def call_hook(self, stats):
+        """
+        Calls the hook with the stats dict of the executor
+        """
+        self.hooked_handled = self.handled
+        self.reported_at = time.time()
+        try:
+            self.hook(stats)
+        except BaseException:
+            _base.LOGGER.exception('Exception in the stats hook')
+
+    def snapshot(self):
+        """
+        Returns the collected metrics as a dict
+        """
+        with self.lock:
+            return {
+                'inflight': self.inflight,
+                'posted': self.posted,
+                'handled': self.handled,
+                'failed': self.failed,
+                'handle_time': self.handle_time.summary(),
+                'queue_wait': self.queue_wait.summary(),
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'serialize_time': self.serialize_time,
+                'deserialize_time': self.deserialize_time,
+            }
+
+
+def _timed_dispatch(metrics, actor, message, posted_at, send_chunk=None):
+    """
+    Like `_base_actor._dispatch`, but records the handling in `metrics`. The
+    handling of a streamed message lasts until its chunks were all sent to
+    `send_chunk`.
+    """
+    metrics.inflight += 1
+    started = time.time()
+    try:
+        result = _base_actor._dispatch(actor, message)
+        if send_chunk is not None:
+            result = streams._run_generator(result, send_chunk)
+    except BaseException:
+        metrics.record((posted_at,), started, n_failed=1)
+        raise
+    finally:
+        metrics.inflight -= 1
+    metrics.record((posted_at,), started)
+    return result
+
+
+def _timed_handle_batch(metrics, actor, messages, posted_at):
+    """
+    Like `_base_actor._call_handle_batch`, but records the handling in
+    `metrics`
+    """
+    metrics.inflight += len(messages)
+    started = time.time()
+    try:
+        outcomes = _base_actor._call_handle_batch(actor, messages)
+    finally:
+        metrics.inflight -= len(messages)
+    if outcomes:
+        n_failed = sum(1 for e, _ in outcomes if e is not None)
+        metrics.record(posted_at, started, n_failed, len(outcomes))
+    return outcomes
+
+
+def _pop_stats_options(kwargs):
+    """
+    Removes the stats options from the keyword arguments of an executor.
+
+    Returns:
+        _ExecutorMetrics | None: None if no metrics are collected
+    """
+    enabled = kwargs.pop('_stats', False)
+    hook = kwargs.pop('_stats_hook', None)
+    interval = kwargs.pop('_stats_interval', 1.0)
+    if not enabled and hook is None:
+        return None
+    return _ExecutorMetrics(hook, interval)
@@ -0,0 +1,177 @@
+""" Implements ActorPool """
+from concurrent.futures import _base
+from futures_actors import _base_actor
+import itertools
+import multiprocessing
+import threading
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+ROUTING_POLICIES = ('least_loaded', 'round_robin', 'key')
+
+
+class ActorPool(_base_actor.ActorExecutor):
+    """
+    Executor that manages several replicas of the same actor class.
+
+    Each replica is an independent actor created with `_ActorClass.executor`,
+    so ThreadActors and ProcessActors can both be pooled. Messages are routed
+    to exactly one replica, which means the pool is best suited to stateless
+    actors, or to actors whose state is partitioned by a message key.
+
+    Pool options are passed as underscore-prefixed keyword arguments. All
+    other arguments (including executor options) are given to every replica.
+
+    Args:
+        _ActorClass (type): the Actor subclass to replicate
+        _n_actors (int, default=None): number of replicas. Defaults to the
+            number of CPUs.
+        _routing (str, default='least_loaded'): how `post` picks a replica.
+            'least_loaded' sends the message to the replica with the fewest
+            unfinished messages, 'round_robin' cycles through the replicas,
+            and 'key' sends all messages with the same `key` to the same
+            replica.
+
+    Example:
+        >>> from futures_actors import ThreadActor
+        >>> class Squarer(ThreadActor):
+        >>>     def handle(self, message):
+        >>>         return message ** 2
+        >>> #
+        >>> with Squarer.pool(_n_actors=3) as pool:
+        >>>     fs = [pool.post(i) for i in range(10)]
+        >>>     assert [f.result() for f in fs] == [i ** 2 for i in range(10)]
+    """
+
+    def __init__(self, _ActorClass, *args, **kwargs):
+        n_actors = kwargs.pop('_n_actors', None)
+        routing = kwargs.pop('_routing', 'least_loaded')
+        if n_actors is None:
+            n_actors = multiprocessing.cpu_count()
+        if n_actors < 1:
+            raise ValueError('_n_actors must be at least 1')
+        if routing not in ROUTING_POLICIES:
+            raise KeyError('_routing must be one of {}, got {!r}'.format(
+                ROUTING_POLICIES, routing))
+
+        self._ActorClass = _ActorClass
+        self._routing = routing
+        self._shutdown = False
+        self._lock = threading.Lock()
+        # Number of unfinished messages posted to each replica
+        self._n_outstanding = [0] * n_actors
+        self._round_robin = itertools.cycle(range(n_actors))
+        self._executors = [_ActorClass.executor(*args, **kwargs)
+                           for _ in range(n_actors)]
+
+    def __len__(self):
+        return len(self._executors)
+
+    def _route(self, key):
+        """
+        Returns the index of the replica that should get the next message.
+        Must be called with `self._lock` held.
+        """
+        if self._routing == 'key':
+            if key is None:
+                raise ValueError('key routing requires a key for every post')
+            return hash(key) % len(self._executors)
+        elif self._routing == 'round_robin':
+            return next(self._round_robin)
+        else:
+            n_outstanding = self._n_outstanding
+            return n_outstanding.index(min(n_outstanding))
+
+    def post(self, message, key=None):
+        """
+        Sends a message to one of the replicas and returns a Future.
+
+        Args:
+            message (object): the message to send
+            key (Hashable, default=None): routing key. Required when the pool
+                routes by key, and ignored otherwise.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(
+                    'cannot schedule new futures after shutdown')
+            index = self._route(key)
+            # Count the message before its callback can possibly run
+            self._n_outstanding[index] += 1
+        # Posted without the lock: the post may wait for room in the mailbox
+        # of the replica, while the done callbacks need the lock to free it
+        try:
+            f = self._executors[index].post(message)
+        except BaseException:
+            self._uncount(index)
+            raise
+        f.add_done_callback(self._make_done_callback(index))
+        return f
+
+    def _uncount(self, index, n=1):
+        with self._lock:
+            self._n_outstanding[index] -= n
+
+    def _make_done_callback(self, index):
+        def done_callback(_):
+            self._uncount(index)
+        return done_callback
+
+    def post_many(self, messages, keys=None):
+        """
+        Routes each message like `post` and sends the messages destined to
+        the same replica as a single batch.
+
+        Args:
+            messages (Sequence): the messages to send
+            keys (Sequence, default=None): a routing key for each message
+        """
+        messages = list(messages)
+        if keys is None:
+            keys = [None] * len(messages)
+        else:
+            keys = list(keys)
+            if len(keys) != len(messages):
+                raise ValueError('need exactly one key per message')
+        fs = [None] * len(messages)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(
+                    'cannot schedule new futures after shutdown')
+            groups = {}
+            for idx, key in enumerate(keys):
+                index = self._route(key)
+                groups.setdefault(index, []).append(idx)
+                # Count each message as it is routed, so least_loaded routing
+                # accounts for the earlier messages of this batch
+                self._n_outstanding[index] += 1
+        # Posted without the lock, like in `post`
+        groups = list(groups.items())
+        for n_posted, (index, idxs) in enumerate(groups):
+            try:
+                batch_fs = self._executors[index].post_many(
+                    [messages[idx] for idx in idxs])
+            except BaseException:
+                for index, idxs in groups[n_posted:]:
+                    self._uncount(index, len(idxs))
+                raise
+            done_callback = self._make_done_callback(index)
+            for idx, f in zip(idxs, batch_fs):
+                fs[idx] = f
+                f.add_done_callback(done_callback)
+        return fs
+
+    def stats(self):
+        """
+        Returns a list with the stats dict of each replica, see
+        `ActorExecutor.stats`.
+        """
+        return [executor.stats() for executor in self._executors]
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._shutdown = True
+        for executor in self._executors:
+            executor.shutdown(wait=wait)
+    shutdown.__doc__ = _base.Executor.shutdown.__doc__
@@ -2,8 +2,23 @@
 from concurrent.futures import _base
 from concurrent.futures import process
 from futures_actors import _base_actor
+from futures_actors import cache as cache_module
+from futures_actors import cancellation
+from futures_actors import checkpoint as checkpoint_module
+from futures_actors import contexts
+from futures_actors import journal as journal_module
+from futures_actors import mailbox
+from futures_actors import metrics as metrics_module
+from futures_actors import serializers
+from futures_actors import streams
+from futures_actors import tracing
+from multiprocessing import connection
+import collections
+import functools
 import sys
 import os
+import socket
+import time
 import weakref
 import threading
 import multiprocessing
@@ -18,11 +33,47 @@ __author__ = 'Jon Crall (erotemic@gmail.com)'
 
 
 if sys.version_info.major >= 3:
+    import pickle
     import queue
-    from multiprocessing.connection import wait
+    import selectors
+    from multiprocessing.reduction import ForkingPickler
+    _dumps = ForkingPickler.dumps
+    _loads = ForkingPickler.loads
+    _Selector = selectors.DefaultSelector
+    _EVENT_READ = selectors.EVENT_READ
     BrokenProcessPool = process.BrokenProcessPool
 else:
     import Queue as queue
+    import cPickle as pickle
+    import select
+
+    def _dumps(obj):
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    _loads = pickle.loads
+
+    _EVENT_READ = 1
+    _SelectorKey = collections.namedtuple('_SelectorKey', ['fileobj', 'data'])
+
+    class _Selector(object):
+        """
+        The part of selectors.DefaultSelector used by the dispatcher
+        """
+        def __init__(self):
+            self._keys = {}
+
+        def register(self, fileobj, events, data=None):
+            self._keys[fileobj] = _SelectorKey(fileobj, data)
+
+        def unregister(self, fileobj):
+            del self._keys[fileobj]
+
+        def select(self, timeout=None):
+            ready = select.select(list(self._keys), [], [], timeout)[0]
+            return [(self._keys[fileobj], _EVENT_READ) for fileobj in ready]
+
+        def close(self):
+            self._keys.clear()
 
     class BrokenProcessPool(RuntimeError):
         """
@@ -57,257 +108,1569 @@ else:
         return exc
 
 
+if sys.version_info[0:2] >= (3, 8):
+    from futures_actors import _shm
+else:
+    _shm = None
+
+
 _ResultItem = process._ResultItem
 
 
-def _process_actor_eventloop(_call_queue, _result_queue, _ActorClass, *args,
-                             **kwargs):
+def _interpreter_shutting_down():
+    """
+    True once concurrent.futures has started tearing down its executors at
+    interpreter exit (python 3.9 renamed `_shutdown` to `_global_shutdown`).
+    """
+    return (getattr(process, '_shutdown', False) or
+            getattr(process, '_global_shutdown', False))
+
+
+class _ThreadWakeup(object):
+    """
+    Local channel used to wake the dispatcher thread.
+
+    Posting a message only needs to interrupt the dispatcher's `select`, so
+    we write to a private pipe. Writes are coalesced: once a wakeup is
+    pending, further calls are free until the dispatcher clears it.
+    """
+    def __init__(self):
+        self._closed = False
+        self._pending = False
+        # Reentrant: the garbage collector may run the weakref callback of
+        # an executor, which wakes the dispatcher, while its own thread
+        # holds the lock
+        self._lock = threading.RLock()
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._writer.close()
+                self._reader.close()
+
+    def wakeup(self):
+        with self._lock:
+            if not self._closed and not self._pending:
+                self._pending = True
+                self._writer.send_bytes(b'')
+
+    def clear(self):
+        with self._lock:
+            if not self._closed:
+                while self._reader.poll():
+                    self._reader.recv_bytes()
+                self._pending = False
+
+    def put(self, obj, block=True):
+        # Before python 3.9, concurrent.futures wakes its threads at exit by
+        # putting None in their result queue
+        self.wakeup()
+
+
+def _register_management_thread(thread, thread_wakeup):
+    # use structures already in futures as much as possible, so the thread is
+    # woken up and joined at interpreter exit like the ones of ProcessPools.
+    if hasattr(process, '_threads_wakeups'):
+        process._threads_wakeups[thread] = thread_wakeup
+    else:
+        process._threads_queues[thread] = thread_wakeup
+
+
+def _remote_exception(e):
+    if sys.version_info.major == 3:
+        return _ExceptionWithTraceback(e, e.__traceback__)
+    else:
+        return e  # python2 hack
+
+
+def _handle_call_item(actor, call_item, shm_threshold=None, codec=None,
+                      metrics=None, send_chunk=None):
+    """
+    Sends one message to the actor and packages the outcome as a _ResultItem.
+    Nobody waits for the result of a told message (its work id is None).
+
+    The timestamps of a traced message are stamped and sent back with its
+    result. For a streamed message, the items of the result are passed to
+    `send_chunk` and the value returned by the generator is the result.
+    """
+    told = call_item.work_id is None
+    trace = call_item.trace
+    if trace is not None:
+        trace['dequeue'] = time.time()
+    try:
+        message = call_item.message
+        if shm_threshold is not None:
+            # The sender of a told message leaves the segment to us
+            message = _shm.loads(message, unlink=told)
+        elif codec is not None:
+            message = codec.loads(message)
+        if trace is not None:
+            trace['start'] = time.time()
+        if metrics is None:
+            r = _base_actor._dispatch(actor, message)
+            if send_chunk is not None:
+                r = streams._run_generator(r, send_chunk)
+        else:
+            r = metrics_module._timed_dispatch(metrics, actor, message,
+                                               call_item.posted_at, send_chunk)
+        if trace is not None:
+            trace['end'] = time.time()
+        if shm_threshold is not None and not told:
+            r = _shm.dumps(r, shm_threshold)
+        elif codec is not None and not told:
+            r = codec.dumps(r)
+    except BaseException as e:
+        if trace is not None and 'start' in trace:
+            trace.setdefault('end', time.time())
+        result_item = _ResultItem(call_item.work_id,
+                                  exception=_remote_exception(e))
+    else:
+        result_item = _ResultItem(call_item.work_id, result=r)
+    if trace is not None:
+        result_item.trace = trace
+    return result_item
+
+
+def _stream_call_item(actor, call_item, result_conn, credits,
+                      shm_threshold=None, codec=None, metrics=None):
+    """
+    Handles a streamed message. Its chunks are encoded like results and sent
+    to the parent as they are produced, as long as the parent has granted
+    credits for them.
+    """
+    work_id = call_item.work_id
+
+    def send_chunk(chunk):
+        if not credits.take(work_id):
+            # The caller closed the stream
+            return False
+        if shm_threshold is not None:
+            chunk = _shm.dumps(chunk, shm_threshold)
+        elif codec is not None:
+            chunk = codec.dumps(chunk)
+        result_conn.send_bytes(_dumps(streams._StreamChunk(work_id, chunk)))
+        return True
+
+    credits.open(work_id, call_item.stream)
+    try:
+        return _handle_call_item(actor, call_item, shm_threshold, codec,
+                                 metrics, send_chunk)
+    finally:
+        credits.end()
+
+
+def _handle_cancellable(cancel_scope, actor, call_item, *args):
+    """
+    Like `_handle_call_item`, but skips a message that was cancelled before
+    the actor took it, and lets `actor.cancelled` see the cancellation of the
+    message being handled. The parent drops the result of either.
+    """
+    if not cancel_scope.start(call_item.work_id):
+        result_item = _ResultItem(call_item.work_id)
+    else:
+        result_item = _handle_call_item(actor, call_item, *args)
+    cancel_scope.finish()
+    return result_item
+
+
+def _handle_call_batch(actor, call_items, shm_threshold=None, codec=None,
+                       metrics=None):
+    """
+    Sends a gathered batch of messages to `actor.handle_batch` and packages
+    the outcomes as a list of _ResultItems. The messages and results of
+    _RefCallItems are not encoded.
+    """
+    traces = [c.trace for c in call_items if c.trace is not None]
+    for trace in traces:
+        trace['dequeue'] = time.time()
+    messages = [c.message for c in call_items]
+    if shm_threshold is not None:
+        messages = [_shm.loads(m, unlink=c.work_id is None)
+                    for c, m in zip(call_items, messages)]
+    elif codec is not None:
+        messages = [m if isinstance(c, _RefCallItem) else codec.loads(m)
+                    for c, m in zip(call_items, messages)]
+    for trace in traces:
+        trace['start'] = time.time()
+    if metrics is None:
+        outcomes = _base_actor._call_handle_batch(actor, messages)
+    else:
+        outcomes = metrics_module._timed_handle_batch(
+            metrics, actor, messages, [c.posted_at for c in call_items])
+    del messages
+    for trace in traces:
+        trace['end'] = time.time()
+    result_items = []
+    for call_item, (e, r) in zip(call_items, outcomes):
+        if (e is None and call_item.work_id is not None and
+                not isinstance(call_item, _RefCallItem)):
+            try:
+                if shm_threshold is not None:
+                    r = _shm.dumps(r, shm_threshold)
+                elif codec is not None:
+                    r = codec.dumps(r)
+            except BaseException as ex:
+                e = ex
+        if e is not None:
+            result_item = _ResultItem(call_item.work_id,
+                                      exception=_remote_exception(e))
+        else:
+            result_item = _ResultItem(call_item.work_id, result=r)
+        if call_item.trace is not None:
+            result_item.trace = call_item.trace
+        result_items.append(result_item)
+    return result_items
+
+
+def _send_result(result_conn, result):
+    """
+    Sends a _ResultItem (or a list of them) to the parent. A result that
+    cannot be pickled is replaced by the pickling error.
+    """
+    try:
+        data = _dumps(result)
+    except BaseException:
+        if isinstance(result, list):
+            result = [_picklable_result(r) for r in result]
+        else:
+            result = _picklable_result(result)
+        data = _dumps(result)
+    result_conn.send_bytes(data)
+
+
+def _picklable_result(result_item):
+    try:
+        _dumps(result_item)
+    except BaseException as e:
+        return _ResultItem(result_item.work_id, exception=_remote_exception(e))
+    return result_item
+
+
+def _receive_call_items(_call_conn, call_queue, credits=None,
+                        cancel_scope=None):
+    """
+    Runs on a thread of the actor process and moves call items from the call
+    pipe into a local queue as soon as they arrive. Because the pipe is always
+    drained, the parent never blocks on it while the actor is busy. The
+    credits of a streamed message are granted right away, since the actor is
+    busy producing its chunks, and so are the cancellations of the messages
+    if `cancel_scope` is given.
+
+    Other processes forked by the parent may hold the writing end of the pipe
+    too, so the death of the parent is noticed by watching our parent pid.
+    The parent can die before this thread reads it, so the sentinel of the
+    parent process is watched too on python 3.8+.
+    """
+    parent = getattr(multiprocessing, 'parent_process', lambda: None)()
+    parent_pid = os.getppid()
+    while True:
+        try:
+            if not _call_conn.poll(1.0):
+                if (os.getppid() != parent_pid or
+                        parent is not None and not parent.is_alive()):
+                    # The parent is gone, stop once the queue is handled
+                    call_queue.put(None)
+                    if credits is not None:
+                        credits.close()
+                    return
+                continue
+            call_item = _call_conn.recv()
+            if type(call_item) is streams._StreamCredit:
+                credits.grant(call_item.work_id, call_item.n)
+                continue
+            if cancel_scope is not None:
+                if type(call_item) is cancellation._CancelSignal:
+                    cancel_scope.cancel(call_item.work_id)
+                    continue
+                for c in (call_item if isinstance(call_item, list)
+                          else [call_item]):
+                    if (type(c) is _CallItem and c.work_id is not None and
+                            c.stream is None):
+                        cancel_scope.receive(c.work_id)
+        except EOFError:
+            # The parent is gone
+            call_item = None
+        except BaseException as e:
+            # Let the event loop fail, which breaks the executor
+            call_item = e
+        call_queue.put(call_item)
+        if call_item is None or isinstance(call_item, BaseException):
+            if credits is not None:
+                credits.close()
+            return
+
+
+def _reply_ref_call(call_item, result_item):
+    """
+    Sends the result of a message posted through an ActorRef back to the
+    process that posted it. Results of told messages are dropped.
+    """
+    if call_item.reply_conn is None:
+        return
+    try:
+        data = _dumps(result_item)
+    except BaseException:
+        data = _dumps(_picklable_result(result_item))
+    try:
+        call_item.reply_conn.send_bytes(data)
+    except (OSError, IOError):
+        # The sender is gone
+        pass
+
+
+def _serve_actor_refs(ref_socket, call_queue, stop_reader=None):
+    """
+    Runs on a thread of the actor process and accepts the direct connections
+    of ActorRefs held by other processes. A single selector watches the
+    listening socket and every accepted connection, and the messages that
+    arrive are put in the actor's local call queue as _RefCallItems.
+
+    A process that outlives its actor (a reservoir worker) stops the thread
+    by writing to `stop_reader`, which closes the socket and connections.
+    """
+    authkey = multiprocessing.current_process().authkey
+    selector = _Selector()
+    selector.register(ref_socket, _EVENT_READ, None)
+    if stop_reader is not None:
+        selector.register(stop_reader, _EVENT_READ, stop_reader)
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is stop_reader:
+                for other in list(selector.get_map().values()):
+                    other.fileobj.close()
+                selector.close()
+                return
+            if key.data is None:
+                try:
+                    sock = ref_socket.accept()[0]
+                except (OSError, IOError):
+                    # The listening socket was closed
+                    return
+                conn = connection.Connection(os.dup(sock.fileno()))
+                sock.close()
+                try:
+                    connection.deliver_challenge(conn, authkey)
+                    connection.answer_challenge(conn, authkey)
+                except (multiprocessing.AuthenticationError, EOFError,
+                        OSError, IOError):
+                    conn.close()
+                    continue
+                selector.register(conn, _EVENT_READ, conn)
+                continue
+            conn = key.data
+            try:
+                call_id, message = conn.recv()
+            except BaseException:
+                # The sender is gone, or sent something we cannot unpickle
+                selector.unregister(conn)
+                conn.close()
+                continue
+            reply_conn = None if call_id is None else conn
+            call_queue.put(_RefCallItem(call_id, message, reply_conn))
+
+
+def _process_actor_eventloop(_call_conn, _result_conn, _options,
+                             _ActorClass, *args, **kwargs):
     """
     actor event loop run in a separate process.
 
     Creates the instance of the actor (passing in the required *args, and
     **kwargs). Then the eventloop starts and feeds the actor messages from the
-    _call_queue. Results are placed in the _result_queue, which are then placed
-    in Future objects.
+    _call_conn pipe. Results are sent back through the _result_conn pipe, and
+    the parent places them in Future objects.
+
+    A list of _CallItems is a batch posted with `post_many`. Its results are
+    sent back together as a single list of _ResultItems. If the actor defines
+    `handle_batch`, every call item that has already arrived is gathered and
+    handled together, and the results are also sent back as one list.
+
+    Messages posted through an ActorRef arrive as _RefCallItems, and their
+    results are sent straight back to the process that posted them. Told
+    messages have no work id and no result is sent for them. The chunks of
+    a streamed message are sent as _StreamChunks before its result.
+
+    `_options` is a dict of executor options the child needs to know about.
+    If 'shm_threshold' is set, messages arrive and results leave as
+    `_shm.ShmPayload` objects. If 'codec' is set, they are encoded by that
+    `serializers._Codec`. If 'ref_socket' is set, it is the listening socket
+    ActorRefs connect to. If 'stats_interval' is set, the handling of the
+    messages is recorded, and the metrics are sent to the parent at most
+    that often (see `futures_actors.metrics`). If 'cancellable' is set, the
+    messages may be cancelled while the actor handles them (see
+    `futures_actors.cancellation`). If 'checkpoint' is set, it
+    is the (path, interval) of the checkpoints of the actor, which is
+    restored from the latest one (see `futures_actors.checkpoint`). If
+    'reusable' is set, the
+    process runs further actors after this one (see
+    `futures_actors.reservoir`), so the threads of this actor are stopped
+    before it says goodbye.
     """
+    shm_threshold = _options.get('shm_threshold', None)
+    codec = _options.get('codec', None)
+    ref_socket = _options.get('ref_socket', None)
+    stats_interval = _options.get('stats_interval', None)
+    checkpoint = _options.get('checkpoint', None)
+    metrics = None
+    if stats_interval is not None:
+        metrics = metrics_module._ActorMetrics()
+
+    handle = _handle_call_item
+    cancel_scope = None
+    if _options.get('cancellable', False):
+        cancel_scope = cancellation._CancelScope()
+        handle = functools.partial(_handle_cancellable, cancel_scope)
+
+    call_queue = queue.Queue()
+    credits = streams._StreamCredits()
+    receiver = threading.Thread(
+        target=_receive_call_items,
+        args=(_call_conn, call_queue, credits, cancel_scope))
+    receiver.daemon = True
+    receiver.start()
+    ref_server = ref_stop = None
+    if ref_socket is not None:
+        ref_stop_reader = None
+        if _options.get('reusable', False):
+            ref_stop_reader, ref_stop = multiprocessing.Pipe(duplex=False)
+        ref_server = threading.Thread(
+            target=_serve_actor_refs,
+            args=(ref_socket, call_queue, ref_stop_reader))
+        ref_server.daemon = True
+        ref_server.start()
 
     actor = _ActorClass(*args, **kwargs)
+    checkpointer = None
+    if checkpoint is not None:
+        checkpointer = checkpoint_module._Checkpointer(*checkpoint)
+        if not checkpointer.restore(actor):
+            actor = _ActorClass(*args, **kwargs)
+    if cancel_scope is not None:
+        actor._cancel_scope = cancel_scope
+    batching = _base_actor._supports_batching(actor)
     while True:
-        call_item = _call_queue.get(block=True)
+        timeout = None
+        if metrics is not None:
+            timeout = metrics.report_timeout(stats_interval)
+            if timeout is not None and timeout <= 0:
+                metrics = _report_metrics(_result_conn, metrics)
+                timeout = None
+        if checkpointer is not None:
+            due = checkpointer.timeout()
+            if due is not None and due <= 0:
+                checkpointer.write(actor)
+            elif due is not None and (timeout is None or due < timeout):
+                timeout = due
+        try:
+            call_item = call_queue.get(block=True, timeout=timeout)
+        except queue.Empty:
+            # Time to report the metrics or write a checkpoint
+            continue
+        if isinstance(call_item, BaseException):
+            raise call_item
         if call_item is None:
-            # Wake up queue management thread
-            _result_queue.put(os.getpid())
+            _say_goodbye(actor, _result_conn, metrics, checkpointer,
+                         ref_server, ref_stop)
             return
-        try:
-            r = actor.handle(call_item.message)
-        except BaseException as e:
-            if sys.version_info.major == 3:
-                exc = _ExceptionWithTraceback(e, e.__traceback__)
-            else:
-                exc = e  # python2 hack
-            _result_queue.put(_ResultItem(
-                call_item.work_id, exception=exc))
+        if batching:
+            call_items, got_sentinel = _base_actor._gather_batch(
+                call_queue, call_item, actor.max_batch_size,
+                actor.batch_linger)
+            result_items = _handle_call_batch(actor, call_items,
+                                              shm_threshold, codec, metrics)
+            if cancel_scope is not None:
+                # Batches never see their cancellations
+                cancel_scope.forget([c.work_id for c in call_items])
+            parent_result_items = []
+            for c, r in zip(call_items, result_items):
+                if isinstance(c, _RefCallItem):
+                    _reply_ref_call(c, r)
+                elif c.work_id is not None:
+                    parent_result_items.append(r)
+            if parent_result_items:
+                _send_result(_result_conn, parent_result_items)
+            del call_items, result_items, parent_result_items
+            if got_sentinel:
+                _say_goodbye(actor, _result_conn, metrics, checkpointer,
+                             ref_server, ref_stop)
+                return
+        elif isinstance(call_item, _RefCallItem):
+            _reply_ref_call(call_item, _handle_call_item(
+                actor, call_item, metrics=metrics))
+        elif isinstance(call_item, list):
+            _send_result(_result_conn, [
+                handle(actor, c, shm_threshold, codec, metrics)
+                for c in call_item])
+        elif call_item.work_id is None:
+            _handle_call_item(actor, call_item, shm_threshold, codec, metrics)
+        elif call_item.stream is not None:
+            _send_result(_result_conn, _stream_call_item(
+                actor, call_item, _result_conn, credits, shm_threshold,
+                codec, metrics))
         else:
-            _result_queue.put(_ResultItem(
-                call_item.work_id, result=r))
+            _send_result(_result_conn, handle(
+                actor, call_item, shm_threshold, codec, metrics))
+        del call_item
+        if checkpointer is not None:
+            checkpointer.dirty = True
+        if shm_threshold is not None:
+            # Unmap message segments the actor did not hold on to
+            _shm.release_segments()
+
+
+def _say_goodbye(actor, result_conn, metrics, checkpointer=None,
+                 ref_server=None, ref_stop=None):
+    """
+    Stops the children of the actor, sends its last metrics, writes its last
+    checkpoint and tells the dispatcher this is a clean shutdown. The thread
+    serving ActorRefs is stopped first if `ref_stop` is given.
+    """
+    _base_actor._stop_children(actor)
+    _report_metrics(result_conn, metrics)
+    if checkpointer is not None and checkpointer.dirty:
+        checkpointer.write(actor)
+    if ref_stop is not None:
+        ref_stop.send_bytes(b'')
+        ref_server.join()
+        ref_stop.close()
+    # The PID of the actor process
+    result_conn.send(os.getpid())
+
+
+def _report_metrics(result_conn, metrics):
+    """
+    Sends the metrics collected since the last report to the parent, if
+    anything happened, and returns the metrics to collect next.
+    """
+    if metrics is not None and metrics.handled:
+        result_conn.send(metrics)
+        metrics = metrics_module._ActorMetrics()
+    return metrics
+
+
+def _bind_ref_socket(address=None):
+    """
+    Creates the socket that ActorRefs of a new actor process connect to. It
+    is bound before the process starts, so references work right away. A
+    restarted actor binds the address of its previous process again, so the
+    references to it stay valid.
+
+    Returns:
+        tuple: (address, socket)
+    """
+    if hasattr(socket, 'AF_UNIX'):
+        family = socket.AF_UNIX
+        if address is None:
+            address = connection.arbitrary_address('AF_UNIX')
+    else:
+        family = socket.AF_INET
+        if address is None:
+            address = ('127.0.0.1', 0)
+    ref_socket = socket.socket(family)
+    if family == socket.AF_INET:
+        ref_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    ref_socket.bind(address)
+    ref_socket.listen(socket.SOMAXCONN)
+    return ref_socket.getsockname(), ref_socket
+
+
+class _ActorProcess(object):
+    """
+    Starts the process of an actor and holds the two pipes used to talk to it.
+
+    Plain pipes are used instead of multiprocessing Queues, which would each
+    start a feeder thread in the parent. Only the dispatcher thread (or the
+    event loop of an asyncio executor) reads and writes them.
+
+    If `listen` is True, the actor also accepts direct connections from
+    ActorRefs at `ref_address`, which is chosen automatically if it is None.
+    The process is started with the start method of `context`, or the
+    default one if it is None. If a `reservoir` is given, the actor runs in
+    one of its idle worker processes instead, which goes back to the
+    reservoir once the actor stopped.
+    """
+    def __init__(self, _ActorClass, args, kwargs, options, listen=False,
+                 ref_address=None, context=None, reservoir=None):
+        self.ref_address = None
+        self.worker = None
+        ref_socket = None
+        if listen:
+            self.ref_address, ref_socket = _bind_ref_socket(ref_address)
+            options = dict(options, ref_socket=ref_socket)
+        if reservoir is not None:
+            self._claim_worker(reservoir, _ActorClass, args, kwargs, options)
+            if ref_socket is not None:
+                ref_socket.close()
+            return
+        call_reader, self.call_conn = multiprocessing.Pipe(duplex=False)
+        self.result_conn, result_writer = multiprocessing.Pipe(duplex=False)
+        if context is None:
+            context = multiprocessing
+        self.process = context.Process(
+                target=_process_actor_eventloop,
+                args=(call_reader, result_writer, options,
+                      _ActorClass) + tuple(args),
+                kwargs=kwargs)
+        self.process.start()
+        # These ends belong to the child
+        call_reader.close()
+        result_writer.close()
+        if ref_socket is not None:
+            ref_socket.close()
+        # Python 2 processes have no sentinel and must be polled instead
+        self.sentinel = getattr(self.process, 'sentinel', None)
+
+    def _claim_worker(self, reservoir, _ActorClass, args, kwargs, options):
+        # Pickled first, so an actor that cannot be sent leaves the worker
+        # in the reservoir
+        job = _dumps((dict(options, reusable=True), _ActorClass, tuple(args),
+                      kwargs))
+        self.worker = worker = reservoir._claim()
+        self.process = worker.process
+        self.call_conn = worker.call_conn
+        self.result_conn = worker.result_conn
+        self.sentinel = worker.sentinel
+        self.call_conn.send_bytes(job)
+
+    def send(self, obj, metrics=None):
+        """
+        Sends an object to the actor. It is fully pickled before anything is
+        written, so a pickling error leaves the pipe usable.
+        """
+        if metrics is None:
+            self.call_conn.send_bytes(_dumps(obj))
+        else:
+            start = time.time()
+            data = _dumps(obj)
+            metrics.add_serialized(len(data), time.time() - start)
+            self.call_conn.send_bytes(data)
+
+    def close(self):
+        if self.worker is not None:
+            # Idle again, unless the actor crashed its worker
+            self.worker.reservoir._release(self.worker)
+        else:
+            # If .join() is not called on the created processes then
+            # some multiprocessing methods may deadlock on Mac OS X.
+            self.process.join()
+            self.call_conn.close()
+            self.result_conn.close()
+        if isinstance(self.ref_address, str):
+            try:
+                os.unlink(self.ref_address)
+            except OSError:
+                pass
 
 
 class _WorkItem(object):
+    # When the message was posted, only set if the executor collects metrics
+    posted_at = None
+    # The tracing.MessageTrace of the message, if the executor traces them
+    trace = None
+    # Sequence number of the message in the journal of the executor, and
+    # the pickled message until it is logged
+    journal_seq = None
+    journal_record = None
+    # Number of times the actor crashed while handling the message
+    crashes = 0
+    # The streams.Stream the chunks are put in, for a streamed message
+    stream = None
+
     def __init__(self, future, message):
         self.future = future
         self.message = message
 
 
 class _CallItem(object):
+    posted_at = None
+    # The timestamps of a traced message, sent back with its _ResultItem
+    trace = None
+    journal_seq = None
+    journal_record = None
+    # The window of a streamed message
+    stream = None
+
     def __init__(self, work_id, message):
         self.work_id = work_id
         self.message = message
 
 
-def _add_call_item_to_queue(pending_work_items,
-                            work_ids,
-                            call_queue):
-    """Fills call_queue with _WorkItems from pending_work_items.
+class _RefCallItem(object):
+    """
+    A message posted through an ActorRef. Its result is sent back over
+    `reply_conn`, which is None for messages that were told.
+    """
+    posted_at = None
+    trace = None
 
-    This function never blocks.
+    def __init__(self, work_id, message, reply_conn):
+        self.work_id = work_id
+        self.message = message
+        self.reply_conn = reply_conn
 
-    Args:
-        pending_work_items: A dict mapping work ids to _WorkItems e.g.
-            {5: <_WorkItem...>, 6: <_WorkItem...>, ...}
-        work_ids: A queue.Queue of work ids e.g. Queue([5, 6, ...]). Work ids
-            are consumed and the corresponding _WorkItems from
-            pending_work_items are transformed into _CallItems and put in
-            call_queue.
-        call_queue: A multiprocessing.Queue that will be filled with _CallItems
-            derived from _WorkItems.
+
+def _put_stream_chunk(pending_work_items, chunk_item, codec=None):
     """
-    while True:
-        if call_queue.full():
-            return
-        try:
-            work_id = work_ids.get(block=False)
-        except queue.Empty:
-            return
-        else:
-            work_item = pending_work_items[work_id]
+    Puts a chunk received from the actor in the Stream of its message,
+    decoding it like results. A chunk that cannot be decoded is raised when
+    the caller takes it.
+    """
+    chunk = chunk_item.chunk
+    try:
+        if codec is not None:
+            chunk = codec.loads(chunk)
+        elif _shm is not None and isinstance(chunk, _shm.ShmPayload):
+            chunk = chunk.load(unlink=True)
+    except BaseException as e:
+        chunk = streams._ChunkError(e)
+    work_item = pending_work_items.get(chunk_item.work_id, None)
+    if work_item is not None:
+        work_item.stream._put(chunk)
 
-            if work_item.future.set_running_or_notify_cancel():
-                call_queue.put(_CallItem(work_id,
-                                         work_item.message),
-                               block=True)
+
+def _set_future_result(pending_work_items, result_item, codec=None,
+                       metrics=None):
+    """
+    Transfers a _ResultItem received from the actor to its Future, decoding
+    the result with `codec` if the executor has a serializer. The decoding
+    time is recorded in `metrics`, and the trace of the message is finished.
+    """
+    work_item = pending_work_items.pop(result_item.work_id, None)
+    # work_item can be None if another process terminated (see above)
+    if work_item is not None:
+        trace = work_item.trace
+        if trace is not None:
+            trace.timestamps.update(getattr(result_item, 'trace', None) or {})
+            trace.stamp('result')
+        if work_item.future.cancelled():
+            # Cancelled while the actor handled it
+            if _shm is not None and isinstance(result_item.result,
+                                               _shm.ShmPayload):
+                result_item.result.unlink()
+        elif result_item.exception:
+            work_item.future.set_exception(result_item.exception)
+        elif codec is not None or (_shm is not None and isinstance(
+                result_item.result, _shm.ShmPayload)):
+            start = time.time()
+            error = None
+            try:
+                if codec is not None:
+                    result = codec.loads(result_item.result)
+                else:
+                    result = result_item.result.load(unlink=True)
+            except BaseException as e:
+                error = e
+            if metrics is not None:
+                metrics.add_deserialized(0, time.time() - start)
+            if error is not None:
+                work_item.future.set_exception(error)
             else:
-                del pending_work_items[work_id]
-                continue
+                work_item.future.set_result(result)
+        else:
+            work_item.future.set_result(result_item.result)
+        if trace is not None:
+            trace.finish()
+        # Delete references to object. See issue16284
+        del work_item
 
 
-if sys.version_info.major >= 3:
-    # Normal python3 version
-
-    def _queue_management_worker(executor_reference,
-                                 _manager,
-                                 pending_work_items,
-                                 work_ids_queue,
-                                 _call_queue,
-                                 _result_queue):
-        """Manages the communication between this process and the worker processes."""
-        executor = None
-
-        def shutting_down():
-            return process._shutdown or executor is None or executor._shutdown_thread
-
-        def shutdown_worker():
-            # This is an upper bound
-            if _manager.is_alive():
-                _call_queue.put_nowait(None)
-            # Release the queue's resources as soon as possible.
-            _call_queue.close()
-            # If .join() is not called on the created processes then
-            # some multiprocessing.Queue methods may deadlock on Mac OS X.
-            _manager.join()
+class _ActorChannel(object):
+    """
+    The part of a ProcessActorExecutor that the dispatcher thread works
+    with: the actor process and the messages that have not been answered yet.
 
-        reader = _result_queue._reader
+    It holds no reference to the executor, so an executor that is garbage
+    collected can still be shut down.
 
-        while True:
-            _add_call_item_to_queue(pending_work_items,
-                                    work_ids_queue,
-                                    _call_queue)
-
-            sentinel = _manager.sentinel
-            assert sentinel
-            ready = wait([reader, sentinel])
-            if reader in ready:
-                result_item = reader.recv()
+    Attributes:
+        pending_work_items (dict): maps work ids to _WorkItems until their
+            result arrives.
+        work_ids (futures_actors.mailbox._PriorityDeque): work ids that were
+            posted but not yet sent to the actor, by priority. A tuple of
+            work ids is a batch from `post_many` and is sent as a single list
+            of _CallItems. A _CallItem is a told message, which has no work
+            item.
+        max_inflight (int): number of messages that may be sent to the actor
+            before the dispatcher waits for their results. A `post_many`
+            batch is sent whole as long as the window is not yet full.
+        restart_policy (Callable | None): called with the channel when the
+            actor process crashed. If it returns True the actor is restarted
+            in a new process, otherwise the executor becomes broken.
+        restart_requested (bool): set to restart the actor the next time its
+            process exits without consulting the policy (e.g. after it was
+            killed by a supervisor).
+        mailbox (futures_actors.mailbox._Mailbox | None): the bounded
+            mailbox of the executor. Work items are taken out of it when
+            they are sent to the actor.
+        codec (futures_actors.serializers._Codec | None): decodes the results
+            if the executor has a serializer.
+        metrics (futures_actors.metrics._ExecutorMetrics | None): the
+            metrics of the executor, if it collects them. The reports of the
+            actor process are merged into them.
+        restarts (int): number of times the actor process was restarted.
+        tracer (futures_actors.tracing._Tracer | None): flushed once the
+            actor stopped, if the executor traces its messages.
+        context (multiprocessing.context.BaseContext | None): starts the
+            actor process, None for the default start method.
+        reservoir (futures_actors.reservoir.WorkerReservoir | None): lends
+            the process the actor runs in, if any.
+        journal (futures_actors.journal._Journal | None): logs the messages
+            until they are acknowledged, if the executor has a journal.
+        signals (collections.deque): _StreamCredits granted by the callers
+            iterating over streams and _CancelSignals of the messages
+            cancelled while they ran, sent to the actor before any message.
+        cancel_timeout (float | None): seconds the actor has to stop
+            handling a cancelled message before its process is killed.
+        kill_deadlines (dict): maps the work ids of the cancelled messages
+            to the time their handling must end, with a `cancel_timeout`.
+        sent_work_ids (collections.deque): with a `cancel_timeout`, the work
+            ids of the messages sent to the actor (told _CallItems for the
+            told ones) that it may not have finished, in the order it handles
+            them. The first one is the message it is handling.
+    """
+    def __init__(self, max_inflight):
+        self.lock = threading.Lock()
+        self.actor_process = None
+        self.spawn_args = None
+        self.restart_policy = None
+        self.restart_requested = False
+        # True once the actor process said goodbye before exiting
+        self.exited_cleanly = False
+        self.dispatcher = None
+        self.executor_ref = None
+        self.pending_work_items = {}
+        self.work_ids = mailbox._PriorityDeque()
+        self.max_inflight = max_inflight
+        self.n_inflight = 0
+        self.shutting_down = False
+        # True once the actor was told to stop
+        self.stopping = False
+        self.broken = False
+        self.closed = threading.Event()
+        self.mailbox = None
+        self.codec = None
+        self.metrics = None
+        self.restarts = 0
+        self.tracer = None
+        self.context = None
+        self.reservoir = None
+        self.journal = None
+        self.signals = collections.deque()
+        self.cancel_timeout = None
+        self.kill_deadlines = {}
+        self.sent_work_ids = collections.deque()
+        # True once the actor was killed for not stopping a cancelled message
+        self.killed_cancelled = False
+
+    def notify(self):
+        """
+        Asks the dispatcher to look at this channel
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.notify(self)
+
+    def grant_credit(self, work_id, n):
+        """
+        Lets the actor send `n` more chunks of a streamed message. Called by
+        the threads iterating over the streams.
+        """
+        self.signals.append(streams._StreamCredit(work_id, n))
+        self.notify()
+
+    def cancel_running(self, work_id):
+        """
+        Tells the actor that a message it received was cancelled. Called by
+        the threads cancelling the Futures.
+        """
+        self.signals.append(cancellation._CancelSignal(work_id))
+        self.notify()
+
+    def request_shutdown(self):
+        self.shutting_down = True
+        self.notify()
+
+    def start(self, _ActorClass, args, kwargs, options):
+        """
+        Starts the actor process and remembers how to restart it
+        """
+        self.spawn_args = (_ActorClass, args, kwargs, options)
+        self.actor_process = _ActorProcess(_ActorClass, args, kwargs, options,
+                                           listen=True, context=self.context,
+                                           reservoir=self.reservoir)
+
+    def kill(self):
+        """
+        Terminates the actor process, if it is running
+        """
+        if self.actor_process is not None and not self.closed.is_set():
+            self.actor_process.process.terminate()
+
+    def _set_running(self, work_id):
+        work_item = self.pending_work_items[work_id]
+        future = work_item.future
+        # Messages replayed after a restart are already running, and out of
+        # the mailbox
+        if future.running():
+            return True
+        if self.mailbox is not None and not self.mailbox.take(work_item):
+            # Dropped to make room in the mailbox
+            del self.pending_work_items[work_id]
+            return False
+        if future.set_running_or_notify_cancel():
+            return True
+        del self.pending_work_items[work_id]
+        return False
+
+    def _call_item(self, work_id):
+        work_item = self.pending_work_items[work_id]
+        call_item = _CallItem(work_id, work_item.message)
+        if work_item.posted_at is not None:
+            call_item.posted_at = work_item.posted_at
+        if work_item.stream is not None:
+            call_item.stream = work_item.stream.window
+        if work_item.trace is not None:
+            work_item.trace.stamp('send')
+            work_item.trace.pid = self.actor_process.process.pid
+            call_item.trace = work_item.trace.timestamps
+        return call_item
+
+    def add_call_items(self):
+        """
+        Sends posted messages to the actor until the pipeline is full.
+        Messages cancelled before being sent are dropped, and messages that
+        cannot be pickled fail right away.
+        """
+        while self.n_inflight < self.max_inflight and self.work_ids:
+            work_id, priority = self.work_ids.popleft()
+            if isinstance(work_id, _CallItem):
+                if self.mailbox is None or self.mailbox.take(work_id):
+                    # Told messages are never answered, so they do not take
+                    # a place in the pipeline window
+                    try:
+                        self.actor_process.send(work_id, self.metrics)
+                    except (OSError, IOError):
+                        self.work_ids.appendleft(work_id, priority)
+                        return
+                    except BaseException:
+                        # There is no Future to report the pickling error to
+                        pass
+                    else:
+                        if self.cancel_timeout is not None:
+                            self.sent_work_ids.append(work_id)
+                if work_id.journal_seq is not None:
+                    self.journal.ack(work_id.journal_seq)
+                continue
+            if isinstance(work_id, tuple):
+                work_ids = [w for w in work_id if self._set_running(w)]
+                call_item = [self._call_item(w) for w in work_ids]
             else:
-                # Mark the process pool broken so that submits fail right now.
-                executor = executor_reference()
-                if executor is not None:
-                    executor._broken = True
-                    executor._shutdown_thread = True
-                    executor = None
-                # All futures in flight must be marked failed
-                for work_id, work_item in pending_work_items.items():
-                    work_item.future.set_exception(
-                        BrokenProcessPool(
-                            "A process in the process pool was "
-                            "terminated abruptly while the future was "
-                            "running or pending."
-                        ))
-                    # Delete references to object. See issue16284
-                    del work_item
-                # pending_work_items.clear()
-                del pending_work_items[:]
-                # Terminate remaining workers forcibly: the queues or their
-                # locks may be in a dirty state and block forever.
-                _manager.terminate()
-                shutdown_worker()
+                work_ids = [work_id] if self._set_running(work_id) else []
+                if work_ids:
+                    call_item = self._call_item(work_id)
+            if not work_ids:
+                continue
+            try:
+                self.actor_process.send(call_item, self.metrics)
+            except (OSError, IOError):
+                # The actor died. Its sentinel decides what happens to the
+                # message, which was not dispatched.
+                self.work_ids.appendleft(
+                    tuple(work_ids) if isinstance(work_id, tuple) else work_id,
+                    priority)
                 return
+            except BaseException as e:
+                for w in work_ids:
+                    self.pending_work_items.pop(w).future.set_exception(e)
+                continue
+            self.n_inflight += len(work_ids)
+            if self.cancel_timeout is not None:
+                self.sent_work_ids.extend(work_ids)
+
+    def pump(self):
+        """
+        Feeds the actor, and tells it to stop once it is shut down and all of
+        its messages have been answered.
+        """
+        if self.stopping or self.closed.is_set():
+            return
+        while self.signals:
+            signal = self.signals.popleft()
+            if (type(signal) is cancellation._CancelSignal and
+                    self.cancel_timeout is not None):
+                self.kill_deadlines[signal.work_id] = (time.time() +
+                                                       self.cancel_timeout)
+            try:
+                self.actor_process.send(signal)
+            except (OSError, IOError):
+                # The actor died, its streams and cancelled messages are over
+                self.signals.clear()
+        self.add_call_items()
+        if ((self.shutting_down or _interpreter_shutting_down()) and
+                not self.pending_work_items and not self.work_ids):
+            self.stopping = True
+            try:
+                self.actor_process.send(None)
+            except (OSError, IOError):
+                pass
+
+    def on_results_ready(self):
+        """
+        Resolves the Futures of the results sent by the actor.
+
+        Returns:
+            bool: True if the actor stopped in a reservoir worker, whose
+                process does not exit
+        """
+        if self.closed.is_set():
+            return False
+        result_conn = self.actor_process.result_conn
+        metrics = self.metrics
+        while result_conn.poll():
+            try:
+                if metrics is None:
+                    result_item = result_conn.recv()
+                else:
+                    data = result_conn.recv_bytes()
+                    start = time.time()
+                    result_item = _loads(data)
+                    metrics.add_deserialized(len(data), time.time() - start)
+                    del data
+            except EOFError:
+                break
             if isinstance(result_item, int):
-                # Clean shutdown of a worker using its PID
+                # Clean shutdown of the actor using its PID
                 # (avoids marking the executor broken)
-                assert shutting_down()
-                _manager.join()
-                if _manager is None:
-                    shutdown_worker()
-                    return
-            elif result_item is not None:
-                work_item = pending_work_items.pop(result_item.work_id, None)
-                # work_item can be None if another process terminated (see above)
-                if work_item is not None:
-                    if result_item.exception:
-                        work_item.future.set_exception(result_item.exception)
-                    else:
-                        work_item.future.set_result(result_item.result)
-                    # Delete references to object. See issue16284
-                    del work_item
-            # Check whether we should start shutting down.
-            executor = executor_reference()
-            # No more work items can be added if:
-            #   - The interpreter is shutting down OR
-            #   - The executor that owns this worker has been collected OR
-            #   - The executor that owns this worker has been shutdown.
-            if shutting_down():
-                try:
-                    # Since no new work items can be added, it is safe to shutdown
-                    # this thread if there are no pending work items.
-                    if not pending_work_items:
-                        shutdown_worker()
-                        return
-                except queue.Full:
-                    # This is not a problem: we will eventually be woken up (in
-                    # _result_queue.get()) and be able to send a sentinel again.
-                    pass
-            executor = None
-else:
-    # Compatibility with the python 2 backport
-    def _queue_management_worker(executor_reference, _manager,
-                                 pending_work_items, work_ids_queue,
-                                 _call_queue, _result_queue):
-        nb_shutdown_processes = [0]
-        def shutdown_one_process():
-            """Tell a worker to terminate, which will in turn wake us again"""
-            _call_queue.put(None)
-            nb_shutdown_processes[0] += 1
-        while True:
-            _add_call_item_to_queue(pending_work_items,
-                                    work_ids_queue,
-                                    _call_queue)
+                self.exited_cleanly = True
+                if self.actor_process.worker is not None:
+                    return True
+                continue
+            if type(result_item) is streams._StreamChunk:
+                # The message stays in flight until its result arrives
+                _put_stream_chunk(self.pending_work_items, result_item,
+                                  self.codec)
+                continue
+            if isinstance(result_item, metrics_module._ActorMetrics):
+                # What the actor process did since its last report
+                metrics.merge(result_item)
+                if metrics.hook is not None:
+                    metrics.call_hook(self.stats())
+                continue
+            if isinstance(result_item, list):
+                # A batching actor answers several frames at once
+                self.n_inflight -= len(result_item)
+                for batch_result_item in result_item:
+                    self._forget_sent(batch_result_item.work_id)
+                    _set_future_result(self.pending_work_items,
+                                       batch_result_item, self.codec, metrics)
+            else:
+                self.n_inflight -= 1
+                self._forget_sent(result_item.work_id)
+                _set_future_result(self.pending_work_items, result_item,
+                                   self.codec, metrics)
+            del result_item
+        return False
+
+    def on_exit(self):
+        """
+        Called once the actor process has exited. Restarts the actor if it
+        crashed and its restart policy allows it, otherwise fails the
+        messages that will never be answered.
 
-            result_item = _result_queue.get(block=True)
-            if result_item is not None:
-                work_item = pending_work_items[result_item.work_id]
-                del pending_work_items[result_item.work_id]
+        Returns:
+            bool: True if the actor was restarted in a new process
+        """
+        # Results sent right before the process exited are still readable
+        self.on_results_ready()
+        self.actor_process.close()
+        crashed = not self.exited_cleanly
+        if crashed and not self.stopping and self._should_restart():
+            self._restart()
+            return True
+        with self.lock:
+            # Mark the executor broken so that posts fail right now.
+            if crashed or self.pending_work_items:
+                self.broken = True
+                self.shutting_down = True
+            work_items = list(self.pending_work_items.values())
+            self.pending_work_items.clear()
+            self.work_ids.clear()
+        if self.broken and self.mailbox is not None:
+            # Posts waiting for room raise BrokenProcessPool
+            self.mailbox.close()
+        _fail_work_items(work_items, BrokenProcessPool(
+            'The actor process was terminated abruptly while the '
+            'future was running or pending.'))
+        del work_items
+        if self.tracer is not None:
+            self.tracer.flush()
+        if self.journal is not None:
+            self.journal.close()
+        self.closed.set()
+        return False
 
-                if result_item.exception:
-                    work_item.future.set_exception(result_item.exception)
+    def stats(self):
+        """
+        Returns the stats dict of the executor
+        """
+        depth = sum(len(w) if isinstance(w, tuple) else 1
+                    for w in self.work_ids.items())
+        stats = {'mailbox_depth': depth, 'restarts': self.restarts}
+        if self.metrics is not None:
+            stats.update(self.metrics.snapshot())
+            stats['inflight'] = self.n_inflight
+        return stats
+
+    def kill_cancelled(self):
+        """
+        Kills the actor process if it is still handling a cancelled message
+        past its deadline. It is restarted, and the other messages that were
+        sent to it are replayed.
+
+        Returns:
+            float | None: seconds until the next deadline, None if there is
+                none to wait for
+        """
+        now = time.time()
+        next_deadline = None
+        with self.lock:
+            running = self.sent_work_ids[0] if self.sent_work_ids else None
+            for work_id, deadline in list(self.kill_deadlines.items()):
+                if work_id not in self.pending_work_items:
+                    # The actor stopped in time
+                    del self.kill_deadlines[work_id]
+                elif deadline > now:
+                    next_deadline = min(deadline, next_deadline or deadline)
+                elif work_id == running:
+                    # The actor is still handling it
+                    self.kill_deadlines.clear()
+                    self.killed_cancelled = True
+                    self.restart_requested = True
+                    self.kill()
+                    return None
+        if next_deadline is None:
+            return None
+        return max(next_deadline - now, 0)
+
+    def _forget_sent(self, work_id):
+        """
+        The actor answered the message `work_id`. It handles the messages in
+        the order they were sent, so it is done with the ones sent before.
+        """
+        sent = self.sent_work_ids
+        if sent and work_id in sent:
+            while sent.popleft() != work_id:
+                pass
+
+    def _dispatched_work_ids(self):
+        """
+        Returns the work ids of the messages sent to the actor and not
+        answered yet, oldest first. Must be called with the lock held.
+        """
+        undispatched = set()
+        for work_id in self.work_ids:
+            if isinstance(work_id, tuple):
+                undispatched.update(work_id)
+            elif not isinstance(work_id, _CallItem):
+                undispatched.add(work_id)
+        return sorted(work_id for work_id in self.pending_work_items
+                      if work_id not in undispatched)
+
+    def _should_restart(self):
+        if self.restart_requested:
+            self.restart_requested = False
+            return True
+        return self.restart_policy is not None and self.restart_policy(self)
+
+    def _restart(self):
+        """
+        Starts a new actor process. The messages that were dispatched to the
+        crashed process fail, and the ones that were not are replayed. With
+        a journal, the dispatched messages are replayed first, unless the
+        actor crashed too many times while handling them. So are they if the
+        actor was killed because it did not stop handling a cancelled
+        message, which was the only one it started.
+        """
+        killed_cancelled, self.killed_cancelled = self.killed_cancelled, False
+        self.kill_deadlines.clear()
+        self.sent_work_ids.clear()
+        with self.lock:
+            dispatched = self._dispatched_work_ids()
+            if dispatched and not killed_cancelled:
+                # The actor was most likely handling the oldest one
+                self.pending_work_items[dispatched[0]].crashes += 1
+            work_items = []
+            redelivered = []
+            for work_id in dispatched:
+                work_item = self.pending_work_items[work_id]
+                if work_item.future.cancelled():
+                    # Already resolved
+                    del self.pending_work_items[work_id]
+                    continue
+                # The caller already got chunks of a streamed message
+                if work_item.stream is None and (killed_cancelled or (
+                        self.journal is not None and work_item.crashes <=
+                        journal_module.MAX_REDELIVERIES)):
+                    redelivered.append(work_id)
                 else:
-                    work_item.future.set_result(result_item.result)
-                # Delete references to object. See issue16284
-                del work_item
-            # Check whether we should start shutting down.
-            executor = executor_reference()
-            # No more work items can be added if:
-            #   - The interpreter is shutting down OR
-            #   - The executor that owns this worker has been collected OR
-            #   - The executor that owns this worker has been shutdown.
-            if process._shutdown or executor is None or executor._shutdown_thread:
-                # Since no new work items can be added, it is safe to shutdown
-                # this thread if there are no pending work items.
-                if not pending_work_items:
-                    while nb_shutdown_processes[0] < 1:
-                        shutdown_one_process()
-                    # If .join() is not called on the created processes then
-                    # some multiprocessing.Queue methods may deadlock on Mac OS
-                    # X.
-                    _manager.join()
-                    _call_queue.close()
-                    return
-            del executor
+                    work_items.append(self.pending_work_items.pop(work_id))
+            for work_id in reversed(redelivered):
+                self.work_ids.appendleft(work_id)
+        _fail_work_items(work_items, BrokenProcessPool(
+            'The actor process crashed while the message was dispatched '
+            'to it. The actor was restarted.'))
+        del work_items
+        self.n_inflight = 0
+        self.restarts += 1
+        _ActorClass, args, kwargs, options = self.spawn_args
+        self.actor_process = _ActorProcess(
+            _ActorClass, args, kwargs, options, listen=True,
+            ref_address=self.actor_process.ref_address, context=self.context,
+            reservoir=self.reservoir)
+
+
+def _ack_when_done(channel, seq):
+    """
+    Returns a done callback of a Future that acknowledges its message in the
+    journal, unless the Future failed because the executor broke.
+    """
+    def ack(_):
+        if not channel.broken:
+            channel.journal.ack(seq)
+    return ack
+
+
+def _fail_work_items(work_items, exception):
+    for work_item in work_items:
+        if not work_item.future.done():
+            work_item.future.set_exception(exception)
+
+
+class _Dispatcher(object):
+    """
+    Thread that manages the communication with the processes of all
+    ProcessActorExecutors.
+
+    A single selector watches the result pipe and the sentinel of every actor
+    process, so the number of threads in the parent does not grow with the
+    number of actors. Executors call `notify` after posting, which marks
+    their channel and wakes the selector through a local pipe.
+
+    Future callbacks run on this thread, so they should be quick. It also
+    kills the actor processes that keep handling a message past its
+    `_cancel_timeout`.
+    """
+    def __init__(self):
+        # Reentrant for the same reason as the lock of _ThreadWakeup
+        self._lock = threading.RLock()
+        self._thread_wakeup = _ThreadWakeup()
+        self._selector = _Selector()
+        self._selector.register(self._thread_wakeup._reader, _EVENT_READ,
+                                None)
+        self._channels = set()
+        self._new_channels = []
+        self._dirty = set()
+        self._exited = False
+        # The dispatchers of a parent are left alone by its forked children
+        self._fork_generation = _fork_generation
+        self._thread = threading.Thread(target=self._run,
+                                        name='ProcessActorDispatcher')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        _register_management_thread(self._thread, self._thread_wakeup)
+
+    def register(self, channel):
+        """
+        Starts watching the actor process of `channel`. Returns False if this
+        dispatcher has already exited.
+        """
+        with self._lock:
+            if self._exited:
+                return False
+            channel.dispatcher = self
+            self._new_channels.append(channel)
+            self._dirty.add(channel)
+        self._thread_wakeup.wakeup()
+        return True
+
+    def notify(self, channel):
+        if self._fork_generation != _fork_generation:
+            # Inherited from the parent, e.g. by the weakref callback of an
+            # executor collected in a forked child. Its thread is not running
+            # here and its locks may have been held during the fork.
+            return
+        with self._lock:
+            self._dirty.add(channel)
+        self._thread_wakeup.wakeup()
+
+    def _watch(self, channel):
+        self._channels.add(channel)
+        actor_process = channel.actor_process
+        self._selector.register(actor_process.result_conn, _EVENT_READ,
+                                (channel, False))
+        if actor_process.sentinel is not None:
+            self._selector.register(actor_process.sentinel, _EVENT_READ,
+                                    (channel, True))
+
+    def _on_exit(self, channel):
+        actor_process = channel.actor_process
+        self._selector.unregister(actor_process.result_conn)
+        if actor_process.sentinel is not None:
+            self._selector.unregister(actor_process.sentinel)
+        if channel.on_exit():
+            # Watch the new process and replay the queued messages
+            self._watch(channel)
+            channel.pump()
+        else:
+            self._channels.discard(channel)
+
+    def _run(self):
+        while True:
+            polled = [c for c in self._channels
+                      if c.actor_process.sentinel is None]
+            timeout = 0.1 if polled else None
+            for channel in self._channels:
+                if channel.kill_deadlines:
+                    due = channel.kill_cancelled()
+                    if due is not None and (timeout is None or due < timeout):
+                        timeout = due
+            exited = set()
+            ready = set()
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    self._thread_wakeup.clear()
+                    continue
+                channel, is_sentinel = key.data
+                if is_sentinel:
+                    exited.add(channel)
+                else:
+                    if channel.on_results_ready():
+                        exited.add(channel)
+                    ready.add(channel)
+            exited.update(c for c in polled
+                          if c.actor_process.process.exitcode is not None)
+            for channel in exited:
+                self._on_exit(channel)
+
+            with self._lock:
+                new_channels, self._new_channels = self._new_channels, []
+                dirty, self._dirty = self._dirty, set()
+            for channel in new_channels:
+                self._watch(channel)
+            if _interpreter_shutting_down():
+                # Every actor has to stop
+                dirty = self._channels
+            for channel in dirty | ready:
+                if channel in self._channels:
+                    channel.pump()
+
+            with self._lock:
+                if (_interpreter_shutting_down() and not self._channels and
+                        not self._new_channels):
+                    self._exited = True
+            if self._exited:
+                self._selector.close()
+                self._thread_wakeup.close()
+                return
+
+
+_dispatcher_lock = threading.Lock()
+_dispatcher = None
+# Incremented in forked children
+_fork_generation = 0
+
+
+def _register_channel(channel):
+    """
+    Hands an actor channel to the shared dispatcher, starting a dispatcher
+    thread if there is none.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.register(channel):
+            _dispatcher = _Dispatcher()
+            _dispatcher.register(channel)
+            _dispatcher.start()
+
+
+def _forget_dispatcher():
+    # A forked child does not inherit the dispatcher thread. It must not try
+    # to wake it at exit either, its lock may have been held during the fork.
+    global _dispatcher, _dispatcher_lock, _fork_generation
+    _fork_generation += 1
+    if _dispatcher is not None:
+        for registry in ('_threads_wakeups', '_threads_queues'):
+            getattr(process, registry, {}).pop(_dispatcher._thread, None)
+    _dispatcher = None
+    _dispatcher_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_dispatcher)
 
 
 class ProcessActorExecutor(_base_actor.ActorExecutor):
+    """
+    Manages a single actor living in a separate process.
+
+    The executor does not start any threads of its own: a dispatcher thread
+    shared by all ProcessActorExecutors sends the messages to the actor
+    processes and puts their results in the Futures.
+
+    Executor options are passed as underscore-prefixed keyword arguments so
+    they cannot collide with the arguments of the actor's constructor.
+
+    Args:
+        _pipeline_depth (int, default=None): the number of messages that
+            may wait in the child's call queue while the actor is busy
+            handling the current one. Larger values keep the actor fed when
+            messages are cheap to handle, at the cost of those queued messages
+            no longer being cancellable. Defaults to 1, or to the actor's
+            `max_batch_size` if it defines `handle_batch`.
+
+        _shm_threshold (int, default=None): if specified, enables the shared
+            memory transport (python 3.8+). Messages and results are pickled
+            with protocol 5 and every out-of-band buffer of at least this
+            many bytes (numpy array data, `pickle.PickleBuffer` objects) is
+            passed through `multiprocessing.shared_memory` instead of being
+            copied through the pipes. See `futures_actors._shm`.
+
+        _mailbox_size (int, default=None): if specified, at most this many
+            posted messages wait to be sent to the actor. `_overflow` picks
+            what happens to messages posted to a full mailbox, and
+            `_coalesce_key` is the key function of the 'coalesce' policy.
+            See `futures_actors.mailbox`.
+
+        _serializer (str | Serializer, default=None): encodes the messages
+            and results instead of the default pickling. One of 'pickle',
+            'cloudpickle', 'msgpack', 'bytes' or a `Serializer` instance.
+            With `_compression` ('zlib' or 'lzma'), the encoded messages and
+            results of at least `_compress_threshold` bytes (default 64KiB)
+            are compressed. See `futures_actors.serializers`.
+
+        _stats (bool, default=False): if True, counts and times the messages
+            and their serialization, see `stats`. `_stats_hook` is called
+            with the stats every `_stats_interval` seconds while the actor
+            is busy. See `futures_actors.metrics`.
+
+        _trace (Callable | str, default=None): traces the trip of each
+            posted message, from `post` through the actor process back to
+            its Future. Each `tracing.MessageTrace` is passed to `_trace`,
+            or written as a Chrome trace-event JSON file if it is a path.
+            See `futures_actors.tracing`.
+
+        _mp_context (str | multiprocessing.context.BaseContext, default=None):
+            starts the actor process with this start method ('fork', 'spawn'
+            or 'forkserver') instead of the default one. `_preload` lists
+            modules imported once by the fork server (or by this process
+            with 'fork'), so the actor does not import them again. See
+            `futures_actors.contexts`.
+
+        _reservoir (WorkerReservoir, default=None): runs the actor in an idle
+            worker process of this reservoir instead of starting a new
+            process, and gives the worker back once the actor stopped. The
+            actor class and its arguments must be picklable. See
+            `futures_actors.reservoir`.
+
+        _checkpoint (str, default=None): path of a checkpoint file. The
+            actor process writes `actor.snapshot()` there every
+            `_checkpoint_interval` seconds (default 60) and when the actor
+            stops, and restores the actor from it when it starts, so a
+            restarted actor resumes from its latest checkpoint. See
+            `futures_actors.checkpoint`.
+
+        _journal (str, default=None): directory of a write-ahead log of the
+            messages. Messages stay in it until they are answered, and the
+            ones left by a crashed executor are posted again by the next
+            executor of the journal (their Futures are in `recovered`).
+            Messages in flight when the actor crashes are sent again to the
+            restarted actor. New messages are synced to disk every
+            `_journal_sync` seconds (default 0.01). See
+            `futures_actors.journal`.
+
+        _cache_key (Callable, default=None): maps messages to keys. Posts
+            of a key that is in flight share its Future, and the results of
+            the last `_cache_size` keys (default 1024) are returned without
+            reaching the actor for `_cache_ttl` seconds (default forever).
+            See `futures_actors.cache`.
+
+        _cancellable (bool, default=False): if True, Futures can also be
+            cancelled while the actor handles their message, which
+            `actor.cancelled()` then reports. With `_cancel_timeout`, the
+            actor process is killed and restarted if it keeps handling a
+            cancelled message for that many seconds. See
+            `futures_actors.cancellation`.
+
+    Attributes:
+        recovered (List[Future]): Futures of the posted messages recovered
+            from the journal, empty without a journal.
+    """
 
     def __init__(self, _ActorClass, *args, **kwargs):
         process._check_system_limits()
 
+        pipeline_depth = kwargs.pop('_pipeline_depth', None)
+        if pipeline_depth is None:
+            # Batching actors can only gather what is already in the call queue
+            if _base_actor._supports_batching(_ActorClass):
+                pipeline_depth = _ActorClass.max_batch_size
+            else:
+                pipeline_depth = 1
+        if pipeline_depth < 1:
+            raise ValueError('_pipeline_depth must be at least 1')
+        shm_threshold = kwargs.pop('_shm_threshold', None)
+        if shm_threshold is not None and _shm is None:
+            raise NotImplementedError(
+                'The shared memory transport requires python 3.8+')
+        codec = serializers._pop_serializer_options(kwargs)
+        if codec is not None and shm_threshold is not None:
+            raise ValueError(
+                'The shared memory transport has its own serializer')
+
         self._ActorClass = _ActorClass
-        # self._call_queue = multiprocessing.JoinableQueue()
-        # If we want to cancel futures we need to give the task_queue a maximum
-        # size
-        self._call_queue = multiprocessing.Queue(1)
-        self._call_queue._ignore_epipe = True
-        self._result_queue = multiprocessing.Queue()
-        self._work_ids = queue.Queue()
-        self._queue_management_thread = None
-
-        # We only maintain one process for our actor
-        self._manager = None
+        self._pipeline_depth = pipeline_depth
+        self._shm_threshold = shm_threshold
+        self._codec = codec
+        # If we want to cancel futures we need to limit the number of messages
+        # sent to the actor: the one being handled plus `pipeline_depth`
+        # queued behind it. Only messages that have not been sent yet can be
+        # cancelled.
+        self._channel = _ActorChannel(pipeline_depth + 1)
+        self._channel.codec = codec
+        self._metrics = self._channel.metrics = (
+            metrics_module._pop_stats_options(kwargs))
+        self._tracer = self._channel.tracer = (
+            tracing._pop_trace_options(kwargs, _ActorClass))
+        self._mailbox = self._channel.mailbox = (
+            mailbox._pop_mailbox_options(kwargs))
+        self._channel.context = contexts._pop_context_options(kwargs)
+        self._channel.reservoir = kwargs.pop('_reservoir', None)
+        self._checkpoint = checkpoint_module._pop_checkpoint_options(kwargs)
+        if (self._checkpoint is not None and
+                not _base_actor._supports_snapshots(_ActorClass)):
+            raise TypeError(
+                '{} must define snapshot and restore to be checkpointed'
+                .format(_ActorClass.__name__))
+        if (self._channel.reservoir is not None and
+                self._channel.context is not None):
+            raise ValueError(
+                'The reservoir chooses how its workers are started')
+        if self._mailbox is not None and shm_threshold is not None:
+            # Segments of dropped and replaced messages
+            self._mailbox.release_message = _shm.ShmPayload.unlink
+        self._cache = cache_module._pop_cache_options(kwargs)
+        self._cancellable, self._channel.cancel_timeout = (
+            cancellation._pop_cancel_options(kwargs))
+        self._journal = self._channel.journal = (
+            journal_module._pop_journal_options(kwargs))
+        self.recovered = []
 
         # Shutdown is a two-step process.
         self._shutdown_thread = False
-        self._shutdown_lock = threading.Lock()
-        self._broken = False
+        self._shutdown_lock = self._channel.lock
         self._queue_count = 0
-        self._pending_work_items = {}
 
         self._did_initialize = False
 
@@ -317,78 +1680,315 @@ class ProcessActorExecutor(_base_actor.ActorExecutor):
             print('Init with args')
             print('args = %r' % (args,))
             self._initialize_actor(*args, **kwargs)
+        if self._journal is not None and self._journal.recovered:
+            self._replay_journal()
 
-    def post(self, message):
-        with self._shutdown_lock:
-            if self._broken:
-                raise BrokenProcessPool(
-                    'A child process terminated '
-                    'abruptly, the process pool is not usable anymore')
-            if self._shutdown_thread:
-                raise RuntimeError('cannot schedule new futures after shutdown')
+    @property
+    def _broken(self):
+        return self._channel.broken
 
-            f = _base.Future()
-            w = _WorkItem(f, message)
+    def post(self, message, timeout=None, priority=0):
+        if self._cache is not None:
+            return self._cache.post(message, self._post, timeout, priority)
+        return self._post(message, timeout, priority)
+    post.__doc__ = _base_actor.ActorExecutor.post.__doc__
 
-            self._pending_work_items[self._queue_count] = w
-            self._work_ids.put(self._queue_count)
+    def _post(self, message, timeout=None, priority=0, stream=None):
+        f = self._future() if stream is None else stream.future
+        try:
+            w = _WorkItem(f, self._encode_message(message, f))
+            w.stream = stream
+            if self._journal is not None and stream is None:
+                w.journal_record = journal_module._dumps(message)
+        except BaseException as e:
+            f.set_exception(e)
+            return f
+        if self._metrics is not None:
+            w.posted_at = time.time()
+        if self._tracer is not None:
+            w.trace = self._tracer.new_trace()
+        if self._mailbox is not None:
+            queued = self._admit(w, timeout, message)
+            if queued is None:
+                return f
+            elif queued is not w:
+                if self._journal is not None:
+                    self._log_coalesced(queued, w.journal_record)
+                return queued.future
+        with self._shutdown_lock:
+            self._check_can_post([w])
+            if self._metrics is not None:
+                self._metrics.count_posted()
+            if w.trace is not None:
+                w.trace.work_id = self._queue_count
+            if w.journal_record is not None:
+                self._log_work_item(w)
+            if stream is not None:
+                stream._grant = functools.partial(self._channel.grant_credit,
+                                                  self._queue_count)
+            elif self._cancellable:
+                f._cancel_running = functools.partial(
+                    self._channel.cancel_running, self._queue_count)
+            self._channel.pending_work_items[self._queue_count] = w
+            self._channel.work_ids.append(self._queue_count, priority)
             self._queue_count += 1
-            # Wake up queue management thread
-            self._result_queue.put(None)
-
-            self._start_queue_management_thread()
+            self._initialize_actor()
+            self._channel.notify()
             return f
-    post.__doc__ = _base_actor.ActorExecutor.post.__doc__
 
-    def _start_queue_management_thread(self):
-        # When the executor gets lost, the weakref callback will wake up
-        # the queue management thread.
+    def stream(self, message, window=streams.DEFAULT_WINDOW, timeout=None,
+               priority=0):
+        streams._check_streamable(self._ActorClass, self._mailbox)
+        stream = streams.Stream(_base.Future(), window)
+        self._post(message, timeout, priority, stream)
+        return stream
+    stream.__doc__ = _base_actor.ActorExecutor.stream.__doc__
 
-        def weakref_cb(_, q=self._result_queue):
-            q.put(None)
+    def post_many(self, messages):
+        if self._mailbox is not None or self._cache is not None:
+            # Every message has to be admitted (or looked up) on its own
+            return [self.post(message) for message in messages]
+        fs = []
+        work_items = []
+        for message in messages:
+            f = self._future()
+            try:
+                w = _WorkItem(f, self._encode_message(message, f))
+                if self._journal is not None:
+                    w.journal_record = journal_module._dumps(message)
+            except BaseException as e:
+                f.set_exception(e)
+            else:
+                work_items.append(w)
+            fs.append(f)
+        with self._shutdown_lock:
+            self._check_can_post(work_items)
+            if self._metrics is not None:
+                self._metrics.count_posted(len(work_items))
+                posted_at = time.time()
+                for w in work_items:
+                    w.posted_at = posted_at
+            work_ids = []
+            for w in work_items:
+                if self._tracer is not None:
+                    w.trace = self._tracer.new_trace()
+                    w.trace.work_id = self._queue_count
+                if self._journal is not None:
+                    self._log_work_item(w)
+                if self._cancellable:
+                    w.future._cancel_running = functools.partial(
+                        self._channel.cancel_running, self._queue_count)
+                self._channel.pending_work_items[self._queue_count] = w
+                work_ids.append(self._queue_count)
+                self._queue_count += 1
+            if not work_ids:
+                return fs
+            # The whole batch travels to the actor as a single frame
+            self._channel.work_ids.append(tuple(work_ids))
+            self._initialize_actor()
+            self._channel.notify()
+            return fs
+    post_many.__doc__ = _base_actor.ActorExecutor.post_many.__doc__
 
-        if self._queue_management_thread is None:
-            # Start the processes so that their sentinel are known.
+    def tell(self, message, timeout=None, priority=0):
+        call_item = _CallItem(None, self._encode_message(message))
+        if self._journal is not None:
+            call_item.journal_record = journal_module._dumps(message)
+        if self._metrics is not None:
+            call_item.posted_at = time.time()
+        if self._mailbox is not None:
+            queued = self._admit(call_item, timeout, message)
+            if queued is not call_item:
+                if queued is not None and self._journal is not None:
+                    self._log_coalesced(queued, call_item.journal_record)
+                return
+        with self._shutdown_lock:
+            self._check_can_post([call_item])
+            if self._metrics is not None:
+                self._metrics.count_posted()
+            if self._journal is not None:
+                call_item.journal_seq = self._journal.append(
+                    journal_module.TELL, call_item.journal_record)
+                del call_item.journal_record
+            self._channel.work_ids.append(call_item, priority)
             self._initialize_actor()
-            self._queue_management_thread = threading.Thread(
-                    target=_queue_management_worker,
-                    args=(weakref.ref(self, weakref_cb),
-                          self._manager,
-                          self._pending_work_items,
-                          self._work_ids,
-                          self._call_queue,
-                          self._result_queue))
-            self._queue_management_thread.daemon = True
-            self._queue_management_thread.start()
-            # use structures already in futures as much as possible
-            process._threads_queues[self._queue_management_thread] = self._result_queue
+            self._channel.notify()
+    tell.__doc__ = _base_actor.ActorExecutor.tell.__doc__
+
+    def _future(self):
+        if self._cancellable:
+            return cancellation._CancellableFuture()
+        return _base.Future()
+
+    def _admit(self, item, timeout, message):
+        """
+        Passes a new _WorkItem (or told _CallItem) through the bounded
+        mailbox, which sees `message` as it was posted rather than encoded.
+        Returns the item to queue, the queued item it was coalesced into, or
+        None if it was dropped.
+        """
+        try:
+            queued = self._mailbox.admit(item, timeout, message)
+        except BaseException:
+            self._release(item)
+            raise
+        if queued is None:
+            self._release(item)
+        elif (queued is not item and self._shm_threshold is not None and
+                isinstance(queued, _WorkItem)):
+            # The queued message is ours now, reclaim it with its Future
+            payload = item.message
+            queued.future.add_done_callback(lambda _: payload.unlink())
+        return queued
+
+    def _release(self, item):
+        """
+        Releases an item that will never be sent: cancels its Future, which
+        also reclaims its shared memory.
+        """
+        if isinstance(item, _WorkItem):
+            item.future.cancel()
+        elif self._shm_threshold is not None:
+            item.message.unlink()
+
+    def _check_can_post(self, items):
+        """
+        Raises if the executor does not accept messages anymore, after
+        releasing the items that were about to be queued. Must be called with
+        the shutdown lock held.
+        """
+        if not (self._broken or self._shutdown_thread):
+            return
+        for item in items:
+            if self._mailbox is not None:
+                self._mailbox.discard(item)
+            self._release(item)
+        if self._broken:
+            raise BrokenProcessPool(
+                'A child process terminated '
+                'abruptly, the process pool is not usable anymore')
+        raise RuntimeError('cannot schedule new futures after shutdown')
+
+    def _log_work_item(self, work_item):
+        """
+        Appends a posted message to the journal. It is acknowledged once its
+        Future resolves. Must be called with the shutdown lock held.
+        """
+        work_item.journal_seq = self._journal.append(
+            journal_module.POST, work_item.journal_record)
+        del work_item.journal_record
+        work_item.future.add_done_callback(
+            _ack_when_done(self._channel, work_item.journal_seq))
+
+    def _log_coalesced(self, queued, record):
+        """
+        Logs the newer message that replaced the one of a queued item in a
+        coalescing mailbox
+        """
+        with self._shutdown_lock:
+            if queued.journal_seq is None:
+                # Its poster has not logged it yet, and will log this one
+                queued.journal_record = record
+            else:
+                kind = (journal_module.TELL if isinstance(queued, _CallItem)
+                        else journal_module.POST)
+                self._journal.replace(queued.journal_seq, kind, record)
+
+    def _replay_journal(self):
+        """
+        Posts the messages left unacknowledged in the journal again, then
+        acknowledges their old records.
+        """
+        for seq, kind, payload in self._journal.recovered:
+            try:
+                message = pickle.loads(payload)
+            except BaseException:
+                _base.LOGGER.exception(
+                    'Could not unpickle a message of the journal {}'.format(
+                        self._journal.path))
+            else:
+                if kind == journal_module.TELL:
+                    self.tell(message)
+                else:
+                    self.recovered.append(self.post(message))
+            self._journal.ack(seq)
+        self._journal.recovered = []
+
+    def _encode_message(self, message, future=None):
+        """
+        Returns the message in the form it is sent to the actor process.
+        Runs in the posting thread, so the dispatcher does not pay for it.
+        """
+        if self._codec is None and self._shm_threshold is None:
+            return message
+        start = time.time()
+        if self._codec is not None:
+            payload = self._codec.dumps(message)
+        else:
+            payload = _shm.dumps(message, self._shm_threshold)
+        if self._metrics is not None:
+            self._metrics.add_serialized(0, time.time() - start)
+        if self._codec is not None:
+            return payload
+        if future is not None:
+            # The segment is reclaimed as soon as the Future resolves. For
+            # told messages the actor process unlinks it.
+            future.add_done_callback(lambda _: payload.unlink())
+        return payload
 
     def _initialize_actor(self, *args, **kwargs):
-        if self._manager is None:
+        channel = self._channel
+        if channel.actor_process is None:
             assert self._did_initialize is False, 'only initialize actor once'
             self._did_initialize = True
-            # We only maintain one thread process for an actor
-            self._manager = multiprocessing.Process(
-                    target=_process_actor_eventloop,
-                    args=(self._call_queue,
-                          self._result_queue, self._ActorClass) + args,
-                    kwargs=kwargs)
-            self._manager.start()
+            # We only maintain one process for an actor
+            options = {'shm_threshold': self._shm_threshold,
+                       'codec': self._codec}
+            if self._metrics is not None:
+                options['stats_interval'] = self._metrics.interval
+            if self._checkpoint is not None:
+                options['checkpoint'] = self._checkpoint
+            if self._cancellable:
+                options['cancellable'] = True
+            if self._shm_threshold is not None:
+                _shm.ensure_tracker_running()
+            channel.start(self._ActorClass, args, kwargs, options)
+
+            # When the executor gets lost, the weakref callback will shut
+            # down the actor.
+            def weakref_cb(_, channel=channel):
+                channel.request_shutdown()
+            channel.executor_ref = weakref.ref(self, weakref_cb)
+            _register_channel(channel)
+
+    def stats(self):
+        stats = self._channel.stats()
+        if self._cache is not None:
+            stats.update(self._cache.stats())
+        return stats
+    stats.__doc__ = _base_actor.ActorExecutor.stats.__doc__
+
+    def ref(self):
+        from futures_actors import actor_ref
+        with self._shutdown_lock:
+            if self._shutdown_thread:
+                raise RuntimeError('cannot reference an actor after shutdown')
+            self._initialize_actor()
+        return actor_ref.ActorRef._for_executor(
+            self, self._channel.actor_process.ref_address)
+    ref.__doc__ = _base_actor.ActorExecutor.ref.__doc__
 
     def shutdown(self, wait=True):
         with self._shutdown_lock:
             self._shutdown_thread = True
-        if self._queue_management_thread:
-            # Wake up queue management thread
-            self._result_queue.put(None)
-            if wait:
-                self._queue_management_thread.join()
-        # To reduce the risk of opening too many files, remove references to
-        # objects that use file descriptors.
-        self._queue_management_thread = None
-        self._call_queue = None
-        self._result_queue = None
-        self._manager = None
+        if self._mailbox is not None:
+            self._mailbox.close()
+        if self._journal is not None and self._channel.actor_process is None:
+            # Without an actor, the channel never closes it
+            self._journal.close()
+        self._channel.request_shutdown()
+        if wait and self._channel.actor_process is not None:
+            self._channel.closed.wait()
     shutdown.__doc__ = _base.Executor.shutdown.__doc__
 
 
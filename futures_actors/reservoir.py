@@ -0,0 +1,277 @@
+"""
+Reservoir of pre-started worker processes for ProcessActors.
+
+Starting a process dominates the creation of a short-lived ProcessActor. A
+`WorkerReservoir` keeps generic worker processes started in advance. An
+executor created with `_reservoir` claims an idle worker and the actor is
+instantiated inside it, and once the actor stopped the worker goes back to
+the reservoir to run the next one:
+
+    * `size` idle workers are kept started. Claimed workers are replaced in
+      the background.
+    * At most `max_size` idle workers are kept, workers given back to a full
+      reservoir are stopped.
+    * Idle workers beyond `size` are stopped after `max_idle` seconds.
+    * Workers import the `preload` modules when they start, so actors that
+      need heavy libraries find them already imported.
+
+Workers are started by a thread of the reservoir. Forking the process from
+a thread while another thread imports a module can deadlock the child, so
+workers are started with the 'forkserver' method by default (where it is
+available), which also imports the `preload` modules only once.
+
+When no worker is idle, the executor starts one right away. A worker whose
+actor crashed is not reused. The actor class and its arguments are pickled
+to reach the worker, so the class must be importable from its module. State
+the actor leaves behind in its modules stays in the worker for the next
+actors.
+"""
+from concurrent.futures import _base
+from futures_actors import contexts
+from futures_actors import process_actor
+import atexit
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+class WorkerReservoir(object):
+    """
+    Pool of idle worker processes that ProcessActors can be started in.
+
+    Args:
+        size (int, default=2): number of idle workers kept started
+        max_size (int, default=8): maximum number of idle workers
+        max_idle (float, default=60.0): seconds after which the idle
+            workers beyond `size` are stopped
+        mp_context (str | multiprocessing.context.BaseContext, default=None):
+            start method of the workers, 'forkserver' if available. See
+            `futures_actors.contexts`.
+        preload (List[str], default=None): modules the workers import when
+            they start
+
+    Example:
+        >>> from futures_actors.tests import TestProcessActor
+        >>> with WorkerReservoir(size=1) as reservoir:
+        >>>     executor = TestProcessActor.executor(_reservoir=reservoir)
+        >>>     f = executor.post({'action': 'hello world'})
+        >>>     assert f.result() == 'hello world'
+        >>>     executor.shutdown(wait=True)
+    """
+
+    def __init__(self, size=2, max_size=8, max_idle=60.0, mp_context=None,
+                 preload=None):
+        if size < 0 or max_size < size:
+            raise ValueError('0 <= size <= max_size is required')
+        preload = list(preload or [])
+        if mp_context is None:
+            methods = getattr(multiprocessing, 'get_all_start_methods',
+                              lambda: [])()
+            mp_context = 'forkserver' if 'forkserver' in methods else None
+        if mp_context is None:
+            mp_context = multiprocessing
+        elif isinstance(mp_context, str):
+            mp_context = multiprocessing.get_context(mp_context)
+        if mp_context.get_start_method() == 'forkserver':
+            contexts.preload(preload)
+        self.size = size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.mp_context = mp_context
+        self.preload = preload
+        self._cond = threading.Condition()
+        # Oldest first
+        self._idle = []
+        self._closed = False
+        # False after a worker failed to start, until the next claim
+        self._replenish = True
+        self._thread = threading.Thread(target=self._maintain,
+                                        name='WorkerReservoir')
+        self._thread.daemon = True
+        self._thread.start()
+        _reservoirs.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def idle(self):
+        """
+        Returns the number of idle workers
+        """
+        with self._cond:
+            return len(self._idle)
+
+    def close(self):
+        """
+        Stops the idle workers. Workers still running an actor are stopped
+        when it stops.
+        """
+        with self._cond:
+            self._closed = True
+            workers, self._idle = self._idle, []
+            self._cond.notify_all()
+        for worker in workers:
+            worker.stop()
+
+    def _claim(self):
+        """
+        Returns an idle worker, or a new one if none is idle
+        """
+        worker = None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('cannot claim workers after close')
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    break
+                worker.stop()
+                worker = None
+            # Replace it
+            self._replenish = True
+            self._cond.notify()
+        if worker is None:
+            worker = _Worker(self)
+        return worker
+
+    def _release(self, worker):
+        """
+        Takes back a worker whose actor stopped
+        """
+        if (worker.process.is_alive() and
+                not process_actor._interpreter_shutting_down()):
+            with self._cond:
+                if not self._closed and len(self._idle) < self.max_size:
+                    worker.idle_since = time.time()
+                    self._idle.append(worker)
+                    self._cond.notify()
+                    return
+        worker.stop()
+
+    def _maintain(self):
+        """
+        Runs on a thread of the reservoir. Replaces the claimed workers and
+        stops the ones idle for too long.
+        """
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    expired = []
+                    now = time.time()
+                    while (len(self._idle) > self.size and
+                           self._idle[0].idle_since + self.max_idle <= now):
+                        expired.append(self._idle.pop(0))
+                    n_start = 0
+                    if self._replenish:
+                        n_start = self.size - len(self._idle)
+                    if expired or n_start > 0:
+                        break
+                    timeout = None
+                    if len(self._idle) > self.size:
+                        oldest = self._idle[0].idle_since
+                        timeout = oldest + self.max_idle - now
+                    self._cond.wait(timeout)
+            for worker in expired:
+                worker.stop()
+            for _ in range(n_start):
+                try:
+                    worker = _Worker(self)
+                except BaseException:
+                    _base.LOGGER.exception('Could not start a worker')
+                    with self._cond:
+                        self._replenish = False
+                    break
+                with self._cond:
+                    if not self._closed:
+                        self._idle.append(worker)
+                        worker = None
+                if worker is not None:
+                    worker.stop()
+
+
+class _Worker(object):
+    """
+    A worker process of a reservoir and the two pipes used to talk to it
+    """
+
+    def __init__(self, reservoir):
+        self.reservoir = reservoir
+        call_reader, self.call_conn = multiprocessing.Pipe(duplex=False)
+        self.result_conn, result_writer = multiprocessing.Pipe(duplex=False)
+        self.process = reservoir.mp_context.Process(
+            target=_run_worker,
+            args=(call_reader, result_writer, reservoir.preload))
+        self.process.start()
+        call_reader.close()
+        result_writer.close()
+        self.sentinel = getattr(self.process, 'sentinel', None)
+        self.idle_since = time.time()
+
+    def stop(self):
+        try:
+            self.call_conn.send(None)
+        except (OSError, IOError):
+            pass
+        self.process.join()
+        self.call_conn.close()
+        self.result_conn.close()
+
+
+def _run_worker(call_conn, result_conn, preload):
+    """
+    Main function of a worker process. Runs the actors it is sent one after
+    the other until the reservoir stops it, or its parent is gone.
+    """
+    for name in preload:
+        importlib.import_module(name)
+    parent_pid = os.getppid()
+    while True:
+        try:
+            if not call_conn.poll(1.0):
+                if os.getppid() != parent_pid:
+                    return
+                continue
+            job = call_conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        options, _ActorClass, args, kwargs = job
+        del job
+        process_actor._process_actor_eventloop(
+            call_conn, result_conn, options, _ActorClass, *args, **kwargs)
+        # Let the arguments of the actor go
+        del options, _ActorClass, args, kwargs
+
+
+_reservoirs = weakref.WeakSet()
+
+
+def _close_reservoirs():
+    # Idle workers would keep multiprocessing waiting for them at exit
+    for reservoir in list(_reservoirs):
+        reservoir.close()
+
+
+def _forget_reservoirs():
+    # The workers of a forked child's reservoirs belong to its parent
+    for reservoir in list(_reservoirs):
+        reservoir._cond = threading.Condition()
+        reservoir._idle = []
+        reservoir._closed = True
+
+
+atexit.register(_close_reservoirs)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_reservoirs)
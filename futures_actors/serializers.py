@@ -0,0 +1,240 @@
+"""
+Serializers for the messages and results of ProcessActors.
+
+By default messages and results are pickled together with the call and result
+items that carry them, using the default protocol of `multiprocessing`. An
+executor created with `_serializer` instead encodes every message in the
+thread that posts it (and every result in the actor process) with that
+serializer, and only the resulting bytes travel inside the call and result
+items:
+
+    * 'pickle': pickle with the highest protocol.
+    * 'cloudpickle': cloudpickle, which can also send lambdas and classes
+      defined interactively (requires the cloudpickle package).
+    * 'msgpack': msgpack for the messages it can encode (requires the
+      msgpack package). Note that msgpack returns lists for tuples.
+    * 'bytes': bytes objects are sent as they are.
+
+A `Serializer` instance can be given as well. When a serializer cannot encode
+an object (its `dumps` raises TypeError or ValueError), the object is pickled
+instead, so fast paths like 'msgpack' and 'bytes' never reject a message.
+
+With `_compression` set to 'zlib' or 'lzma', encoded messages and results of
+at least `_compress_threshold` bytes are also compressed.
+
+Messages posted through an ActorRef are not encoded with the serializer of
+the executor.
+"""
+import pickle
+import sys
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+SERIALIZERS = ('pickle', 'cloudpickle', 'msgpack', 'bytes')
+COMPRESSIONS = ('zlib', 'lzma')
+
+# Flags of a _Payload
+_PICKLED = 1
+_ZLIB = 2
+_LZMA = 4
+
+
+class Serializer(object):
+    """
+    Base class of the serializers. Subclasses implement `dumps` and `loads`,
+    and must be picklable so the actor process gets a copy.
+    """
+
+    def dumps(self, obj):  # nocover
+        """
+        Returns the bytes encoding `obj`. Raises TypeError or ValueError if
+        this serializer cannot encode it.
+        """
+        raise NotImplementedError
+
+    def loads(self, data):  # nocover
+        """
+        Returns the object encoded by the bytes `data`
+        """
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    """
+    Pickles with the highest protocol available
+    """
+
+    def dumps(self, obj):
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class CloudpickleSerializer(Serializer):
+    """
+    Pickles with cloudpickle, which also handles lambdas and local classes
+    """
+
+    def __init__(self):
+        try:
+            import cloudpickle  # NOQA
+        except ImportError:
+            raise ImportError(
+                "the 'cloudpickle' serializer requires the cloudpickle "
+                "package")
+
+    def dumps(self, obj):
+        import cloudpickle
+        return cloudpickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class MsgpackSerializer(Serializer):
+    """
+    Encodes with msgpack. Objects msgpack does not support are pickled.
+    """
+
+    def __init__(self):
+        try:
+            import msgpack  # NOQA
+        except ImportError:
+            raise ImportError(
+                "the 'msgpack' serializer requires the msgpack package")
+
+    def dumps(self, obj):
+        import msgpack
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        import msgpack
+        return msgpack.unpackb(data, raw=False)
+
+
+class BytesSerializer(Serializer):
+    """
+    Sends bytes objects as they are, and pickles everything else
+    """
+
+    def dumps(self, obj):
+        if type(obj) is not bytes:
+            raise TypeError('not bytes')
+        return obj
+
+    def loads(self, data):
+        return data
+
+
+_NAMED_SERIALIZERS = {
+    'pickle': PickleSerializer,
+    'cloudpickle': CloudpickleSerializer,
+    'msgpack': MsgpackSerializer,
+    'bytes': BytesSerializer,
+}
+
+
+class _Payload(object):
+    """
+    An encoded object that was pickled instead of being encoded by the
+    serializer, or that was compressed. Objects the serializer encoded
+    without compression travel as plain bytes.
+    """
+    __slots__ = ('data', 'flags')
+
+    def __init__(self, data, flags):
+        self.data = data
+        self.flags = flags
+
+    def __reduce__(self):
+        return (_Payload, (self.data, self.flags))
+
+
+class _Codec(object):
+    """
+    Encodes the messages and results of one executor with its serializer,
+    and compresses them if they are large.
+
+    Args:
+        serializer (Serializer): the serializer
+        compression (str | None): one of COMPRESSIONS
+        threshold (int): minimum size of the encoded bytes to compress
+    """
+
+    def __init__(self, serializer, compression=None, threshold=1 << 16):
+        if compression is not None and compression not in COMPRESSIONS:
+            raise KeyError('_compression must be one of {}, got {!r}'.format(
+                COMPRESSIONS, compression))
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self._compress_flag = None
+        if compression is not None:
+            self._compress_flag = _ZLIB if compression == 'zlib' else _LZMA
+            # Fail right away if the module is missing (no lzma on python 2)
+            _compressor(self._compress_flag)
+
+    def dumps(self, obj):
+        """
+        Returns:
+            bytes | _Payload: the encoded object
+        """
+        try:
+            data = self.serializer.dumps(obj)
+            flags = 0
+        except (TypeError, ValueError):
+            data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+            flags = _PICKLED
+        if self._compress_flag is not None and len(data) >= self.threshold:
+            data = _compressor(self._compress_flag).compress(data)
+            flags |= self._compress_flag
+        if flags:
+            return _Payload(data, flags)
+        return data
+
+    def loads(self, payload):
+        if type(payload) is not _Payload:
+            return self.serializer.loads(payload)
+        data = payload.data
+        flags = payload.flags
+        if flags & (_ZLIB | _LZMA):
+            data = _compressor(flags & (_ZLIB | _LZMA)).decompress(data)
+        if flags & _PICKLED:
+            return pickle.loads(data)
+        return self.serializer.loads(data)
+
+
+def _compressor(flag):
+    if flag == _ZLIB:
+        import zlib
+        return zlib
+    else:
+        if sys.version_info.major < 3:
+            raise NotImplementedError('lzma compression requires python 3')
+        import lzma
+        return lzma
+
+
+def _pop_serializer_options(kwargs):
+    """
+    Removes the serializer options from the keyword arguments of an
+    executor.
+
+    Returns:
+        _Codec | None: None if the default pickling is used
+    """
+    serializer = kwargs.pop('_serializer', None)
+    compression = kwargs.pop('_compression', None)
+    threshold = kwargs.pop('_compress_threshold', 1 << 16)
+    if serializer is None:
+        if compression is None:
+            return None
+        serializer = 'pickle'
+    if not isinstance(serializer, Serializer):
+        if serializer not in _NAMED_SERIALIZERS:
+            raise KeyError('_serializer must be one of {}, got {!r}'.format(
+                SERIALIZERS, serializer))
+        serializer = _NAMED_SERIALIZERS[serializer]()
+    return _Codec(serializer, compression, threshold)
@@ -0,0 +1,311 @@
+""" Implements ShardedActorExecutor """
+from concurrent.futures import _base
+from futures_actors import _base_actor
+import bisect
+import hashlib
+import threading
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+def _stable_hash(key):
+    """
+    Hash of a key that is identical in every process and interpreter run
+    (unlike the builtin `hash` of str, which is salted per process).
+    """
+    if isinstance(key, bytes):
+        data = key
+    elif isinstance(key, str):
+        data = key.encode('utf8')
+    else:
+        data = repr(key).encode('utf8')
+    return int(hashlib.md5(data).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """
+    Consistent hash ring that maps keys to shard indices.
+
+    Each shard is placed on the ring at `n_vnodes` pseudo-random points and a
+    key belongs to the shard owning the first point at or after the key's
+    hash. Growing the ring from N to N + 1 shards only moves the keys that
+    land on the new shard's points, i.e. about 1 / (N + 1) of them.
+
+    Args:
+        n_shards (int): number of shards
+        n_vnodes (int, default=64): points per shard. More points give a more
+            even key distribution.
+
+    Example:
+        >>> from futures_actors.sharding import *  # NOQA
+        >>> keys = list(range(2000))
+        >>> ring4, ring5 = HashRing(4), HashRing(5)
+        >>> moved = [k for k in keys if ring4.lookup(k) != ring5.lookup(k)]
+        >>> # Only the keys that now belong to the new shard have moved
+        >>> assert all(ring5.lookup(k) == 4 for k in moved)
+        >>> assert len(moved) < len(keys) * 0.35
+    """
+
+    def __init__(self, n_shards, n_vnodes=64):
+        self.n_shards = n_shards
+        self.n_vnodes = n_vnodes
+        points = []
+        for shard in range(n_shards):
+            for vnode in range(n_vnodes):
+                points.append((_stable_hash('{}-{}'.format(shard, vnode)),
+                               shard))
+        points.sort()
+        self._hashes = [h for h, _ in points]
+        self._shards = [s for _, s in points]
+
+    def lookup(self, key):
+        """
+        Returns the index of the shard that owns `key`
+        """
+        idx = bisect.bisect_left(self._hashes, _stable_hash(key))
+        if idx == len(self._hashes):
+            idx = 0
+        return self._shards[idx]
+
+
+class _MovesOff(object):
+    """
+    Picklable predicate given to `export_shard_state`. It is True for the keys
+    that no longer belong to `shard` in the resized ring.
+    """
+    def __init__(self, ring, shard):
+        self.ring = ring
+        self.shard = shard
+
+    def __call__(self, key):
+        return self.ring.lookup(key) != self.shard
+
+
+class ShardedActorExecutor(_base_actor.ActorExecutor):
+    """
+    Executor that partitions keyed, stateful work over several replicas of
+    one actor class using consistent hashing.
+
+    Every message is posted with a key and all messages with the same key are
+    handled by the same replica, so per-key state (caches, counters, ...) can
+    live inside that replica. The number of shards can be changed at runtime
+    with `resize`, which only moves about 1 / N of the keys.
+
+    To carry per-key state along when keys move, the actor class can
+    implement two hooks, which are called in the thread/process of the actor:
+
+        * `export_shard_state(should_move)`: remove and return a dict
+          mapping each key for which `should_move(key)` is True to its
+          (picklable) state.
+        * `import_shard_state(states)`: take ownership of the states of the
+          given dict, which was exported by another shard.
+
+    Options are passed as underscore-prefixed keyword arguments. All other
+    arguments (including executor options) are given to every shard.
+
+    Args:
+        _ActorClass (type): the Actor subclass to shard
+        _n_shards (int, default=2): initial number of shards
+        _n_vnodes (int, default=64): points per shard on the hash ring
+
+    Example:
+        >>> from futures_actors.sharding import *  # NOQA
+        >>> from futures_actors import ThreadActor
+        >>> class Counter(ThreadActor):
+        >>>     def __init__(self):
+        >>>         self.counts = {}
+        >>>     def handle(self, key):
+        >>>         self.counts[key] = self.counts.get(key, 0) + 1
+        >>>         return self.counts[key]
+        >>>     def export_shard_state(self, should_move):
+        >>>         moved = {k: v for k, v in self.counts.items()
+        >>>                  if should_move(k)}
+        >>>         for k in moved:
+        >>>             del self.counts[k]
+        >>>         return moved
+        >>>     def import_shard_state(self, states):
+        >>>         self.counts.update(states)
+        >>> #
+        >>> with ShardedActorExecutor(Counter, _n_shards=2) as executor:
+        >>>     for key in range(20):
+        >>>         executor.post(key, key=key)
+        >>>     executor.resize(5)
+        >>>     # The counts followed their keys to the new shards
+        >>>     fs = [executor.post(key, key=key) for key in range(20)]
+        >>>     assert [f.result() for f in fs] == [2] * 20
+    """
+
+    def __init__(self, _ActorClass, *args, **kwargs):
+        n_shards = kwargs.pop('_n_shards', 2)
+        n_vnodes = kwargs.pop('_n_vnodes', 64)
+        if n_shards < 1:
+            raise ValueError('_n_shards must be at least 1')
+        self._ActorClass = _ActorClass
+        self._args = args
+        self._kwargs = kwargs
+        self._n_vnodes = n_vnodes
+        self._shutdown = False
+        # Guards the shards. Posts look up their shard with it held, but post
+        # without it, since a shard with a full mailbox may keep them
+        # waiting. A resize waits for the posts in progress to finish, and
+        # new posts wait for the resize, so it sees a consistent set of
+        # shards.
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._n_posting = 0
+        self._resizing = False
+        self._ring = HashRing(n_shards, n_vnodes)
+        self._executors = [self._new_shard() for _ in range(n_shards)]
+
+    def __len__(self):
+        return len(self._executors)
+
+    def _new_shard(self):
+        return self._ActorClass.executor(*self._args, **self._kwargs)
+
+    def shard_for(self, key):
+        """
+        Returns the index of the shard that handles `key`
+        """
+        return self._ring.lookup(key)
+
+    def post(self, message, key):
+        """
+        Sends a message to the shard that owns `key` and returns a Future.
+        """
+        executors, ring = self._start_posting()
+        try:
+            return executors[ring.lookup(key)].post(message)
+        finally:
+            self._done_posting()
+
+    def _start_posting(self):
+        """
+        Waits for a resize in progress and returns the shards and their ring.
+        Must be followed by `_done_posting`.
+        """
+        with self._lock:
+            while self._resizing:
+                self._changed.wait()
+            if self._shutdown:
+                raise RuntimeError(
+                    'cannot schedule new futures after shutdown')
+            self._n_posting += 1
+            return self._executors, self._ring
+
+    def _done_posting(self):
+        with self._lock:
+            self._n_posting -= 1
+            if not self._n_posting:
+                self._changed.notify_all()
+
+    def post_many(self, messages, keys):
+        """
+        Sends each message to the shard that owns its key, batching the
+        messages that go to the same shard.
+        """
+        messages = list(messages)
+        keys = list(keys)
+        if len(keys) != len(messages):
+            raise ValueError('need exactly one key per message')
+        fs = [None] * len(messages)
+        executors, ring = self._start_posting()
+        try:
+            groups = {}
+            for idx, key in enumerate(keys):
+                groups.setdefault(ring.lookup(key), []).append(idx)
+            for shard, idxs in groups.items():
+                batch_fs = executors[shard].post_many(
+                    [messages[idx] for idx in idxs])
+                for idx, f in zip(idxs, batch_fs):
+                    fs[idx] = f
+        finally:
+            self._done_posting()
+        return fs
+
+    def resize(self, n_shards, migrate=True):
+        """
+        Changes the number of shards.
+
+        Posting is blocked while the shards are resized and the migrated
+        state is handed over. Because every mailbox is FIFO, messages posted
+        before the resize are handled by the old owner of their key before
+        its state is exported, and messages posted afterwards are handled by
+        the new owner after the state has been imported.
+
+        Args:
+            n_shards (int): the new number of shards
+            migrate (bool, default=True): move the state of the keys that
+                change owner, if the actor implements `export_shard_state`
+                and `import_shard_state`.
+        """
+        if n_shards < 1:
+            raise ValueError('n_shards must be at least 1')
+        migrate = migrate and hasattr(self._ActorClass, 'export_shard_state')
+        with self._lock:
+            while self._resizing:
+                self._changed.wait()
+            if self._shutdown:
+                raise RuntimeError('cannot resize after shutdown')
+            self._resizing = True
+            try:
+                while self._n_posting:
+                    self._changed.wait()
+                new_ring = HashRing(n_shards, self._n_vnodes)
+                old_executors = self._executors
+                new_executors = old_executors[:n_shards]
+                while len(new_executors) < n_shards:
+                    new_executors.append(self._new_shard())
+
+                try:
+                    if migrate:
+                        self._migrate(old_executors, new_executors, new_ring)
+                except BaseException:
+                    for executor in new_executors[len(old_executors):]:
+                        executor.shutdown(wait=False)
+                    raise
+
+                self._ring = new_ring
+                self._executors = new_executors
+            finally:
+                self._resizing = False
+                self._changed.notify_all()
+        # Shards that were removed have nothing left to own
+        for executor in old_executors[n_shards:]:
+            executor.shutdown(wait=True)
+
+    def _migrate(self, old_executors, new_executors, new_ring):
+        """
+        Moves the state of every key whose owner changes in `new_ring`
+        """
+        export_fs = [
+            executor.post(_base_actor._ActorMethodCall(
+                'export_shard_state', _MovesOff(new_ring, shard)))
+            for shard, executor in enumerate(old_executors)]
+        incoming = [{} for _ in new_executors]
+        for f in export_fs:
+            for key, state in f.result().items():
+                incoming[new_ring.lookup(key)][key] = state
+        import_fs = [
+            new_executors[shard].post(_base_actor._ActorMethodCall(
+                'import_shard_state', states))
+            for shard, states in enumerate(incoming) if states]
+        for f in import_fs:
+            f.result()
+
+    def stats(self):
+        """
+        Returns a list with the stats dict of each shard, see
+        `ActorExecutor.stats`. Hot keys show up as a shard with a deeper
+        mailbox.
+        """
+        with self._lock:
+            executors = list(self._executors)
+        return [executor.stats() for executor in executors]
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._shutdown = True
+        for executor in self._executors:
+            executor.shutdown(wait=wait)
+    shutdown.__doc__ = _base.Executor.shutdown.__doc__
@@ -0,0 +1,338 @@
+"""
+Streamed results of the actor executors.
+
+`handle` returns one value, sent back once the actor is done with the
+message, so a handler producing a large result has to build all of it before
+anything reaches the caller. A message posted with `executor.stream(message)`
+is instead expected to be handled by a generator (or to return any
+iterable): the chunks it yields are sent back one at a time as they are
+produced, and the caller iterates over them with a `Stream`, or with
+`async for` on python 3.5+.
+
+    * Flow control: the actor produces at most `window` chunks (default 16)
+      that the caller has not taken yet, then waits for the caller to take
+      some. This bounds the memory used by a stream on both sides, whatever
+      the speeds of the producer and the consumer.
+    * The value returned by the generator is the result of `stream.future`,
+      which resolves once the stream ended. An exception raised by the
+      handler is raised by the iteration, after the chunks yielded before.
+    * `stream.close()` (or leaving a `with stream:` block) stops the
+      generator of a stream that is no longer wanted, the next time it
+      yields.
+
+Streams are not supported by actors that define `handle_batch`, and do not
+go through the result cache nor the journal of the executor. A streamed
+message is never replayed after the actor process crashed, since the caller
+already got part of its chunks: it fails with BrokenProcessPool.
+"""
+from futures_actors import _base_actor
+import collections
+import threading
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+DEFAULT_WINDOW = 16
+
+
+class Stream(object):
+    """
+    Iterator over the chunks of a streamed message, in the order they were
+    yielded.
+
+    Args:
+        future (Future): resolves once the stream ended
+        window (int): maximum number of chunks produced ahead of the caller
+        grant (Callable | None): called with a number of chunks the producer
+            may send on top of its window once the caller took them, or
+            with -1 once the stream was closed
+
+    Attributes:
+        future (Future): the result of the stream, the value returned by
+            the generator of the handler
+
+    Example:
+        >>> from futures_actors import ThreadActor
+        >>> class Counter(ThreadActor):
+        >>>     def handle(self, n):
+        >>>         for i in range(n):
+        >>>             yield i
+        >>>         return 'counted'
+        >>> executor = Counter.executor()
+        >>> stream = executor.stream(5, window=2)
+        >>> list(stream)
+        [0, 1, 2, 3, 4]
+        >>> stream.future.result()
+        'counted'
+        >>> executor.shutdown(wait=True)
+    """
+
+    def __init__(self, future, window=DEFAULT_WINDOW, grant=None):
+        if window < 1:
+            raise ValueError('the window of a stream must be at least 1')
+        self.future = future
+        self.window = window
+        self._grant = grant
+        self._cond = threading.Condition()
+        self._chunks = collections.deque()
+        # Chunks taken since credits were last granted
+        self._taken = 0
+        self._closed = False
+        # (loop, asyncio.Future) of the pending `async for` steps
+        self._waiters = []
+        future.add_done_callback(lambda _: self._wake())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._cond:
+            while not self._chunks and not self._ended():
+                self._cond.wait()
+            return self._take()
+
+    next = __next__  # python 2
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        """
+        Returns an awaitable of the next chunk, without blocking the event
+        loop
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+        with self._cond:
+            if self._chunks or self._ended():
+                self._resolve(waiter)
+            else:
+                self._waiters.append((loop, waiter))
+        return waiter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Tells the producer to stop, and drops the chunks not taken yet
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._chunks.clear()
+            self._cond.notify_all()
+        # A message that is not handled yet is simply cancelled
+        if (not self.future.cancel() and self._grant is not None and
+                not self.future.done()):
+            self._grant(-1)
+        self._wake()
+
+    def _ended(self):
+        return self._closed or self.future.done()
+
+    def _take(self):
+        """
+        Returns the next chunk, or raises once the stream ended. Must be
+        called with the condition held.
+        """
+        if self._chunks:
+            chunk = self._chunks.popleft()
+            self._taken += 1
+            if self._taken >= max(1, self.window // 2):
+                taken, self._taken = self._taken, 0
+                self._cond.notify_all()
+                if self._grant is not None:
+                    self._grant(taken)
+            if type(chunk) is _ChunkError:
+                raise chunk.exception
+            return chunk
+        if not self._closed and self.future.exception() is not None:
+            raise self.future.exception()
+        raise StopIteration
+
+    def _resolve(self, waiter):
+        try:
+            waiter.set_result(self._take())
+        except StopIteration:
+            waiter.set_exception(StopAsyncIteration())
+        except BaseException as e:
+            waiter.set_exception(e)
+
+    def _wake(self):
+        """
+        Wakes up the consumers, a chunk arrived or the stream ended
+        """
+        with self._cond:
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(self._step, loop, waiter)
+
+    def _step(self, loop, waiter):
+        # Runs in the loop of an `async for`
+        if waiter.done():
+            return
+        with self._cond:
+            if self._chunks or self._ended():
+                self._resolve(waiter)
+            else:
+                self._waiters.append((loop, waiter))
+
+    def _put(self, chunk):
+        """
+        Adds a chunk sent by the producer
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+        if self._waiters:
+            self._wake()
+
+    def _offer(self, chunk):
+        """
+        Adds a chunk once there is room in the window, for producers in this
+        process.
+
+        Returns:
+            bool: False if the stream was closed and the producer must stop
+        """
+        with self._cond:
+            while len(self._chunks) >= self.window and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return False
+        self._put(chunk)
+        return True
+
+
+class _ChunkError(object):
+    """
+    Stands for a chunk that could not be decoded, raised when it is taken
+    """
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class _StreamChunk(object):
+    """
+    A chunk of a streamed message, sent by the actor process
+    """
+
+    def __init__(self, work_id, chunk):
+        self.work_id = work_id
+        self.chunk = chunk
+
+
+class _StreamCredit(object):
+    """
+    Lets the actor process send `n` more chunks of a streamed message, or
+    stops it if `n` is -1
+    """
+
+    def __init__(self, work_id, n):
+        self.work_id = work_id
+        self.n = n
+
+
+class _StreamCredits(object):
+    """
+    The chunks the actor process may still send for the message it streams.
+    Credits are granted by the thread receiving the call items, while the
+    actor is busy producing the chunks.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._work_id = None
+        self._available = 0
+        self._closed = False
+        # Streams closed by the caller before the actor started them
+        self._stopped = set()
+
+    def open(self, work_id, window):
+        with self._cond:
+            # Work ids increase, older streams are over
+            self._stopped = set(w for w in self._stopped if w >= work_id)
+            if work_id in self._stopped:
+                return
+            self._work_id = work_id
+            self._available = window
+
+    def end(self):
+        with self._cond:
+            self._work_id = None
+
+    def grant(self, work_id, n):
+        with self._cond:
+            if work_id != self._work_id:
+                if n < 0:
+                    self._stopped.add(work_id)
+                return
+            if n < 0:
+                self._work_id = None
+            self._available += n
+            self._cond.notify()
+
+    def close(self):
+        """
+        The parent is gone, nobody will take the chunks
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def take(self, work_id):
+        """
+        Waits until the actor may send one more chunk.
+
+        Returns:
+            bool: False if the stream was closed and the generator must stop
+        """
+        with self._cond:
+            while True:
+                if self._closed or self._work_id != work_id:
+                    return False
+                if self._available > 0:
+                    self._available -= 1
+                    return True
+                self._cond.wait()
+
+
+def _run_generator(iterable, send):
+    """
+    Passes the items of `iterable` to `send` until it returns False.
+
+    Returns:
+        object: the value returned by a generator, or None
+    """
+    iterator = iter(iterable)
+    try:
+        while True:
+            try:
+                chunk = next(iterator)
+            except StopIteration as e:
+                return getattr(e, 'value', None)
+            if not send(chunk):
+                return None
+    finally:
+        # Runs the cleanup of a generator that was stopped
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+
+
+def _check_streamable(_ActorClass, mailbox=None):
+    if _base_actor._supports_batching(_ActorClass):
+        raise TypeError('actors that define handle_batch cannot stream')
+    if mailbox is not None and mailbox.overflow == 'coalesce':
+        raise ValueError("streams cannot go through a 'coalesce' mailbox")
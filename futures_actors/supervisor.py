@@ -0,0 +1,171 @@
+""" Implements Supervisor """
+import collections
+import threading
+import time
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+RESTART_STRATEGIES = ('one_for_one', 'one_for_all')
+
+
+class Supervisor(object):
+    """
+    Starts child actors and restarts them when their process crashes.
+
+    When a supervised ProcessActor dies without being shut down, its actor is
+    re-created in a new process with its original constructor arguments (any
+    state it had is lost). The message it was handling and the ones already
+    queued in the process (see `_pipeline_depth`) fail with
+    `BrokenProcessPool`, while the messages that were not dispatched yet are
+    replayed to the new process. ActorRefs to the child keep working.
+
+    Only ProcessActors can crash, so children of other actor classes are
+    started but not supervised.
+
+    Actors can supervise their own children with `Actor.spawn`. Children are
+    forgotten once they stopped for good: after they were shut down, or after
+    their process exited and was not restarted.
+
+    Args:
+        strategy (str, default='one_for_one'): 'one_for_one' only restarts the
+            child that crashed, 'one_for_all' restarts all children when any
+            of them crashes.
+        max_restarts (int, default=3): the maximum number of restarts
+            within `max_seconds`. When a crash would exceed it, the
+            supervisor gives up: all of its children are stopped and their
+            executors become broken.
+        max_seconds (float, default=5.0): the restart rate window
+
+    Example:
+        >>> import os
+        >>> from futures_actors import ProcessActor, Supervisor
+        >>> class Fragile(ProcessActor):
+        >>>     def handle(self, message):
+        >>>         if message == 'crash':
+        >>>             os._exit(1)
+        >>>         return message
+        >>> #
+        >>> with Supervisor() as supervisor:
+        >>>     executor = supervisor.spawn(Fragile, _pipeline_depth=1)
+        >>>     f1 = executor.post('crash')
+        >>>     f2 = executor.post('dispatched with the crash')
+        >>>     f3 = executor.post('replayed')
+        >>>     assert f1.exception() is not None
+        >>>     assert f3.result() == 'replayed'
+    """
+
+    def __init__(self, strategy='one_for_one', max_restarts=3,
+                 max_seconds=5.0):
+        if strategy not in RESTART_STRATEGIES:
+            raise KeyError('strategy must be one of {}, got {!r}'.format(
+                RESTART_STRATEGIES, strategy))
+        self.strategy = strategy
+        self.max_restarts = max_restarts
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._children = []
+        self._restart_times = collections.deque()
+        self._failed = False
+        self._shutdown = False
+
+    @property
+    def children(self):
+        """
+        The executors of the children that did not stop, in the order they
+        were spawned
+        """
+        with self._lock:
+            self._forget_stopped()
+            return list(self._children)
+
+    @property
+    def failed(self):
+        """
+        True if the supervisor gave up after too many restarts
+        """
+        return self._failed
+
+    def spawn(self, _ActorClass, *args, **kwargs):
+        """
+        Starts a new child actor and returns its executor. The arguments are
+        the same as for `_ActorClass.executor`.
+        """
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot spawn children after shutdown')
+            if self._failed:
+                raise RuntimeError('the supervisor gave up on its children')
+            executor = _ActorClass.executor(*args, **kwargs)
+            channel = getattr(executor, '_channel', None)
+            if channel is not None:
+                channel.restart_policy = self._on_crash
+            self._forget_stopped()
+            self._children.append(executor)
+        return executor
+
+    def _forget_stopped(self):
+        """
+        Drops the children that will never handle a message again, so a
+        long-lived supervisor of short-lived children does not keep them
+        all. Must be called with the lock held.
+        """
+        self._children = [c for c in self._children if not _stopped(c)]
+
+    def _on_crash(self, crashed):
+        """
+        Restart policy of the children. Called by the dispatcher thread with
+        the channel of a child whose process crashed.
+        """
+        now = time.time()
+        with self._lock:
+            if self._shutdown or self._failed:
+                return False
+            restart_times = self._restart_times
+            while restart_times and now - restart_times[0] > self.max_seconds:
+                restart_times.popleft()
+            if len(restart_times) >= self.max_restarts:
+                self._failed = True
+            else:
+                restart_times.append(now)
+            others = [c._channel for c in self._children
+                      if getattr(c, '_channel', crashed) is not crashed]
+        if self._failed:
+            for channel in others:
+                channel.restart_requested = False
+                channel.kill()
+            return False
+        if self.strategy == 'one_for_all':
+            for channel in others:
+                if channel.actor_process is not None and not channel.stopping:
+                    channel.restart_requested = True
+                    channel.kill()
+        return True
+
+    def shutdown(self, wait=True):
+        """
+        Shuts down all children.
+        """
+        with self._lock:
+            self._shutdown = True
+            children = list(self._children)
+        for executor in children:
+            executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+        return False
+
+
+def _stopped(executor):
+    """
+    True once the executor of a child was shut down, or its actor process
+    exited and was not restarted
+    """
+    channel = getattr(executor, '_channel', None)
+    if channel is not None:
+        return channel.shutting_down or channel.closed.is_set()
+    return getattr(executor, '_shutdown', False)
@@ -1,4 +1,5 @@
 import futures_actors
+import sys
 from concurrent import futures
 import ubelt as ub
 from os.path import join, exists
@@ -30,9 +31,20 @@ class TestActorMixin(object):
         elif action == 'lockfile':
             fpath = message['fpath']
             num = message['num']
+            if 'started' in message:
+                # Tells the test that the actor is handling the message
+                open(message['started'], 'w').close()
             while not exists(fpath):
                 pass
             return num
+        elif action == 'cancellable':
+            # Like 'lockfile', but stops once the message is cancelled
+            import time
+            while not exists(message['fpath']):
+                if actor.cancelled():
+                    return 'cancelled'
+                time.sleep(0.001)
+            return message['num']
         elif action == 'debug':
             return actor
         elif action == 'prime':
@@ -42,6 +54,8 @@ class TestActorMixin(object):
             return n, a, ub.find_nth_prime(n + a)
         elif action == 'exception':
             raise Exception('Oops')
+        elif action == 'raise':
+            raise message['exception']
         elif action == 'start':
             actor.state['a'] = 3
             return 'started'
@@ -49,10 +63,36 @@ class TestActorMixin(object):
             for i in range(1000):
                 actor.state['a'] += 1
             return 'added', actor.state['a']
+        elif action == 'crash':
+            import os
+            os._exit(1)
+        elif action == 'spawn':
+            # Create a supervised child and hand out a reference to it
+            return actor.spawn(type(actor)).ref()
+        elif action == 'stream':
+            # Streamed with executor.stream, None counts forever
+            return _count_up(message['n'], message.get('fail', False))
+        elif action == 'imported':
+            return message['module'] in sys.modules
+        elif action == 'forward':
+            # Send the inner messages to another actor through its reference
+            ref = message['ref']
+            for inner in message.get('tell', []):
+                ref.tell(inner)
+            return ref.post(message['message']).result()
         else:
             raise ValueError('Unknown action=%r' % (action,))
 
 
+def _count_up(n, fail=False):
+    i = 0
+    while n is None or i < n:
+        yield i
+        i += 1
+    if fail:
+        raise ValueError('Oops')
+
+
 class TestProcessActor(TestActorMixin, futures_actors.ProcessActor):
     pass
 
@@ -61,6 +101,124 @@ class TestThreadActor(TestActorMixin, futures_actors.ThreadActor):
     pass
 
 
+class TestEchoProcessActor(futures_actors.ProcessActor):
+    """
+    Returns its messages. Memoryviews are sent back as PickleBuffers.
+    """
+    def handle(actor, message):
+        if isinstance(message, memoryview):
+            import pickle
+            return pickle.PickleBuffer(message)
+        return message
+
+
+if sys.version_info[0:2] >= (3, 7):
+    class TestAsyncActor(TestActorMixin, futures_actors.AsyncActor):
+        pass
+
+    class TestAsyncProcessActor(TestActorMixin,
+                                futures_actors.AsyncProcessActor):
+        pass
+
+
+class TestCounterActorMixin(object):
+    """
+    Counts messages per key and supports shard state migration
+    """
+    def __init__(actor):
+        actor.counts = {}
+
+    def handle(actor, key):
+        actor.counts[key] = actor.counts.get(key, 0) + 1
+        return actor.counts[key]
+
+    def export_shard_state(actor, should_move):
+        moved = {k: v for k, v in actor.counts.items() if should_move(k)}
+        for k in moved:
+            del actor.counts[k]
+        return moved
+
+    def import_shard_state(actor, states):
+        actor.counts.update(states)
+
+
+class TestCounterProcessActor(TestCounterActorMixin,
+                              futures_actors.ProcessActor):
+    pass
+
+
+class TestCounterThreadActor(TestCounterActorMixin,
+                             futures_actors.ThreadActor):
+    pass
+
+
+class TestBatchActorMixin(object):
+    """
+    Doubles numbers, using the vectorized `handle_batch` hook
+    """
+    max_batch_size = 4
+    batch_linger = 0.05
+
+    def __init__(actor):
+        actor.batch_sizes = []
+
+    def handle(actor, message):
+        raise AssertionError('handle_batch should be used instead')
+
+    def handle_batch(actor, messages):
+        actor.batch_sizes.append(len(messages))
+        results = []
+        for message in messages:
+            if message == 'sizes':
+                results.append(list(actor.batch_sizes))
+            elif message == 'received':
+                # Messages a cancellable actor keeps track of
+                results.append(len(actor._cancel_scope._received))
+            elif isinstance(message, dict):
+                # Waits for a lock file, like the 'lockfile' action
+                while not exists(message['fpath']):
+                    pass
+                results.append(message['num'])
+            elif message < 0:
+                results.append(ValueError('negative message'))
+            else:
+                results.append(message * 2)
+        return results
+
+
+class TestBatchProcessActor(TestBatchActorMixin, futures_actors.ProcessActor):
+    pass
+
+
+class TestBatchThreadActor(TestBatchActorMixin, futures_actors.ThreadActor):
+    pass
+
+
+class TestCheckpointActor(futures_actors.ProcessActor):
+    """
+    Appends its messages to a buffer, which it checkpoints
+    """
+    def __init__(actor):
+        actor.buffer = bytearray()
+
+    def handle(actor, message):
+        if message == 'crash':
+            import os
+            os._exit(1)
+        actor.buffer += message
+        return bytes(actor.buffer)
+
+    def snapshot(actor):
+        import pickle
+        if sys.version_info[0:2] >= (3, 8):
+            # Stored out-of-band, and mapped back from the file
+            return {'buffer': pickle.PickleBuffer(actor.buffer)}
+        return {'buffer': actor.buffer}
+
+    def restore(actor, state):
+        actor.buffer = bytearray(state['buffer'])
+
+
 def test_simple(ActorClass):
     """
     Example:
@@ -260,6 +418,1278 @@ def test_cancel(ActorClass, F=0.01):
     shutil.rmtree(cache_dpath)
 
 
+def test_cancel_running(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_cancel_running(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_cancel_running(TestThreadActor)
+    """
+    import tempfile
+    import time
+    dpath = tempfile.mkdtemp()
+    fpath = join(dpath, 'lock')
+    started = join(dpath, 'started')
+
+    def wait_started():
+        while not exists(started):
+            time.sleep(0.01)
+        ub.delete(started)
+
+    executor = ActorClass.executor(_cancellable=True)
+    try:
+        f1 = executor.post({'action': 'cancellable', 'num': 1,
+                            'fpath': fpath})
+        f2 = executor.post({'action': 'cancellable', 'num': 2,
+                            'fpath': fpath})
+        f3 = executor.post({'action': 'hello world'})
+        while not f1.running():
+            time.sleep(0.01)
+        assert f2.cancel() and f1.cancel()
+        assert f1.cancelled() and f2.cancelled()
+        # Both were stopped without the lock file
+        assert f3.result(timeout=10) == 'hello world'
+        assert not f3.cancel()
+    finally:
+        ub.touch(fpath)
+    executor.shutdown(wait=True)
+
+    if ActorClass is TestThreadActor:
+        # A running batched message cannot be stopped, but cancelling it must
+        # not break the actor
+        ub.delete(fpath)
+        executor = TestBatchThreadActor.executor(_cancellable=True)
+        try:
+            f1 = executor.post({'num': 1, 'fpath': fpath})
+            while not f1.running():
+                time.sleep(0.01)
+            assert f1.cancel() and f1.cancelled()
+        finally:
+            ub.touch(fpath)
+        assert executor.post(3).result(timeout=10) == 6
+        executor.shutdown(wait=True)
+
+    if ActorClass is TestProcessActor:
+        # Batched messages are forgotten once they are handled
+        with TestBatchProcessActor.executor(_cancellable=True) as executor:
+            fs = [executor.post(num) for num in range(50)]
+            assert [f.result() for f in fs] == [num * 2 for num in range(50)]
+            assert executor.post('received').result() <= 1
+
+    if ActorClass is TestProcessActor:
+        # 'lockfile' never looks at the cancellation, so the actor process
+        # is restarted, and the message queued behind is replayed
+        ub.delete(fpath)
+        executor = ActorClass.executor(_cancel_timeout=0.1)
+        try:
+            f1 = executor.post({'action': 'lockfile', 'num': 1,
+                                'fpath': fpath, 'started': started})
+            f2 = executor.post({'action': 'start'})
+            wait_started()
+            assert f1.cancel()
+            assert f2.result(timeout=10) == 'started'
+            assert executor.stats()['restarts'] == 1
+        finally:
+            ub.touch(fpath)
+        executor.shutdown(wait=True)
+
+        # Only the message the actor is handling gets it killed, not one
+        # queued behind it in the actor process
+        ub.delete(fpath)
+        executor = ActorClass.executor(_cancel_timeout=0.1)
+        try:
+            executor.tell({'action': 'lockfile', 'num': 1, 'fpath': fpath,
+                           'started': started})
+            f1 = executor.post({'action': 'hello world'})
+            wait_started()
+            while not f1.running():
+                time.sleep(0.01)
+            assert f1.cancel()
+            time.sleep(0.5)
+        finally:
+            ub.touch(fpath)
+        assert executor.post({'action': 'start'}).result(timeout=10) == (
+            'started')
+        assert executor.stats()['restarts'] == 0
+        executor.shutdown(wait=True)
+    ub.delete(dpath)
+
+
+def test_pipeline_depth():
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_pipeline_depth()
+    """
+    import shutil
+    cache_dpath = ub.ensure_app_cache_dir('futures_actors', 'tests')
+    shutil.rmtree(cache_dpath)
+    ub.ensuredir(cache_dpath)
+    fpath = join(cache_dpath, 'lock_pipeline')
+
+    executor = TestProcessActor.executor(_pipeline_depth=3)
+    try:
+        # The first message blocks the actor, the next three fill the call
+        # queue, and everything after that is still cancellable.
+        fs = [executor.post({'action': 'lockfile', 'num': num, 'fpath': fpath})
+              for num in range(8)]
+        import time
+        time.sleep(0.1)
+        assert not fs[2].cancel(), 'dispatched messages cannot be cancelled'
+        assert fs[7].cancel(), 'undispatched messages should be cancellable'
+        ub.touch(fpath)
+        results = [f.result() for f in fs if not f.cancelled()]
+        assert results == sorted(results), 'messages must stay in order'
+        assert 7 not in results
+    finally:
+        executor.shutdown(wait=True)
+
+    shutil.rmtree(cache_dpath)
+
+
+def test_post_many(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_post_many(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_post_many(TestThreadActor)
+    """
+    with ActorClass.executor() as executor:
+        assert executor.post_many([]) == []
+        messages = [{'action': 'start'}, {'action': 'add'},
+                    {'action': 'exception'}, {'action': 'add'}]
+        fs = executor.post_many(messages)
+        assert len(fs) == len(messages)
+        assert fs[0].result() == 'started'
+        assert fs[1].result() == ('added', 1003)
+        try:
+            fs[2].result()
+        except Exception as ex:
+            print('Correctly got exception = {}'.format(repr(ex)))
+        else:
+            raise AssertionError('should have gotten an exception')
+        assert fs[3].result() == ('added', 2003)
+        # Batches and single posts are handled in order
+        f = executor.post({'action': 'add'})
+        assert f.result() == ('added', 3003)
+
+
+def test_tell(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_tell(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_tell(TestThreadActor)
+    """
+    with ActorClass.executor() as executor:
+        assert executor.tell({'action': 'start'}) is None
+        # Exceptions of told messages are dropped
+        executor.tell({'action': 'exception'})
+        for _ in range(10):
+            executor.tell({'action': 'add'})
+        if hasattr(executor, '_channel'):
+            assert not executor._channel.pending_work_items
+        # Told and posted messages are handled in order
+        f = executor.post({'action': 'add'})
+        assert f.result() == ('added', 11003)
+
+
+def _blocked_executor(ActorClass, fpath, **kwargs):
+    """
+    Returns an executor whose actor is busy until `fpath` exists, and that
+    has no messages waiting.
+    """
+    import time
+    executor = ActorClass.executor(**kwargs)
+    executor.post({'action': 'lockfile', 'fpath': fpath, 'num': -1})
+    if hasattr(executor, '_channel'):
+        # Also fill the pipeline window of the actor process
+        executor.post({'action': 'hello world'})
+        waiting = executor._channel.work_ids
+    else:
+        waiting = executor._work_queue.queue
+    deadline = time.time() + 10
+    while len(waiting):
+        assert time.time() < deadline, 'the actor should take its messages'
+        time.sleep(0.001)
+    return executor
+
+
+def test_mailbox(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_mailbox(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_mailbox(TestThreadActor)
+    """
+    import tempfile
+    dpath = tempfile.mkdtemp()
+    fpath = join(dpath, 'lock')
+    hello = {'action': 'hello world'}
+    executors = []
+
+    def blocked(overflow, **kwargs):
+        executor = _blocked_executor(ActorClass, fpath, _mailbox_size=2,
+                                     _overflow=overflow, **kwargs)
+        executors.append(executor)
+        return executor, [executor.post(hello), executor.post(hello)]
+
+    try:
+        executor, queued = blocked('raise')
+        try:
+            executor.post(hello)
+        except futures_actors.MailboxFull:
+            pass
+        else:
+            raise AssertionError('the mailbox should be full')
+
+        executor, queued = blocked('block')
+        try:
+            executor.post(hello, timeout=0.05)
+        except futures_actors.MailboxFull:
+            pass
+        else:
+            raise AssertionError('the post should have timed out')
+
+        executor, queued = blocked('drop_oldest')
+        f_new = executor.post(hello)
+        assert queued[0].cancelled() and not queued[1].done()
+        executor.tell(hello)
+        assert queued[1].cancelled()
+        assert len(executor._mailbox) == 2
+
+        executor, queued = blocked('drop_newest')
+        assert executor.post(hello).cancelled()
+
+        executor, queued = blocked(
+            'coalesce', _coalesce_key=lambda m: m.get('n', m['action']))
+        f1 = executor.post({'action': 'hello world', 'n': 1})
+        f2 = executor.post({'action': 'start', 'n': 1})
+        assert f1 is f2
+        try:
+            executor.post({'action': 'add', 'n': 2}, timeout=0.05)
+        except futures_actors.MailboxFull:
+            pass
+        else:
+            raise AssertionError('new keys should wait for room')
+    finally:
+        ub.touch(fpath)
+
+    # The actors drain their mailboxes once they are unblocked
+    assert all(f.result() == 'hello world' for f in queued)
+    assert f1.result() == 'started'
+    assert f_new.result() == 'hello world'
+    for executor in executors:
+        executor.shutdown(wait=True)
+        assert len(executor._mailbox) == 0
+    ub.delete(dpath)
+
+    if ActorClass is TestProcessActor:
+        # Keys are computed from the messages as they were posted, not from
+        # their encoded form
+        for options in [{'_serializer': 'pickle'}, {'_shm_threshold': 1}]:
+            with ActorClass.executor(_overflow='coalesce',
+                                     _coalesce_key=lambda m: m['action'],
+                                     **options) as executor:
+                assert executor.post(hello).result() == 'hello world'
+                executor.tell(hello)
+
+
+def test_cache(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_cache(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_cache(TestThreadActor)
+    """
+    import tempfile
+    import time
+    dpath = tempfile.mkdtemp()
+    fpath = join(dpath, 'lock')
+
+    def key(message):
+        if message['action'] in {'start', 'add', 'exception'}:
+            return message['action']
+
+    executor = _blocked_executor(ActorClass, fpath, _cache_key=key,
+                                 _cache_size=1, _cache_ttl=0.2)
+    try:
+        # Identical posts in flight share one Future
+        f_start = executor.post({'action': 'start'})
+        fs = [executor.post({'action': 'add'}) for _ in range(3)]
+        assert fs[0] is fs[1] is fs[2]
+        assert not fs[0].cancel()
+    finally:
+        ub.touch(fpath)
+    assert f_start.result() == 'started'
+    assert fs[0].result() == ('added', 1003)
+
+    # Cached results never reach the actor, and the least recently used
+    # ones are evicted
+    assert executor.post({'action': 'add'}) is fs[0]
+    stats = executor.stats()
+    assert stats['cache_coalesced'] == 2 and stats['cache_hits'] == 1
+    assert stats['cache_entries'] == 1
+    f_start = executor.post({'action': 'start'})
+    assert f_start.result() == 'started'
+
+    # Results expire, and exceptions are not cached
+    time.sleep(0.25)
+    assert executor.post({'action': 'add'}).result() == ('added', 1003)
+    f = executor.post({'action': 'exception'})
+    assert f.exception() is not None
+    assert executor.post({'action': 'exception'}) is not f
+    executor.shutdown(wait=True)
+    ub.delete(dpath)
+
+
+def test_stream(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_stream(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_stream(TestThreadActor)
+    """
+    executor = ActorClass.executor()
+    stream = executor.stream({'action': 'stream', 'n': 100}, window=4)
+    assert list(stream) == list(range(100))
+    assert stream.future.done() and stream.future.exception() is None
+
+    # The chunks yielded before an exception are still received
+    chunks = []
+    try:
+        for chunk in executor.stream({'action': 'stream', 'n': 3,
+                                      'fail': True}):
+            chunks.append(chunk)
+    except ValueError as ex:
+        print('Correctly got exception = {}'.format(repr(ex)))
+    else:
+        raise AssertionError('should have gotten an exception')
+    assert chunks == [0, 1, 2]
+
+    # The producer waits for the caller, and stops once the stream is closed
+    with executor.stream({'action': 'stream', 'n': None}, window=2) as stream:
+        assert [next(stream) for _ in range(10)] == list(range(10))
+    assert list(stream) == []
+    assert stream.future.result() is None
+    assert executor.post({'action': 'hello world'}).result() == 'hello world'
+
+    if sys.version_info[0:2] >= (3, 7):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            stream = executor.stream({'action': 'stream', 'n': 5}, window=2)
+            chunks = []
+            while True:
+                try:
+                    chunks.append(loop.run_until_complete(stream.__anext__()))
+                except StopAsyncIteration:
+                    break
+            assert chunks == list(range(5))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    try:
+        TestBatchThreadActor.executor().stream(1)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('batching actors cannot stream')
+    executor.shutdown(wait=True)
+
+
+def test_priority(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_priority(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_priority(TestThreadActor)
+    """
+    import tempfile
+    dpath = tempfile.mkdtemp()
+    fpath = join(dpath, 'lock')
+    add = {'action': 'add'}
+    executor = _blocked_executor(ActorClass, fpath)
+    try:
+        f_low = executor.post(add, priority=-1)
+        f_default = [executor.post(add), executor.post(add)]
+        f_high = [executor.post(add, priority=5),
+                  executor.post(add, priority=5)]
+        f_mid = executor.post(add, priority=1)
+        executor.post({'action': 'start'}, priority=10)
+        # The actor still handles everything that was posted before shutdown
+        executor.shutdown(wait=False)
+    finally:
+        ub.touch(fpath)
+    fs = f_high + [f_mid] + f_default + [f_low]
+    assert [f.result() for f in fs] == [
+        ('added', 1003 + 1000 * i) for i in range(len(fs))]
+    executor.shutdown(wait=True)
+    ub.delete(dpath)
+
+
+def test_handle_batch(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_handle_batch(TestBatchProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_handle_batch(TestBatchThreadActor)
+    """
+    with ActorClass.executor() as executor:
+        fs = [executor.post(num) for num in range(10)]
+        f_neg = executor.post(-1)
+        assert [f.result() for f in fs] == [num * 2 for num in range(10)]
+        try:
+            f_neg.result()
+        except ValueError as ex:
+            print('Correctly got exception = {}'.format(repr(ex)))
+        else:
+            raise AssertionError('should have gotten an exception')
+        sizes = executor.post('sizes').result()
+        print('sizes = {!r}'.format(sizes))
+        # Eleven numbers plus the batch holding the "sizes" query itself
+        assert sum(sizes) == 12
+        assert max(sizes) <= ActorClass.max_batch_size
+        assert max(sizes) > 1, 'messages should have been batched'
+        # Many rounds of batches must not exhaust the pipeline window
+        fs = [executor.post(num) for num in range(200)]
+        assert [f.result() for f in fs] == [num * 2 for num in range(200)]
+        for num in range(20):
+            executor.tell(num)
+        executor.tell(-1)
+        assert executor.post(3).result() == 6
+        if hasattr(executor, '_channel'):
+            assert executor._channel.n_inflight == 0
+
+
+def test_shm_transport():
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> import sys
+        >>> if sys.version_info[0:2] >= (3, 8):
+        >>>     test_shm_transport()
+    """
+    import os
+    import pickle
+    def list_segments():
+        if not os.path.exists('/dev/shm'):
+            return set()
+        return set(os.listdir('/dev/shm'))
+
+    before = list_segments()
+    big = b'x' * (1 << 20)
+    with TestEchoProcessActor.executor(_shm_threshold=1 << 16) as executor:
+        f1 = executor.post(pickle.PickleBuffer(bytearray(big)))
+        f2 = executor.post({'small': pickle.PickleBuffer(b'small'),
+                            'big': big})
+        f3 = executor.post_many([pickle.PickleBuffer(big)] * 3)
+        # The actor unlinks the segments of told messages
+        executor.tell(pickle.PickleBuffer(big))
+        # Large buffers travel both ways through shared memory
+        assert bytes(f1.result()) == big
+        result = f2.result()
+        assert bytes(result['small']) == b'small'
+        assert result['big'] == big
+        assert all(bytes(f.result()) == big for f in f3)
+        del result, f1, f2, f3
+    leaked = list_segments() - before
+    assert not leaked, 'segments were not reclaimed: {}'.format(leaked)
+
+
+def test_serializer(name, compression=None):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_serializer('pickle')
+        >>> test_serializer('bytes', 'zlib')
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> import sys
+        >>> if sys.version_info.major >= 3:
+        >>>     test_serializer('pickle', 'lzma')
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> try:
+        >>>     import cloudpickle  # NOQA
+        >>> except ImportError:
+        >>>     pass
+        >>> else:
+        >>>     test_serializer('cloudpickle')
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> try:
+        >>>     import msgpack  # NOQA
+        >>> except ImportError:
+        >>>     pass
+        >>> else:
+        >>>     test_serializer('msgpack', 'zlib')
+    """
+    big = b'x' * (1 << 17)
+    messages = [b'bytes', big, {'key': [1, 2.5, 'three']}, None,
+                futures_actors.ActorRef]
+    with TestEchoProcessActor.executor(
+            _serializer=name, _compression=compression) as executor:
+        codec = executor._codec
+        if compression is not None:
+            # Large messages are compressed
+            assert len(codec.dumps(big).data) < len(big) // 10
+        assert codec.loads(codec.dumps(big)) == big
+        fs = [executor.post(m) for m in messages]
+        fs += executor.post_many(messages)
+        executor.tell(big)
+        assert [f.result() for f in fs] == messages * 2
+        f = executor.post(lambda x: x + 1)
+        if name == 'cloudpickle':
+            assert f.result()(1) == 2
+        else:
+            assert isinstance(f.exception(), Exception)
+    with TestBatchProcessActor.executor(_serializer=name) as executor:
+        fs = executor.post_many(range(5))
+        assert [f.result() for f in fs] == [0, 2, 4, 6, 8]
+
+
+def test_stats(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_stats(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_stats(TestThreadActor)
+    """
+    import tempfile
+    import time
+    with ActorClass.executor() as executor:
+        executor.post({'action': 'hello world'}).result()
+        # Nothing is collected by default
+        assert executor.stats() == {'mailbox_depth': 0, 'restarts': 0}
+
+    dpath = tempfile.mkdtemp()
+    fpath = join(dpath, 'lock')
+    hooked = []
+    executor = _blocked_executor(ActorClass, fpath, _stats=True,
+                                 _stats_hook=hooked.append,
+                                 _stats_interval=0.01)
+    hello = {'action': 'hello world'}
+    deadline = time.time() + 10
+    try:
+        fs = [executor.post(hello) for _ in range(3)]
+        executor.tell(hello)
+        while executor.stats()['inflight'] < 1:
+            assert time.time() < deadline, 'the actor is busy'
+            time.sleep(0.001)
+        stats = executor.stats()
+        print('stats = {!r}'.format(stats))
+        assert stats['mailbox_depth'] == 4
+        assert stats['posted'] == stats['handled'] + 4 + stats['inflight']
+        time.sleep(0.05)
+    finally:
+        ub.touch(fpath)
+    fs.append(executor.post({'action': 'exception'}))
+    futures.wait(fs)
+    # The actor process reports its metrics, and the hook gets them, once
+    # it is idle
+    while not hooked or hooked[-1]['handled'] < hooked[-1]['posted']:
+        assert time.time() < deadline, 'the hook should get every message'
+        time.sleep(0.001)
+    stats = executor.stats()
+    print('stats = {!r}'.format(stats))
+    assert stats == hooked[-1]
+    assert stats['mailbox_depth'] == 0
+    assert stats['inflight'] == 0
+    assert stats['failed'] == 1
+    assert stats['handle_time']['count'] == stats['handled']
+    assert stats['queue_wait']['count'] == stats['handled']
+    # The messages waited while the actor was blocked
+    assert stats['queue_wait']['max'] >= 0.05
+    assert stats['queue_wait']['p99'] <= stats['queue_wait']['max']
+    assert sum(c for _, c in stats['queue_wait']['buckets']) == (
+        stats['handled'])
+    if hasattr(executor, '_channel'):
+        assert stats['bytes_sent'] > 0 and stats['bytes_received'] > 0
+    executor.shutdown(wait=True)
+    ub.delete(dpath)
+
+
+def test_tracing(ActorClass, BatchClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_tracing(TestProcessActor, TestBatchProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_tracing(TestThreadActor, TestBatchThreadActor)
+    """
+    import json
+    import tempfile
+    from futures_actors import tracing
+    traces = []
+    hello = {'action': 'hello world'}
+    with ActorClass.executor(_trace=traces.append) as executor:
+        fs = [executor.post(hello), executor.post({'action': 'exception'})]
+        fs += executor.post_many([hello] * 3)
+        # Told messages are not traced
+        executor.tell(hello)
+        futures.wait(fs)
+    assert len(traces) == 5
+    process = issubclass(ActorClass, futures_actors.ProcessActor)
+    if process:
+        assert sorted(t.work_id for t in traces) == list(range(5))
+        stages = list(tracing.STAGES)
+    else:
+        stages = ['post', 'dequeue', 'start', 'end', 'resolve']
+    for trace in traces:
+        print('trace = {!r}'.format(trace))
+        assert trace.actor == ActorClass.__name__
+        assert sorted(trace.timestamps) == sorted(stages)
+        # The actor process shares the clock of its parent
+        times = [trace.timestamps[stage] for stage in stages]
+        assert times == sorted(times)
+        steps = [step for step, _ in trace.durations()]
+        if process:
+            assert steps == ['mailbox', 'queue', 'decode', 'handle',
+                             'return', 'resolve']
+        else:
+            assert steps == ['queue', 'decode', 'handle', 'resolve']
+
+    dpath = tempfile.mkdtemp()
+    fpath = join(dpath, 'trace.json')
+    with BatchClass.executor(_trace=fpath) as executor:
+        fs = [executor.post(num) for num in range(6)]
+        futures.wait(fs)
+    executor.shutdown(wait=True)
+    with open(fpath) as file:
+        events = json.load(file)['traceEvents']
+    messages = [e for e in events if e['name'] == 'message']
+    # Every message begins and ends, and so do its steps
+    assert len(messages) == 12
+    assert len(events) == 12 + 2 * len(stages[1:]) * 6
+    assert {e['cat'] for e in events} == {BatchClass.__name__}
+    ub.delete(dpath)
+
+
+def test_pool(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_pool(TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_pool(TestThreadActor)
+    """
+    import shutil
+    cache_dpath = ub.ensure_app_cache_dir('futures_actors', 'tests')
+    shutil.rmtree(cache_dpath)
+    ub.ensuredir(cache_dpath)
+    fpath = join(cache_dpath, 'lock_pool')
+
+    # least_loaded routing avoids the replica that is busy
+    with ActorClass.pool(_n_actors=2) as pool:
+        assert len(pool) == 2
+        f1 = pool.post({'action': 'lockfile', 'num': 1, 'fpath': fpath})
+        f2 = pool.post({'action': 'hello world'})
+        assert f2.result() == 'hello world'
+        assert not f1.done(), 'should still be blocked'
+        ub.touch(fpath)
+        assert f1.result() == 1
+    shutil.rmtree(cache_dpath)
+
+    # key routing sends the messages of a key to the same stateful replica
+    with ActorClass.pool(_n_actors=3, _routing='key') as pool:
+        keys = ['a', 'b', 'c', 'd']
+        fs = pool.post_many([{'action': 'start'}] * len(keys), keys=keys)
+        assert [f.result() for f in fs] == ['started'] * len(keys)
+        for key in keys:
+            assert pool.post({'action': 'add'}, key=key).result()[0] == 'added'
+
+    with ActorClass.pool(8, factor=2, _n_actors=2,
+                         _routing='round_robin') as pool:
+        fs = [pool.post({'action': 'add'}) for _ in range(4)]
+        results = sorted(f.result()[1] for f in fs)
+        assert results == [1016, 1016, 2016, 2016]
+
+    # Posts waiting for room in the bounded mailbox of a replica must not
+    # keep the replies of the pool from being delivered
+    import threading
+    with ActorClass.pool(_n_actors=1, _mailbox_size=1) as pool:
+        fs = []
+        poster = threading.Thread(target=lambda: fs.extend(
+            [pool.post({'action': 'hello world'}) for _ in range(20)] +
+            pool.post_many([{'action': 'hello world'}] * 5)))
+        poster.daemon = True
+        poster.start()
+        poster.join(timeout=10)
+        assert not poster.is_alive(), 'posting to the pool deadlocked'
+        assert len([f.result(timeout=10) for f in fs]) == 25
+
+
+def test_sharded(ActorClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_sharded(TestCounterProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_sharded(TestCounterThreadActor)
+    """
+    keys = ['key{}'.format(i) for i in range(50)]
+    executor = futures_actors.ShardedActorExecutor(ActorClass, _n_shards=3)
+    try:
+        fs = executor.post_many(keys, keys=keys)
+        assert [f.result() for f in fs] == [1] * len(keys)
+        before = {key: executor.shard_for(key) for key in keys}
+
+        # Growing moves only the keys that now belong to the new shard
+        executor.resize(4)
+        assert len(executor) == 4
+        moved = [key for key in keys if executor.shard_for(key) != before[key]]
+        assert all(executor.shard_for(key) == 3 for key in moved)
+        fs = [executor.post(key, key=key) for key in keys]
+        assert [f.result() for f in fs] == [2] * len(keys)
+
+        # Shrinking hands the state of the removed shards to the others
+        executor.resize(2)
+        assert len(executor) == 2
+        fs = [executor.post(key, key=key) for key in keys]
+        assert [f.result() for f in fs] == [3] * len(keys)
+    finally:
+        executor.shutdown(wait=True)
+
+    if ActorClass is TestCounterThreadActor:
+        # A shard with a full mailbox does not keep the others from posting
+        import tempfile
+        import threading
+        dpath = tempfile.mkdtemp()
+        fpath = join(dpath, 'lock')
+        executor = futures_actors.ShardedActorExecutor(
+            TestThreadActor, _n_shards=2, _mailbox_size=1)
+        try:
+            by_shard = {executor.shard_for(key): key for key in keys}
+            blocked, free = by_shard[0], by_shard[1]
+            executor.post({'action': 'lockfile', 'num': 1, 'fpath': fpath},
+                          key=blocked)
+            posters = [threading.Thread(target=executor.post, args=(
+                {'action': 'hello world'},), kwargs={'key': blocked})
+                for _ in range(3)]
+            for poster in posters:
+                poster.daemon = True
+                poster.start()
+            fs = []
+            poster = threading.Thread(target=lambda: fs.append(executor.post(
+                {'action': 'hello world'}, key=free).result()))
+            poster.daemon = True
+            poster.start()
+            poster.join(timeout=10)
+            assert fs == ['hello world'], 'the free shard should answer'
+        finally:
+            ub.touch(fpath)
+            executor.shutdown(wait=True)
+            ub.delete(dpath)
+
+    # The state migration bypasses the caches of the shards
+    executor = futures_actors.ShardedActorExecutor(
+        ActorClass, _n_shards=2, _cache_key=str.upper, _cache_size=0)
+    try:
+        fs = executor.post_many(keys, keys=keys)
+        assert [f.result() for f in fs] == [1] * len(keys)
+        executor.resize(3)
+        fs = [executor.post(key, key=key) for key in keys]
+        assert [f.result() for f in fs] == [2] * len(keys)
+    finally:
+        executor.shutdown(wait=True)
+
+    # The state migration is not keyed by the mailboxes of the shards
+    executor = futures_actors.ShardedActorExecutor(
+        ActorClass, _n_shards=2, _overflow='coalesce', _coalesce_key=str.upper)
+    try:
+        fs = executor.post_many(keys, keys=keys)
+        assert [f.result() for f in fs] == [1] * len(keys)
+        executor.resize(3)
+        assert executor.post(keys[0], key=keys[0]).result() == 2
+    finally:
+        executor.shutdown(wait=True)
+
+
+def test_mp_context(method, preload=None):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> import sys
+        >>> if sys.version_info.major >= 3:
+        >>>     test_mp_context('spawn')
+        >>>     test_mp_context('forkserver', ['colorsys'])
+        >>>     test_mp_context('fork', ['colorsys'])
+    """
+    from futures_actors import contexts
+    supervisor = futures_actors.Supervisor(max_restarts=1)
+    try:
+        executor = supervisor.spawn(TestProcessActor, a=1, _mp_context=method,
+                                    _preload=preload)
+        process = executor._channel.actor_process.process
+        assert process._start_method == method
+        # Unless an earlier test started the fork server without colorsys
+        preloaded = preload is not None and (
+            method == 'fork' or 'colorsys' in contexts._preloaded)
+        imported = executor.post({'action': 'imported', 'module': 'colorsys'})
+        assert imported.result() == preloaded
+        # Restarts use the same start method
+        executor.post({'action': 'crash'}).exception()
+        _post_until_restarted(executor, {'action': 'hello world'})
+        process = executor._channel.actor_process.process
+        assert process._start_method == method
+        assert executor.post({'action': 'add'}).result() == ('added', 1001)
+    finally:
+        supervisor.shutdown(wait=True)
+
+
+def test_reservoir():
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> import sys
+        >>> if sys.version_info.major >= 3:
+        >>>     test_reservoir()
+    """
+    import time
+    reservoir = futures_actors.WorkerReservoir(size=1, max_size=2,
+                                               max_idle=0.2)
+    try:
+        executor = TestProcessActor.executor(a=1, _reservoir=reservoir)
+        pid = executor._channel.actor_process.process.pid
+        assert executor.post({'action': 'add'}).result() == ('added', 1001)
+        ref = executor.ref()
+        assert ref.post({'action': 'hello world'}).result() == 'hello world'
+        executor.shutdown(wait=True)
+
+        # The worker runs the next actor, which starts from a fresh instance
+        executor = TestProcessActor.executor(_reservoir=reservoir)
+        try:
+            executor.post({'action': 'add'}).result()
+        except KeyError:
+            pass
+        else:
+            raise AssertionError('the actor should be a new instance')
+        assert executor._channel.actor_process.process.pid == pid
+        assert executor.post({'action': 'start'}).result() == 'started'
+        assert executor.ref().post({'action': 'add'}).result() == (
+            'added', 1003)
+        executor.shutdown(wait=True)
+
+        # Workers beyond `size` are stopped once idle for too long
+        deadline = time.time() + 10
+        while reservoir.idle() != 1:
+            assert time.time() < deadline, 'idle workers should be evicted'
+            time.sleep(0.01)
+
+        # A crashed worker is not reused
+        executor = TestProcessActor.executor(a=1, _reservoir=reservoir)
+        pid = executor._channel.actor_process.process.pid
+        executor.post({'action': 'crash'}).exception()
+        executor = TestProcessActor.executor(_reservoir=reservoir)
+        assert executor.post({'action': 'start'}).result() == 'started'
+        assert executor._channel.actor_process.process.pid != pid
+        executor.shutdown(wait=True)
+    finally:
+        reservoir.close()
+
+
+def test_checkpoint():
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_checkpoint()
+    """
+    import shutil
+    import tempfile
+    import time
+    from futures_actors import checkpoint
+    dpath = tempfile.mkdtemp()
+    fpath = join(dpath, 'actor.ckpt')
+    supervisor = futures_actors.Supervisor(max_restarts=1)
+    try:
+        executor = supervisor.spawn(TestCheckpointActor, _checkpoint=fpath,
+                                    _checkpoint_interval=0.01)
+        assert executor.post(b'ab').result() == b'ab'
+        assert executor.post(b'cd').result() == b'abcd'
+        deadline = time.time() + 10
+        while not (exists(fpath) and
+                   bytes(checkpoint.load(fpath)['buffer']) == b'abcd'):
+            assert time.time() < deadline, 'a checkpoint should be written'
+            time.sleep(0.01)
+
+        # The restarted actor resumes from the checkpoint
+        executor.post('crash').exception()
+        assert _post_until_restarted(executor, b'ef') == b'abcdef'
+        # The last checkpoint is written when the actor stops
+        executor.shutdown(wait=True)
+        assert bytes(checkpoint.load(fpath)['buffer']) == b'abcdef'
+
+        # A new executor picks up where the old one stopped
+        with TestCheckpointActor.executor(_checkpoint=fpath) as executor:
+            assert executor.post(b'gh').result() == b'abcdefgh'
+
+        try:
+            TestProcessActor.executor(_checkpoint=fpath)
+        except TypeError:
+            pass
+        else:
+            raise AssertionError('the actor cannot be checkpointed')
+    finally:
+        supervisor.shutdown(wait=True)
+        shutil.rmtree(dpath)
+
+
+def test_journal():
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_journal()
+    """
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+    dpath = tempfile.mkdtemp()
+    jpath = join(dpath, 'journal')
+    fpath = join(dpath, 'lockfile')
+    BrokenProcessPool = futures_actors.process_actor.BrokenProcessPool
+    supervisor = futures_actors.Supervisor(max_restarts=3)
+    try:
+        # Answered messages leave nothing behind
+        with TestProcessActor.executor(_journal=jpath) as executor:
+            fs = executor.post_many([{'action': 'hello world'}] * 3)
+            executor.tell({'action': 'start'})
+            assert executor.post({'action': 'add'}).result() == (
+                'added', 1003)
+            assert [f.result() for f in fs] == ['hello world'] * 3
+            assert executor.recovered == []
+        assert os.listdir(jpath) == ['lock']
+
+        # Messages in flight when the actor crashes are sent again, until
+        # they crashed too many actors
+        executor = supervisor.spawn(TestProcessActor, _journal=jpath)
+        fs = [executor.post({'action': 'crash'})]
+        fs += [executor.post({'action': 'hello world'}) for _ in range(3)]
+        assert isinstance(fs[0].exception(), BrokenProcessPool)
+        assert [f.result() for f in fs[1:]] == ['hello world'] * 3
+        assert executor.stats()['restarts'] == 3
+        executor.shutdown(wait=True)
+
+        # A process dies with messages waiting for the actor, the next
+        # executor of the journal posts them again
+        code = '\n'.join([
+            'import os',
+            'from futures_actors.tests import TestProcessActor',
+            'executor = TestProcessActor.executor(_journal={!r})'.format(
+                jpath),
+            'for i in range(3):',
+            '    executor.post({"action": "lockfile", "num": i,',
+            '                   "fpath": {!r}}})'.format(fpath),
+            'os._exit(0)'])
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(
+            os.path.dirname(futures_actors.__file__)))
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        executor = TestProcessActor.executor(_journal=jpath)
+        try:
+            TestProcessActor.executor(_journal=jpath)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('the journal is already used')
+        assert len(executor.recovered) == 3
+        open(fpath, 'w').close()
+        assert [f.result() for f in executor.recovered] == [0, 1, 2]
+        executor.shutdown(wait=True)
+        assert os.listdir(jpath) == ['lock']
+    finally:
+        supervisor.shutdown(wait=True)
+        open(fpath, 'w').close()
+        shutil.rmtree(dpath)
+
+
+def test_shared_dispatcher():
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_shared_dispatcher()
+    """
+    import threading
+    executors = [TestProcessActor.executor() for _ in range(8)]
+    try:
+        n_threads = threading.active_count()
+        fs = [executor.post({'action': 'hello world'})
+              for executor in executors]
+        assert [f.result() for f in fs] == ['hello world'] * len(executors)
+        # All actors share one dispatcher thread, which may already exist
+        assert threading.active_count() <= n_threads + 1
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+
+def test_actor_ref(ActorClass, TargetClass):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_actor_ref(TestProcessActor, TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_actor_ref(TestThreadActor, TestProcessActor)
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_actor_ref(TestThreadActor, TestThreadActor)
+    """
+    import pickle
+    with ActorClass.executor() as executor, \
+            TargetClass.executor() as target:
+        ref = target.ref()
+        if issubclass(TargetClass, futures_actors.ProcessActor):
+            # Unpickled in the owning process it posts to the executor again
+            assert pickle.loads(pickle.dumps(ref)) == ref
+        else:
+            try:
+                pickle.dumps(ref)
+            except TypeError:
+                pass
+            else:
+                raise AssertionError('thread actor refs must not be pickled')
+        f = executor.post({'action': 'forward', 'ref': ref,
+                           'message': {'action': 'start'}})
+        assert f.result() == 'started'
+        # Told messages go through the same connection as posted ones
+        f = executor.post({'action': 'forward', 'ref': ref,
+                           'tell': [{'action': 'add'}],
+                           'message': {'action': 'add'}})
+        assert f.result() == ('added', 2003)
+        # The state lives in the target actor
+        assert target.post({'action': 'add'}).result() == ('added', 3003)
+        f = executor.post({'action': 'forward', 'ref': ref,
+                           'message': {'action': 'exception'}})
+        try:
+            f.result()
+        except Exception as ex:
+            print('Correctly got exception = {}'.format(repr(ex)))
+        else:
+            raise AssertionError('should have gotten an exception')
+
+
+def _post_until_restarted(ref, message, timeout=10.0):
+    """
+    Posts a message to a crashed actor until its restarted process answers
+    """
+    import time
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return ref.post(message).result()
+        except futures_actors.process_actor.BrokenProcessPool:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def test_supervisor(strategy):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_supervisor('one_for_one')
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_supervisor('one_for_all')
+    """
+    supervisor = futures_actors.Supervisor(strategy=strategy, max_restarts=2,
+                                           max_seconds=60)
+    try:
+        crasher = supervisor.spawn(TestProcessActor)
+        sibling = supervisor.spawn(TestProcessActor)
+        assert sibling.post({'action': 'start'}).result() == 'started'
+        # Children that were shut down are forgotten
+        for ActorClass in [TestProcessActor, TestThreadActor]:
+            supervisor.spawn(ActorClass).shutdown(wait=True)
+        assert supervisor.children == [crasher, sibling]
+
+        fs = [crasher.post({'action': 'crash'})]
+        fs += [crasher.post({'action': 'hello world'}) for _ in range(5)]
+        try:
+            fs[0].result()
+        except futures_actors.process_actor.BrokenProcessPool as ex:
+            print('Correctly got exception = {}'.format(repr(ex)))
+        else:
+            raise AssertionError('should have gotten an exception')
+        # Messages that were not dispatched yet are replayed
+        assert fs[-1].result() == 'hello world'
+        assert crasher.stats()['restarts'] == 1
+
+        if strategy == 'one_for_all':
+            # The sibling was restarted too and lost its state
+            try:
+                _post_until_restarted(sibling, {'action': 'add'})
+            except KeyError:
+                pass
+            else:
+                raise AssertionError('the sibling should have been restarted')
+        else:
+            assert sibling.post({'action': 'add'}).result() == ('added', 1003)
+
+        # Too many restarts make the supervisor give up
+        crasher.post({'action': 'crash'}).exception()
+        _post_until_restarted(crasher, {'action': 'hello world'})
+        crasher.post({'action': 'crash'}).exception()
+        import time
+        deadline = time.time() + 10
+        while not (crasher._broken and sibling._broken):
+            assert time.time() < deadline, 'children should be broken'
+            time.sleep(0.01)
+        assert supervisor.failed
+        # And forget its children, which are not restarted anymore
+        while supervisor.children:
+            assert time.time() < deadline, 'children should be forgotten'
+            time.sleep(0.01)
+    finally:
+        supervisor.shutdown(wait=True)
+
+
+def test_spawn():
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> test_spawn()
+    """
+    with TestProcessActor.executor() as executor:
+        # The child lives in a process started by the actor's process
+        ref = executor.post({'action': 'spawn'}).result()
+        assert ref.post({'action': 'start'}).result() == 'started'
+        assert ref.post({'action': 'add'}).result() == ('added', 1003)
+        assert ref.post({'action': 'crash'}).exception() is not None
+        # The actor supervises its child, which comes back at the same address
+        assert _post_until_restarted(ref, {'action': 'start'}) == 'started'
+    # Stopping the actor stops its children too
+    try:
+        exception = ref.post({'action': 'hello world'}).exception(timeout=10)
+    except futures_actors.process_actor.BrokenProcessPool as ex:
+        exception = ex
+    assert isinstance(exception,
+                      futures_actors.process_actor.BrokenProcessPool)
+
+
+def test_async_actor(ActorClassName):
+    """
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> if sys.version_info[0:2] >= (3, 7):
+        >>>     test_async_actor('TestAsyncProcessActor')
+
+    Example:
+        >>> from futures_actors.tests import *  # NOQA
+        >>> if sys.version_info[0:2] >= (3, 7):
+        >>>     test_async_actor('TestAsyncActor')
+    """
+    import asyncio
+    ActorClass = globals()[ActorClassName]
+    try:
+        ActorClass.executor()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError('the loop is required outside of a coroutine')
+    loop = asyncio.new_event_loop()
+    try:
+        executor = ActorClass.executor(_loop=loop)
+        f1 = executor.apost({'action': 'start'})
+        f2 = executor.apost({'action': 'add'})
+        f3 = executor.apost({'action': 'exception'})
+        assert loop.run_until_complete(f1) == 'started'
+        assert loop.run_until_complete(f2) == ('added', 1003)
+        try:
+            loop.run_until_complete(f3)
+        except Exception as ex:
+            print('Correctly got exception = {}'.format(repr(ex)))
+        else:
+            raise AssertionError('should have gotten an exception')
+
+        # Thread-safe posting returns concurrent futures
+        cf = executor.post({'action': 'add'})
+        loop.run_until_complete(asyncio.wrap_future(cf, loop=loop))
+        assert cf.result() == ('added', 2003)
+
+        loop.run_until_complete(executor.ashutdown())
+        try:
+            executor.apost({'action': 'add'})
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('should not post after shutdown')
+
+        executor = ActorClass.executor(_loop=loop)
+        assert loop.run_until_complete(
+            executor.apost({'action': 'hello world'})) == 'hello world'
+        if ActorClassName == 'TestAsyncProcessActor':
+            # The idle actor process dies
+            import os
+            import signal
+            os.kill(executor._manager.process.pid, signal.SIGKILL)
+            loop.run_until_complete(asyncio.wrap_future(executor._closed,
+                                                        loop=loop))
+            try:
+                executor.apost({'action': 'hello world'})
+            except futures_actors.process_actor.BrokenProcessPool:
+                pass
+            else:
+                raise AssertionError('the executor should be broken')
+        else:
+            # A handler raising a BaseException ends the actor
+            f1 = executor.apost({'action': 'raise',
+                                 'exception': asyncio.CancelledError()})
+            f2 = executor.apost({'action': 'hello world'})
+            for f in [f1, f2]:
+                try:
+                    loop.run_until_complete(f)
+                except asyncio.CancelledError:
+                    pass
+                else:
+                    raise AssertionError('should have been failed')
+            loop.run_until_complete(executor.ashutdown())
+    finally:
+        loop.close()
+
+
 def test_actor_args(ActorClass):
     """
     Example:
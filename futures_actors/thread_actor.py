@@ -2,9 +2,17 @@
 from concurrent.futures import _base
 from concurrent.futures import thread
 from futures_actors import _base_actor
+from futures_actors import cache
+from futures_actors import cancellation
+from futures_actors import mailbox
+from futures_actors import metrics as metrics_module
+from futures_actors import streams
+from futures_actors import tracing
+import functools
+import sys
 import threading
+import time
 import weakref
-import sys
 if sys.version_info.major >= 3:
     import queue
 else:
@@ -20,12 +28,115 @@ __author__ = 'Jon Crall (erotemic@gmail.com)'
 
 
 class _WorkItem(object):
-    def __init__(self, future, message):
+    # When the message was posted, only set if the executor collects metrics
+    posted_at = None
+    # The tracing.MessageTrace of the message, if the executor traces them
+    trace = None
+    # The streams.Stream the chunks are put in, for a streamed message
+    stream = None
+
+    def __init__(self, future, message, priority=0):
         self.future = future
         self.message = message
+        self.priority = priority
+
+
+def _run_work_item(actor, work_item, mailbox=None, metrics=None,
+                   cancel_scope=None):
+    trace = work_item.trace
+    if trace is not None:
+        trace.stamp('dequeue')
+    if mailbox is not None and not mailbox.take(work_item):
+        # Dropped to make room in the mailbox
+        return
+    if work_item.future is None:
+        # A told message, nobody wants its result
+        try:
+            _dispatch(actor, work_item, metrics)
+        except BaseException:
+            pass
+        return
+    if cancel_scope is not None:
+        # Before the Future runs, so its cancellation is always seen
+        cancel_scope.start(work_item)
+    if work_item.future.set_running_or_notify_cancel():
+        # Send the message to the actor
+        try:
+            result = _dispatch(actor, work_item, metrics)
+        except BaseException as e:
+            if not work_item.future.cancelled():
+                work_item.future.set_exception(e)
+            # Delete references to object.
+            del e
+        else:
+            if not work_item.future.cancelled():
+                work_item.future.set_result(result)
+        if trace is not None:
+            trace.finish()
+    if cancel_scope is not None:
+        cancel_scope.finish()
 
 
-def _thread_actor_eventloop(executor_reference, work_queue, _ActorClass, *args,
+def _dispatch(actor, work_item, metrics=None):
+    trace = work_item.trace
+    if trace is not None:
+        trace.stamp('start')
+    try:
+        # Waits for the caller whenever the window of a stream is full
+        send_chunk = None
+        if work_item.stream is not None:
+            send_chunk = work_item.stream._offer
+        if metrics is None:
+            result = _base_actor._dispatch(actor, work_item.message)
+            if send_chunk is not None:
+                result = streams._run_generator(result, send_chunk)
+            return result
+        return metrics_module._timed_dispatch(
+            metrics, actor, work_item.message, work_item.posted_at,
+            send_chunk)
+    finally:
+        if trace is not None:
+            trace.stamp('end')
+
+
+def _run_work_batch(actor, work_items, mailbox=None, metrics=None):
+    """
+    Sends a gathered batch of work items to `actor.handle_batch`
+    """
+    for w in work_items:
+        if w.trace is not None:
+            w.trace.stamp('dequeue')
+    if mailbox is not None:
+        work_items = [w for w in work_items if mailbox.take(w)]
+    work_items = [w for w in work_items if w.future is None or
+                  w.future.set_running_or_notify_cancel()]
+    if not work_items:
+        return
+    traces = [w.trace for w in work_items if w.trace is not None]
+    for trace in traces:
+        trace.stamp('start')
+    messages = [w.message for w in work_items]
+    if metrics is None:
+        outcomes = _base_actor._call_handle_batch(actor, messages)
+    else:
+        outcomes = metrics_module._timed_handle_batch(
+            metrics, actor, messages, [w.posted_at for w in work_items])
+    del messages
+    for trace in traces:
+        trace.stamp('end')
+    for work_item, (exc, result) in zip(work_items, outcomes):
+        if work_item.future is None or work_item.future.cancelled():
+            continue
+        elif exc is not None:
+            work_item.future.set_exception(exc)
+        else:
+            work_item.future.set_result(result)
+    for trace in traces:
+        trace.finish()
+
+
+def _thread_actor_eventloop(executor_reference, work_queue, mailbox, metrics,
+                            tracer, cancel_scope, _ActorClass, *args,
                             **kwargs):
     """
     actor event loop run in a separate thread.
@@ -34,22 +145,58 @@ def _thread_actor_eventloop(executor_reference, work_queue, _ActorClass, *args,
     **kwargs). Then the eventloop starts and feeds the actor messages from the
     _call_queue. Results are placed in the _result_queue, which are then placed
     in Future objects.
+
+    If the actor defines `handle_batch`, all queued work items are gathered
+    and handled together.
+
+    If the executor has a bounded mailbox, work items are taken out of it
+    before they are handled, and the ones it dropped are skipped.
+
+    If the executor collects metrics, the handling of each message is
+    recorded in `metrics`, and its stats hook is called from here. If it
+    traces messages, `tracer` is flushed when the actor stops. If its Futures
+    can be cancelled while they run, `cancel_scope` holds the cancelled
+    messages.
     """
     try:
         actor = _ActorClass(*args, **kwargs)
+        if cancel_scope is not None:
+            actor._cancel_scope = cancel_scope
+        batching = _base_actor._supports_batching(actor)
         while True:
-            work_item = work_queue.get(block=True)
-            if work_item is not None:
-                if work_item.future.set_running_or_notify_cancel():
-                    # Send the message to the actor
-                    try:
-                        result = actor.handle(work_item.message)
-                    except BaseException as e:
-                        work_item.future.set_exception(e)
-                        # Delete references to object.
-                        del e
-                    else:
-                        work_item.future.set_result(result)
+            timeout = None
+            if metrics is not None:
+                timeout = metrics.hook_timeout()
+                if timeout is not None and timeout <= 0:
+                    executor = executor_reference()
+                    if executor is not None:
+                        metrics.call_hook(executor.stats())
+                    del executor
+                    timeout = None
+            try:
+                work_item = work_queue.get(block=True, timeout=timeout)
+            except queue.Empty:
+                # Time to call the stats hook
+                continue
+            if batching and work_item is not None:
+                work_items, got_sentinel = _base_actor._gather_batch(
+                    work_queue, work_item, actor.max_batch_size,
+                    actor.batch_linger)
+                _run_work_batch(actor, work_items, mailbox, metrics)
+                del work_items
+                del work_item
+                if not got_sentinel:
+                    continue
+            elif isinstance(work_item, list):
+                # A batch of work items posted with `post_many`
+                for batch_work_item in work_item:
+                    _run_work_item(actor, batch_work_item, mailbox, metrics,
+                                   cancel_scope)
+                del work_item
+                continue
+            elif work_item is not None:
+                _run_work_item(actor, work_item, mailbox, metrics,
+                               cancel_scope)
                 # Delete references to object. See issue16284
                 del work_item
                 continue
@@ -59,6 +206,9 @@ def _thread_actor_eventloop(executor_reference, work_queue, _ActorClass, *args,
             #   - The executor that owns the worker has been collected OR
             #   - The executor that owns the worker has been shutdown.
             if thread._shutdown or executor is None or executor._shutdown:
+                _base_actor._stop_children(actor)
+                if tracer is not None:
+                    tracer.flush()
                 # Notice other workers
                 work_queue.put(None)
                 return
@@ -72,7 +222,18 @@ class ThreadActorExecutor(_base_actor.ActorExecutor):
         """Initializes a new ThreadPoolExecutor instance.
         """
         self._ActorClass = _ActorClass
-        self._work_queue = queue.Queue()
+        self._mailbox = mailbox._pop_mailbox_options(kwargs)
+        self._metrics = metrics_module._pop_stats_options(kwargs)
+        self._tracer = tracing._pop_trace_options(kwargs, _ActorClass)
+        self._cache = cache._pop_cache_options(kwargs)
+        cancellable, cancel_timeout = cancellation._pop_cancel_options(kwargs)
+        if cancel_timeout is not None:
+            raise ValueError('the thread of a ThreadActor cannot be killed, '
+                             'use _cancellable instead of _cancel_timeout')
+        self._cancel_scope = None
+        if cancellable:
+            self._cancel_scope = cancellation._CancelScope()
+        self._work_queue = mailbox._PriorityQueue()
         self._threads = set()
         self._shutdown = False
         self._shutdown_lock = threading.Lock()
@@ -83,18 +244,92 @@ class ThreadActorExecutor(_base_actor.ActorExecutor):
             # immediately. Otherwise just wait until we get a message
             self._initialize_actor(*args, **kwargs)
 
-    def post(self, message):
+    def post(self, message, timeout=None, priority=0):
+        if self._cache is not None:
+            return self._cache.post(message, self._post, timeout, priority)
+        return self._post(message, timeout, priority)
+    post.__doc__ = _base_actor.ActorExecutor.post.__doc__
+
+    def _post(self, message, timeout=None, priority=0, stream=None):
+        f = self._future() if stream is None else stream.future
+        w = _WorkItem(f, message, priority)
+        w.stream = stream
+        if stream is None and self._cancel_scope is not None:
+            f._cancel_running = functools.partial(self._cancel_scope.cancel, w)
+        if self._metrics is not None:
+            w.posted_at = time.time()
+        if self._tracer is not None:
+            w.trace = self._tracer.new_trace()
+        if self._mailbox is not None:
+            queued = self._mailbox.admit(w, timeout)
+            if queued is None:
+                f.cancel()
+                return f
+            elif queued is not w:
+                return queued.future
+        self._put(w)
+        return f
+
+    def stream(self, message, window=streams.DEFAULT_WINDOW, timeout=None,
+               priority=0):
+        streams._check_streamable(self._ActorClass, self._mailbox)
+        stream = streams.Stream(_base.Future(), window)
+        self._post(message, timeout, priority, stream)
+        return stream
+    stream.__doc__ = _base_actor.ActorExecutor.stream.__doc__
+
+    def tell(self, message, timeout=None, priority=0):
+        w = _WorkItem(None, message, priority)
+        if self._metrics is not None:
+            w.posted_at = time.time()
+        if self._mailbox is not None:
+            if self._mailbox.admit(w, timeout) is not w:
+                return
+        self._put(w)
+    tell.__doc__ = _base_actor.ActorExecutor.tell.__doc__
+
+    def _put(self, work_item):
         with self._shutdown_lock:
             if self._shutdown:
+                if self._mailbox is not None:
+                    self._mailbox.discard(work_item)
                 raise RuntimeError('cannot schedule new futures after shutdown')
 
-            f = _base.Future()
-            w = _WorkItem(f, message)
+            if self._metrics is not None:
+                self._metrics.count_posted()
+            self._work_queue.put(work_item)
+            self._initialize_actor()
 
-            self._work_queue.put(w)
+    def post_many(self, messages):
+        if self._mailbox is not None or self._cache is not None:
+            # Every message has to be admitted (or looked up) on its own
+            return [self.post(message) for message in messages]
+        with self._shutdown_lock:
+            if self._shutdown:
+                raise RuntimeError(
+                    'cannot schedule new futures after shutdown')
+
+            batch = [_WorkItem(self._future(), m) for m in messages]
+            fs = [w.future for w in batch]
+            if self._cancel_scope is not None:
+                for w in batch:
+                    w.future._cancel_running = functools.partial(
+                        self._cancel_scope.cancel, w)
+            if not batch:
+                return fs
+            if self._metrics is not None:
+                self._metrics.count_posted(len(batch))
+                posted_at = time.time()
+                for w in batch:
+                    w.posted_at = posted_at
+            if self._tracer is not None:
+                for w in batch:
+                    w.trace = self._tracer.new_trace()
+
+            self._work_queue.put(batch)
             self._initialize_actor()
-            return f
-    post.__doc__ = _base_actor.ActorExecutor.post.__doc__
+            return fs
+    post_many.__doc__ = _base_actor.ActorExecutor.post_many.__doc__
 
     def _initialize_actor(self, *args, **kwargs):
         # When the executor gets lost, the weakref callback will wake up
@@ -108,17 +343,42 @@ class ThreadActorExecutor(_base_actor.ActorExecutor):
             t = threading.Thread(
                 target=_thread_actor_eventloop,
                 args=(weakref.ref(self, weakref_cb),
-                      self._work_queue, self._ActorClass) +
+                      self._work_queue, self._mailbox, self._metrics,
+                      self._tracer, self._cancel_scope, self._ActorClass) +
                 args, kwargs=kwargs)
             t.daemon = True
             t.start()
             self._threads.add(t)
             thread._threads_queues[t] = self._work_queue
 
+    def _future(self):
+        if self._cancel_scope is None:
+            return _base.Future()
+        return cancellation._CancellableFuture()
+
+    def stats(self):
+        with self._work_queue.mutex:
+            depth = sum(len(item) if isinstance(item, list) else 1
+                        for item in self._work_queue.queue if item is not None)
+        stats = {'mailbox_depth': depth, 'restarts': 0}
+        if self._metrics is not None:
+            stats.update(self._metrics.snapshot())
+        if self._cache is not None:
+            stats.update(self._cache.stats())
+        return stats
+    stats.__doc__ = _base_actor.ActorExecutor.stats.__doc__
+
+    def ref(self):
+        from futures_actors import actor_ref
+        return actor_ref.ActorRef._for_executor(self)
+    ref.__doc__ = _base_actor.ActorExecutor.ref.__doc__
+
     def shutdown(self, wait=True):
         with self._shutdown_lock:
             self._shutdown = True
             self._work_queue.put(None)
+        if self._mailbox is not None:
+            self._mailbox.close()
         if wait:
             for t in self._threads:
                 t.join()
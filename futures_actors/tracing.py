@@ -0,0 +1,197 @@
+"""
+Per-message tracing for the actor executors.
+
+An executor created with `_trace` records when each posted message reaches
+the stages of its trip, in this order:
+
+    * 'post': `post` was called.
+    * 'send': the dispatcher sent the message to the actor process
+      (ProcessActor only).
+    * 'dequeue': the actor took the message from its queue.
+    * 'start' and 'end': `handle` (or `handle_batch`) was called and
+      returned.
+    * 'result': the executor received the result (ProcessActor only).
+    * 'resolve': the Future of the message was resolved.
+
+For a ProcessActor the timestamps travel to the actor process and back
+inside the call and result items. Once the Future is resolved, a
+`MessageTrace` is passed to `_trace`, which is either a callable or the path
+of a Chrome trace-event JSON file (open it with chrome://tracing or
+https://ui.perfetto.dev) written when the actor stops. Each message shows up
+there as a track with one span per step between two stages (see
+`MessageTrace.durations`).
+
+Told messages, messages posted through an ActorRef and messages that never
+resolve (cancelled, or lost with a crashed actor) are not traced.
+
+The callback runs on the thread of a ThreadActor, and on the dispatcher
+thread for a ProcessActor, so it should be quick. Timestamps come from
+`time.time()`, which the actor processes share with their parent.
+"""
+from concurrent.futures import _base
+import itertools
+import json
+import os
+import threading
+import time
+
+__author__ = 'Jon Crall (erotemic@gmail.com)'
+
+
+STAGES = ('post', 'send', 'dequeue', 'start', 'end', 'result', 'resolve')
+
+# Name of the step that ends at each stage
+_STEPS = {
+    'send': 'mailbox',
+    'dequeue': 'queue',
+    'start': 'decode',
+    'end': 'handle',
+    'result': 'return',
+    'resolve': 'resolve',
+}
+
+
+class MessageTrace(object):
+    """
+    The trip of one message through an executor.
+
+    Attributes:
+        actor (str): name of the actor class
+        work_id (int | None): number of the message in its executor
+        pid (int): id of the process of the actor
+        timestamps (dict): maps the stages the message reached to when it
+            reached them, in seconds since the epoch
+    """
+
+    def __init__(self, tracer, actor, work_id=None):
+        self._tracer = tracer
+        self.actor = actor
+        self.work_id = work_id
+        self.pid = os.getpid()
+        self.timestamps = {'post': time.time()}
+
+    def __repr__(self):
+        return '<MessageTrace {} #{} {}>'.format(
+            self.actor, self.work_id, self.durations())
+
+    def stamp(self, stage):
+        self.timestamps[stage] = time.time()
+
+    def finish(self):
+        """
+        Stamps the 'resolve' stage and hands the trace to the callback
+        """
+        self.stamp('resolve')
+        self._tracer.emit(self)
+
+    def durations(self):
+        """
+        Returns:
+            list: (step, seconds) pairs, one for each stage the message
+                reached after 'post', named after the step that ends there:
+                'mailbox' (waiting for a place in the pipeline window),
+                'queue' (waiting in the queue of the actor), 'decode',
+                'handle', 'return' (encoding and sending back the result) and
+                'resolve' (decoding the result and running the callbacks of
+                the Future).
+        """
+        steps = []
+        previous = None
+        for stage in STAGES:
+            timestamp = self.timestamps.get(stage, None)
+            if timestamp is None:
+                continue
+            if previous is not None:
+                steps.append((_STEPS[stage], timestamp - previous))
+            previous = timestamp
+        return steps
+
+
+class ChromeTraceWriter(object):
+    """
+    Trace callback that collects the traces as Chrome trace events and
+    writes them to `path` when `flush` is called. Executors created with
+    `_trace=path` flush it when their actor stops. One writer can be shared
+    by several executors.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._events = []
+        self._ids = itertools.count()
+
+    def __call__(self, trace):
+        stages = [(stage, trace.timestamps[stage]) for stage in STAGES
+                  if stage in trace.timestamps]
+        common = {'cat': trace.actor, 'id': next(self._ids),
+                  'pid': os.getpid(), 'tid': trace.actor}
+        events = [dict(common, name='message', ph='b',
+                       ts=stages[0][1] * 1e6,
+                       args={'work_id': trace.work_id,
+                             'actor_pid': trace.pid})]
+        for (_, begin), (stage, end) in zip(stages, stages[1:]):
+            events.append(dict(common, name=_STEPS[stage], ph='b',
+                               ts=begin * 1e6))
+            events.append(dict(common, name=_STEPS[stage], ph='e',
+                               ts=end * 1e6))
+        events.append(dict(common, name='message', ph='e',
+                           ts=stages[-1][1] * 1e6))
+        with self._lock:
+            self._events.extend(events)
+
+    def flush(self):
+        """
+        Writes every event collected so far
+        """
+        with self._lock:
+            data = {'traceEvents': list(self._events),
+                    'displayTimeUnit': 'ms'}
+        with open(self.path, 'w') as file:
+            json.dump(data, file)
+
+
+class _Tracer(object):
+    """
+    Creates the traces of the messages of one executor and passes them to
+    its callback.
+    """
+
+    def __init__(self, callback, actor):
+        self.callback = callback
+        self.actor = actor
+
+    def new_trace(self):
+        return MessageTrace(self, self.actor)
+
+    def emit(self, trace):
+        try:
+            self.callback(trace)
+        except BaseException:
+            _base.LOGGER.exception('Exception in the trace callback')
+
+    def flush(self):
+        """
+        Called when the actor stops
+        """
+        flush = getattr(self.callback, 'flush', None)
+        if flush is not None:
+            try:
+                flush()
+            except BaseException:
+                _base.LOGGER.exception('Exception while writing the trace')
+
+
+def _pop_trace_options(kwargs, _ActorClass):
+    """
+    Removes the tracing option from the keyword arguments of an executor.
+
+    Returns:
+        _Tracer | None: None if the messages are not traced
+    """
+    callback = kwargs.pop('_trace', None)
+    if callback is None:
+        return None
+    if not callable(callback):
+        callback = ChromeTraceWriter(callback)
+    return _Tracer(callback, _ActorClass.__name__)